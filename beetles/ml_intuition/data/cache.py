@@ -0,0 +1,137 @@
+"""
+Content-addressed on-disk cache of the prepared datasets.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ml_intuition.data import io
+from ml_intuition.data.stats import StatsAccumulator
+
+CACHE_VERSION = 1
+CACHE_EXTENSION = '.h5'
+GB = 2 ** 30
+
+
+def file_fingerprint(file_path: str) -> Dict:
+    """
+    Fingerprint of the file based on its absolute path, size and modification
+    time, so any change of the input invalidates the cached entries.
+
+    :param file_path: Path to the file.
+    :return: Dictionary with the fingerprint of the file.
+    """
+    stat = os.stat(file_path)
+    return {'path': os.path.abspath(file_path), 'size': stat.st_size,
+            'mtime': stat.st_mtime_ns}
+
+
+def get_cache_key(input_paths: List[str], **params) -> str:
+    """
+    Hash fingerprints of the input files together with the parameters of
+    the dataset preparation.
+
+    :param input_paths: Paths to the input files.
+    :param params: Parameters used to prepare the dataset.
+    :return: Hex digest serving as the key of the cached entry.
+    """
+    content = {'version': CACHE_VERSION,
+               'inputs': [file_fingerprint(path) for path in input_paths],
+               'params': params}
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DatasetCache:
+    """
+    Directory of the prepared datasets stored as .h5 files named after their
+    keys. The least recently used entries are evicted when the total size of
+    the cache exceeds the limit.
+    """
+
+    def __init__(self, cache_dir: str, size_limit: float = 20 * GB):
+        """
+        :param cache_dir: Directory in which the entries are stored.
+        :param size_limit: Maximum total size of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def _entries(self) -> List[str]:
+        return [os.path.join(self.cache_dir, file_name)
+                for file_name in os.listdir(self.cache_dir)
+                if file_name.endswith(CACHE_EXTENSION)]
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return the path to the cached dataset and mark it as recently used.
+
+        :param key: Key of the entry.
+        :return: Path to the .h5 dataset or None if the entry is not cached.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, key: str, train_x: np.ndarray, train_y: np.ndarray,
+            val_x: np.ndarray, val_y: np.ndarray, test_x: np.ndarray,
+            test_y: np.ndarray, stats: StatsAccumulator = None) -> str:
+        """
+        Store the prepared dataset and evict the least recently used entries
+        if the size limit is exceeded.
+
+        :param key: Key of the entry.
+        :param stats: Statistics of the train set, see io.save_md5.
+        :return: Path to the stored .h5 dataset.
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(
+            suffix='.tmp', dir=self.cache_dir)
+        os.close(file_descriptor)
+        try:
+            io.save_md5(temp_path, train_x, train_y, val_x, val_y,
+                        test_x, test_y, stats=stats)
+            os.replace(temp_path, self._path(key))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict(keep=key)
+        return self._path(key)
+
+    def evict(self, keep: str = None):
+        """
+        Remove the least recently used entries until the total size of
+        the cache does not exceed the limit.
+
+        :param keep: Key of the entry which should never be evicted.
+        """
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        total_size = sum(os.path.getsize(path) for path in entries)
+        for path in entries:
+            if total_size <= self.size_limit:
+                break
+            if keep is not None and path == self._path(keep):
+                continue
+            total_size -= os.path.getsize(path)
+            os.remove(path)
+
+    def invalidate(self, key: str = None):
+        """
+        Remove the given entry or all entries if the key is not provided.
+
+        :param key: Key of the entry to remove.
+        """
+        paths = self._entries() if key is None else [self._path(key)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,59 @@
+"""
+Floating point dtype policy of the samples in the data path. The models
+consume the samples as float32, so the preprocessing, noise injection,
+transformations and the .h5 writer keep the floating point samples in
+the policy dtype instead of silently upcasting them to float64.
+"""
+
+import numpy as np
+
+DEFAULT_FLOATX = 'float32'
+SUPPORTED_FLOATX = ['float16', 'float32', 'float64']
+
+_floatx = np.dtype(DEFAULT_FLOATX)
+
+
+def floatx() -> np.dtype:
+    """
+    Return the floating point dtype of the samples.
+    """
+    return _floatx
+
+
+def set_floatx(dtype: str):
+    """
+    Set the floating point dtype of the samples.
+
+    :param dtype: Name of the dtype, either "float16", "float32"
+        or "float64".
+    """
+    global _floatx
+    if str(dtype) not in SUPPORTED_FLOATX:
+        raise ValueError(
+            'The following floating point dtype is not supported: {}'.format(
+                dtype))
+    _floatx = np.dtype(dtype)
+
+
+def get_samples_dtype(dtype: np.dtype) -> np.dtype:
+    """
+    Return the dtype in which the samples of the given dtype are stored.
+    Floating point samples are stored in the policy dtype, while integer
+    samples, e.g. raw sensor counts, keep their own, usually smaller, dtype.
+
+    :param dtype: Dtype of the samples.
+    :return: Dtype of the stored samples.
+    """
+    return floatx() if np.issubdtype(dtype, np.floating) else np.dtype(dtype)
+
+
+def cast_to_floatx(data: np.ndarray, copy: bool = False) -> np.ndarray:
+    """
+    Cast the samples to the policy dtype.
+
+    :param data: Samples of any numeric dtype.
+    :param copy: Whether to copy the samples which are already
+        in the policy dtype.
+    :return: Samples in the policy dtype.
+    """
+    return np.asarray(data).astype(floatx(), copy=copy)
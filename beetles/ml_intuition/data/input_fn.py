@@ -6,10 +6,101 @@ decent tools.
 """
 import os
 from typing import Dict
+
 import h5py
 import numpy as np
 
 import ml_intuition.enums as enums
+from ml_intuition.data.io import read_samples
+from ml_intuition.data.utils import draw_stratified_indices
+
+_calibration_source = None
+
+
+class CalibrationSource:
+    """
+    Source of the calibration batches. The .h5 file is opened once and only
+    the hyperslab of the requested batch is read at each calibration step.
+    Optionally, a stratified calibration subset is drawn and loaded once,
+    so the I/O does not depend on the size of the training set.
+    """
+
+    def __init__(self, dataset_path: str, batch_size: int,
+                 n_iters: int = None, stratified: bool = False,
+                 seed: int = 0):
+        """
+        :param dataset_path: Path to the processed .h5 dataset.
+        :param batch_size: Size of the calibration batch.
+        :param n_iters: Number of calibration iterations, required if
+            stratified is set to True.
+        :param stratified: Whether to pre-draw a stratified calibration subset.
+        :param seed: Seed used for drawing the calibration subset.
+        """
+        self.dataset_path = dataset_path
+        self.batch_size = batch_size
+        self.file = h5py.File(dataset_path, 'r')
+        self.min_value, self.max_value = \
+            self.file.attrs[enums.DataStats.MIN], \
+            self.file.attrs[enums.DataStats.MAX]
+        self.samples = self.file[enums.Dataset.TRAIN][enums.Dataset.DATA]
+        if stratified:
+            assert n_iters is not None, \
+                'Number of calibration iterations is required for ' \
+                'the stratified calibration subset.'
+            self.samples = self._draw_stratified_subset(n_iters * batch_size,
+                                                        seed)
+
+    def _draw_stratified_subset(self, n_samples: int, seed: int) -> np.ndarray:
+        """
+        Draw the calibration subset preserving the class proportions of
+        the training set and load it into the memory. The subset has exactly
+        n_samples samples, unless the training set is smaller.
+
+        :param n_samples: Number of samples in the calibration subset.
+        :param seed: Seed used for drawing the subset.
+        :return: Shuffled calibration samples.
+        """
+        labels = self.file[enums.Dataset.TRAIN][enums.Dataset.LABELS][:]
+        random_state = np.random.RandomState(seed)
+        indices = draw_stratified_indices(labels, n_samples, random_state)
+        samples = read_samples(self.samples, np.sort(indices))
+        random_state.shuffle(samples)
+        return samples
+
+    def get_batch(self, iter: int) -> np.ndarray:
+        """
+        Read and normalize the batch for the given calibration step.
+
+        :param iter: Calibration step.
+        :return: Normalized batch with one dimension added at the end.
+        """
+        batch_start = iter * self.batch_size
+        batch_end = iter * self.batch_size + self.batch_size
+        if isinstance(self.samples, h5py.Dataset):
+            samples = read_samples(self.samples, slice(batch_start, batch_end))
+        else:
+            samples = self.samples[batch_start:batch_end]
+        samples = np.expand_dims(samples, axis=-1)
+        return (samples - self.min_value) / (self.max_value - self.min_value)
+
+
+def get_calibration_source() -> CalibrationSource:
+    """
+    Return the module-level calibration source, it is created on the first
+    call from the environment variables and reused in the consecutive steps.
+    """
+    global _calibration_source
+    dataset_path = os.environ.get('DATA_PATH')
+    if _calibration_source is None or \
+            _calibration_source.dataset_path != dataset_path:
+        n_iters = os.environ.get('CALIB_ITER')
+        _calibration_source = CalibrationSource(
+            dataset_path=dataset_path,
+            batch_size=int(os.environ.get('BATCH_SIZE')),
+            n_iters=None if n_iters is None else int(n_iters),
+            stratified=bool(int(os.environ.get('CALIB_STRATIFIED', 0))),
+            seed=int(os.environ.get('CALIB_SEED', 0)))
+    return _calibration_source
 
 
 def calibrate_2d_input(iter: int) -> Dict[str, np.ndarray]:
@@ -21,17 +112,5 @@ def calibrate_2d_input(iter: int) -> Dict[str, np.ndarray]:
     :return: Dict with name of the input node as key and training samples in
              np.ndarray as value
     """
-    dataset_path = os.environ.get('DATA_PATH')
     input_node_name = os.environ.get('INPUT_NODE_NAME')
-    batch_size = int(os.environ.get('BATCH_SIZE'))
-
-    batch_start = iter * batch_size
-    batch_end = iter * batch_size + batch_size
-    with h5py.File(dataset_path, 'r') as file:
-        samples = file[enums.Dataset.TRAIN][enums.Dataset.DATA][:]
-        samples = samples[batch_start:batch_end]
-        samples = np.expand_dims(samples, axis=-1)
-        min_value, max_value = file.attrs[enums.DataStats.MIN], \
-                               file.attrs[enums.DataStats.MAX]
-    samples = (samples - min_value) / (max_value - min_value)
-    return {input_node_name: samples}
+    return {input_node_name: get_calibration_source().get_batch(iter)}
@@ -2,10 +2,11 @@
 All I/O related functions
 """
 
+import abc
 import csv
 import glob
 import os
-from typing import Dict, List, Tuple, Union
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple, Union
 
 import h5py
 import numpy as np
@@ -13,8 +14,16 @@ import tensorflow as tf
 import tifffile
 
 import ml_intuition.enums as enums
+from ml_intuition.data.dtype_policy import cast_to_floatx, floatx, \
+    get_samples_dtype
+from ml_intuition.data.stats import StatsAccumulator, compute_stats, \
+    merge_stats, read_stats, write_stats
+from ml_intuition.data.transforms import BaseTransform, apply_transformations
 from ml_intuition.data.utils import build_data_dict
 
+DEFAULT_CHUNK_SIZE = 8192
+DEFAULT_PARALLEL_READS = 4
+
 
 def load_metrics(experiments_path: str, filename: str = None) -> \
         Dict[List, List]:
@@ -57,6 +66,30 @@ def save_metrics(dest_path: str, metrics: Dict[str, List], file_name: str=None):
         write.writerows(zip(*metrics.values()))
 
 
+def read_samples(dataset: h5py.Dataset,
+                 selection: Union[slice, np.ndarray] = slice(None)) -> \
+        np.ndarray:
+    """
+    Read the selected samples from the .h5 dataset and decode them if they
+    were stored in the reduced dtype, i.e. float16 samples or scaled uint16
+    samples with the scale and offset attributes. The decoded samples are
+    in the floating point dtype of the dtype policy.
+
+    :param dataset: The .h5 dataset holding the samples.
+    :param selection: Selection of the samples, defaults to all samples.
+    :return: Decoded samples.
+    """
+    samples = dataset[selection]
+    if enums.StorageAttrs.SCALE in dataset.attrs:
+        samples = cast_to_floatx(samples)
+        samples *= samples.dtype.type(dataset.attrs[enums.StorageAttrs.SCALE])
+        samples += samples.dtype.type(
+            dataset.attrs[enums.StorageAttrs.OFFSET])
+    elif samples.dtype == np.float16:
+        samples = cast_to_floatx(samples)
+    return samples
+
+
 def extract_set(data_path: str, dataset_key: str) -> Dict[str, Union[np.ndarray, float]]:
     """
     Function for loading a h5 format dataset as a dictionary
@@ -68,25 +101,473 @@ def extract_set(data_path: str, dataset_key: str) -> Dict[str, Union[np.ndarray,
     """
     raw_data = h5py.File(data_path, 'r')
     dataset = {
-        enums.Dataset.DATA: raw_data[dataset_key][enums.Dataset.DATA][:],
+        enums.Dataset.DATA: read_samples(
+            raw_data[dataset_key][enums.Dataset.DATA]),
         enums.Dataset.LABELS: raw_data[dataset_key][enums.Dataset.LABELS][:],
         enums.DataStats.MIN: raw_data.attrs[enums.DataStats.MIN],
         enums.DataStats.MAX: raw_data.attrs[enums.DataStats.MAX]
     }
+    stats = read_stats(raw_data.attrs)
+    if stats is not None:
+        write_stats(dataset, stats)
     raw_data.close()
     return dataset
 
 
-def load_npy(data_file_path: str, gt_input_path: str) -> Tuple[
-        np.ndarray, np.ndarray]:
+class ChunkedDataset(abc.ABC):
+    """
+    Dataset containing the train, validation and test subsets, which are
+    read lazily in fixed-size chunks, so the memory footprint is bounded by
+    the chunk size instead of the size of the dataset.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param chunk_size: Number of samples read at once.
+        """
+        self.chunk_size = chunk_size
+
+    @property
+    @abc.abstractmethod
+    def min(self) -> float:
+        """
+        Minimum value of the training samples.
+        """
+
+    @property
+    @abc.abstractmethod
+    def max(self) -> float:
+        """
+        Maximum value of the training samples.
+        """
+
+    @property
+    def stats(self) -> StatsAccumulator:
+        """
+        Statistics of the training samples, accumulated over their chunks
+        unless they are stored with the dataset.
+        """
+        accumulator = StatsAccumulator()
+        for chunk in self.chunks(enums.Dataset.TRAIN):
+            accumulator.update(chunk[enums.Dataset.DATA],
+                               chunk[enums.Dataset.LABELS])
+        return accumulator
+
+    @abc.abstractmethod
+    def n_samples(self, dataset_key: str) -> int:
+        """
+        Return number of samples in the given subset.
+
+        :param dataset_key: Key of the subset, e.g. "train".
+        """
+
+    @abc.abstractmethod
+    def labels(self, dataset_key: str) -> np.ndarray:
+        """
+        Load all labels of the given subset. Labels are much smaller than the
+        samples, therefore they are read at once.
+
+        :param dataset_key: Key of the subset, e.g. "train".
+        """
+
+    @abc.abstractmethod
+    def read(self, dataset_key: str, start: int, stop: int) -> \
+            Dict[str, np.ndarray]:
+        """
+        Read the given range of samples of the subset.
+
+        :param dataset_key: Key of the subset, e.g. "train".
+        :param start: Index of the first sample.
+        :param stop: Index after the last sample.
+        :return: Dictionary with "data" and "labels" keys.
+        """
+
+    def chunks(self, dataset_key: str,
+               transformations: List[BaseTransform] = None) -> \
+            Iterator[Dict[str, np.ndarray]]:
+        """
+        Yield consecutive chunks of the given subset.
+
+        :param dataset_key: Key of the subset, e.g. "train".
+        :param transformations: Transformations applied to each chunk.
+        :return: Generator of dictionaries with "data" and "labels" keys.
+        """
+        for start in range(0, self.n_samples(dataset_key), self.chunk_size):
+            chunk = self.read(dataset_key, start, start + self.chunk_size)
+            if transformations is not None:
+                chunk = apply_transformations(chunk, transformations)
+            yield chunk
+
+    def to_tf_dataset(self, dataset_key: str, batch_size: int,
+                      transformations: List[BaseTransform] = None,
+                      shuffle: bool = False,
+                      batch_transformation: Callable[
+                          [tf.data.Dataset], tf.data.Dataset] = None,
+                      shuffle_buffer_size: int = None,
+                      cache_path: str = None,
+                      num_parallel_calls: int = None,
+                      num_parallel_reads: int = DEFAULT_PARALLEL_READS) -> \
+            Tuple[tf.data.Dataset, int]:
+        """
+        Create the tf.data.Dataset streaming batches of the given subset.
+        Raw chunks are read in parallel by generators interleaved over
+        the chunk offsets, in the deterministic order, and transformed by
+        the parallel map. When shuffle is set, the order of the chunks is
+        shuffled in each epoch and the samples are shuffled within
+        the bounded buffer. When the cache path is given, the transformed
+        chunks are cached in the local file during the first epoch and
+        the next epochs read them from the cache in the order of the first
+        epoch, so only the samples within the shuffle buffer are shuffled
+        again. The cache files are not removed, see remove_tf_cache.
+
+        :param dataset_key: Key of the subset, e.g. "train".
+        :param batch_size: Size of the batch.
+        :param transformations: Transformations applied to each chunk.
+        :param shuffle: Whether to shuffle the samples.
+        :param batch_transformation: Transformation of the repeated dataset
+            of batches, e.g. noise.get_noise_stage.
+        :param shuffle_buffer_size: Number of samples in the shuffle buffer,
+            defaults to the chunk size.
+        :param cache_path: Path to the file caching the transformed chunks.
+        :param num_parallel_calls: Number of chunks transformed in parallel,
+            defaults to tf.contrib.data.AUTOTUNE.
+        :param num_parallel_reads: Number of chunks read in parallel.
+        :return: Repeated dataset with the number of samples in the subset.
+        """
+        if num_parallel_calls is None:
+            num_parallel_calls = tf.contrib.data.AUTOTUNE
+        keys = [enums.Dataset.DATA, enums.Dataset.LABELS]
+        raw_example = self.read(dataset_key, 0, 1)
+        raw_types = tuple(tf.as_dtype(raw_example[key].dtype) for key in keys)
+        raw_shapes = tuple(tf.TensorShape((None,) + raw_example[key].shape[1:])
+                           for key in keys)
+        sample_example = raw_example if transformations is None else \
+            apply_transformations(raw_example, transformations)
+        output_shapes = tuple(tf.TensorShape(
+            (None,) + sample_example[key].shape[1:]) for key in keys)
+
+        def read_chunk(start: int):
+            chunk = self.read(dataset_key, start, start + self.chunk_size)
+            yield chunk[enums.Dataset.DATA], chunk[enums.Dataset.LABELS]
+
+        def transform_chunk(data: np.ndarray, labels: np.ndarray):
+            chunk = apply_transformations({enums.Dataset.DATA: data,
+                                           enums.Dataset.LABELS: labels},
+                                          transformations)
+            return [chunk[enums.Dataset.DATA].astype(floatx(), copy=False),
+                    chunk[enums.Dataset.LABELS].astype(np.float32,
+                                                       copy=False)]
+
+        def transform(data: tf.Tensor, labels: tf.Tensor):
+            data, labels = tf.py_func(transform_chunk, [data, labels],
+                                      [tf.as_dtype(floatx()), tf.float32])
+            data.set_shape(output_shapes[0])
+            labels.set_shape(output_shapes[1])
+            return data, labels
+
+        n_samples = self.n_samples(dataset_key)
+        dataset = tf.data.Dataset.range(0, n_samples, self.chunk_size)
+        if shuffle:
+            dataset = dataset.shuffle(
+                buffer_size=-(-n_samples // self.chunk_size))
+        dataset = dataset.apply(tf.contrib.data.parallel_interleave(
+            lambda start: tf.data.Dataset.from_generator(
+                read_chunk, output_types=raw_types, output_shapes=raw_shapes,
+                args=(start,)), cycle_length=num_parallel_reads))
+        if transformations is not None:
+            dataset = dataset.map(transform,
+                                  num_parallel_calls=num_parallel_calls)
+        else:
+            dataset = dataset.map(lambda data, labels: (
+                tf.cast(data, tf.as_dtype(floatx())),
+                tf.cast(labels, tf.float32)))
+        if cache_path is not None:
+            dataset = dataset.cache(cache_path)
+        dataset = dataset.flat_map(
+            lambda data, labels: tf.data.Dataset.from_tensor_slices(
+                (data, labels)))
+        if shuffle:
+            dataset = dataset.shuffle(
+                buffer_size=shuffle_buffer_size or self.chunk_size)
+        dataset = dataset.batch(batch_size=batch_size, drop_remainder=False) \
+            .repeat()
+        if batch_transformation is not None:
+            dataset = dataset.apply(batch_transformation)
+        return dataset.prefetch(tf.contrib.data.AUTOTUNE), n_samples
+
+
+class ArrayDataset(ChunkedDataset):
+    """
+    Data dict held in the memory, read in chunks like the other
+    chunked datasets.
+    """
+
+    def __init__(self, data: Dict, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param data: Data dict with the subsets and the min and max values.
+        :param chunk_size: Number of samples read at once.
+        """
+        super().__init__(chunk_size)
+        self.data = data
+
+    @property
+    def stats(self) -> StatsAccumulator:
+        return read_stats(self.data) or super().stats
+
+    @property
+    def min(self) -> float:
+        return self.data[enums.DataStats.MIN]
+
+    @property
+    def max(self) -> float:
+        return self.data[enums.DataStats.MAX]
+
+    def n_samples(self, dataset_key: str) -> int:
+        return len(self.data[dataset_key][enums.Dataset.LABELS])
+
+    def labels(self, dataset_key: str) -> np.ndarray:
+        return self.data[dataset_key][enums.Dataset.LABELS]
+
+    def read(self, dataset_key: str, start: int, stop: int) -> \
+            Dict[str, np.ndarray]:
+        subset = self.data[dataset_key]
+        return {enums.Dataset.DATA: subset[enums.Dataset.DATA][start:stop],
+                enums.Dataset.LABELS: subset[enums.Dataset.LABELS][start:stop]}
+
+
+class LazyDataset(ChunkedDataset):
+    """
+    Lazy handle to the processed .h5 dataset. The file is kept open and
+    the samples are read in chunks.
+    """
+
+    def __init__(self, data_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param data_path: Path to the processed .h5 dataset.
+        :param chunk_size: Number of samples read from the file at once.
+        """
+        super().__init__(chunk_size)
+        self.data_path = data_path
+        self.file = h5py.File(data_path, 'r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying .h5 file.
+        """
+        self.file.close()
+
+    @property
+    def stats(self) -> StatsAccumulator:
+        return read_stats(self.file.attrs) or super().stats
+
+    @property
+    def min(self) -> float:
+        return self.file.attrs[enums.DataStats.MIN]
+
+    @property
+    def max(self) -> float:
+        return self.file.attrs[enums.DataStats.MAX]
+
+    def n_samples(self, dataset_key: str) -> int:
+        return len(self.file[dataset_key][enums.Dataset.LABELS])
+
+    def labels(self, dataset_key: str) -> np.ndarray:
+        return self.file[dataset_key][enums.Dataset.LABELS][:]
+
+    def read(self, dataset_key: str, start: int, stop: int) -> \
+            Dict[str, np.ndarray]:
+        subset = self.file[dataset_key]
+        return {
+            enums.Dataset.DATA: read_samples(subset[enums.Dataset.DATA],
+                                             slice(start, stop)),
+            enums.Dataset.LABELS: subset[enums.Dataset.LABELS][start:stop]
+        }
+
+
+class IndexedDataset(ChunkedDataset):
+    """
+    Split of the samples described only by the indices of each subset.
+    The samples, which can be memory mapped, are never copied as a whole,
+    each chunk is gathered from them only when it is read.
+    """
+
+    def __init__(self, data: np.ndarray, labels: np.ndarray,
+                 split_indices: NamedTuple,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param data: All samples.
+        :param labels: Corresponding labels.
+        :param split_indices: Indices of the train, val and test subsets,
+            e.g. returned by preprocessing.get_split_indices.
+        :param chunk_size: Number of samples gathered at once.
+        """
+        super().__init__(chunk_size)
+        self.data = data
+        self.all_labels = labels
+        self.indices = split_indices._asdict()
+        self._stats = super().stats
+
+    @property
+    def stats(self) -> StatsAccumulator:
+        return self._stats
+
+    @property
+    def min(self) -> float:
+        return self._stats.min
+
+    @property
+    def max(self) -> float:
+        return self._stats.max
+
+    def n_samples(self, dataset_key: str) -> int:
+        return len(self.indices[dataset_key])
+
+    def labels(self, dataset_key: str) -> np.ndarray:
+        return self.all_labels[self.indices[dataset_key]]
+
+    def read(self, dataset_key: str, start: int, stop: int) -> \
+            Dict[str, np.ndarray]:
+        indices = self.indices[dataset_key][start:stop]
+        return {enums.Dataset.DATA: self.data[indices],
+                enums.Dataset.LABELS: self.all_labels[indices]}
+
+
+class MergedDataset(ChunkedDataset):
+    """
+    Concatenation of the chunked datasets of several scenes, each kept in its
+    own source, e.g. its prepared .h5 file. The global min and max values
+    are taken from the stats of the scenes, so the samples are never merged
+    into a single array.
+    """
+
+    def __init__(self, datasets: List[ChunkedDataset],
+                 weights: List[float] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param datasets: Datasets of the scenes.
+        :param weights: Probabilities of drawing the training batch from
+            each scene, defaults to the shares of the scenes in the training
+            set.
+        :param chunk_size: Number of samples read at once.
+        """
+        super().__init__(chunk_size)
+        self.datasets = datasets
+        self.weights = weights
+
+    def close(self):
+        """
+        Close the underlying .h5 files.
+        """
+        for dataset in self.datasets:
+            if isinstance(dataset, LazyDataset):
+                dataset.close()
+
+    @property
+    def stats(self) -> StatsAccumulator:
+        return merge_stats(dataset.stats for dataset in self.datasets)
+
+    @property
+    def min(self) -> float:
+        return min(dataset.min for dataset in self.datasets)
+
+    @property
+    def max(self) -> float:
+        return max(dataset.max for dataset in self.datasets)
+
+    def n_samples(self, dataset_key: str) -> int:
+        return sum(dataset.n_samples(dataset_key) for dataset in self.datasets)
+
+    def labels(self, dataset_key: str) -> np.ndarray:
+        return np.concatenate([dataset.labels(dataset_key)
+                               for dataset in self.datasets])
+
+    def read(self, dataset_key: str, start: int, stop: int) -> \
+            Dict[str, np.ndarray]:
+        chunks, offset = [], 0
+        for dataset in self.datasets:
+            n_samples = dataset.n_samples(dataset_key)
+            if start < offset + n_samples and stop > offset:
+                chunks.append(dataset.read(dataset_key,
+                                           max(start - offset, 0),
+                                           min(stop - offset, n_samples)))
+            offset += n_samples
+        return {key: np.concatenate([chunk[key] for chunk in chunks])
+                for key in [enums.Dataset.DATA, enums.Dataset.LABELS]}
+
+    def to_tf_dataset(self, dataset_key: str, batch_size: int,
+                      transformations: List[BaseTransform] = None,
+                      shuffle: bool = False,
+                      batch_transformation: Callable[
+                          [tf.data.Dataset], tf.data.Dataset] = None,
+                      shuffle_buffer_size: int = None,
+                      cache_path: str = None,
+                      num_parallel_calls: int = None,
+                      num_parallel_reads: int = DEFAULT_PARALLEL_READS) -> \
+            Tuple[tf.data.Dataset, int]:
+        """
+        Create the tf.data.Dataset interleaving the batches streamed from
+        each scene. The training batches are drawn from the scenes with
+        the mixing weights, the other subsets with the shares of the scenes.
+        For the description of the parameters please refer to
+        ChunkedDataset.to_tf_dataset, the cache path is suffixed with
+        the index of the scene.
+        """
+        scene_ids = [scene_id for scene_id, dataset in enumerate(self.datasets)
+                     if dataset.n_samples(dataset_key) > 0]
+        if self.weights is not None and dataset_key == enums.Dataset.TRAIN:
+            weights = np.array([self.weights[scene_id]
+                                for scene_id in scene_ids], dtype=np.float64)
+        else:
+            weights = np.array([self.datasets[scene_id].n_samples(dataset_key)
+                                for scene_id in scene_ids], dtype=np.float64)
+        scenes = [self.datasets[scene_id].to_tf_dataset(
+            dataset_key, batch_size, transformations, shuffle,
+            shuffle_buffer_size=shuffle_buffer_size,
+            cache_path=None if cache_path is None else
+            '{}_{}'.format(cache_path, scene_id),
+            num_parallel_calls=num_parallel_calls,
+            num_parallel_reads=num_parallel_reads)[0]
+                  for scene_id in scene_ids]
+        dataset = tf.contrib.data.sample_from_datasets(
+            scenes, weights=(weights / weights.sum()).tolist())
+        if batch_transformation is not None:
+            dataset = dataset.apply(batch_transformation)
+        return dataset.prefetch(tf.contrib.data.AUTOTUNE), \
+               self.n_samples(dataset_key)
+
+
+def remove_tf_cache(cache_path: str):
+    """
+    Remove the files written by tf.data.Dataset.cache under the given path,
+    including the ones suffixed with the names of the sets or the indices
+    of the scenes.
+
+    :param cache_path: Path prefix of the cache files.
+    """
+    for path in glob.glob(glob.escape(cache_path) + '*'):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def load_npy(data_file_path: str, gt_input_path: str,
+             mmap_mode: str = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Load .npy data and GT from specified paths
 
     :param data_file_path: Path to the data .npy file
     :param gt_input_path: Path to the GT .npy file
+    :param mmap_mode: If not None, the files are memory mapped with the given
+        mode, e.g. "r", instead of being loaded into the memory
     :return: Tuple with loaded data and GT
     """
-    return np.load(data_file_path), np.load(gt_input_path)
+    return np.load(data_file_path, mmap_mode=mmap_mode), \
+           np.load(gt_input_path, mmap_mode=mmap_mode)
 
 
 def load_satellite_h5(data_file_path: str) -> Tuple[np.ndarray, np.ndarray]:
@@ -109,16 +590,17 @@ def load_processed_h5(data_file_path: str) -> Dict:
     :return: Dictionary containing train, validation and test subsets.
     """
     with h5py.File(data_file_path, 'r') as file:
+        stats = read_stats(file.attrs)
         train_x, train_y, val_x, val_y, test_x, test_y = \
-            file[enums.Dataset.TRAIN][enums.Dataset.DATA][:], \
+            read_samples(file[enums.Dataset.TRAIN][enums.Dataset.DATA]), \
             file[enums.Dataset.TRAIN][enums.Dataset.LABELS][:],\
-            file[enums.Dataset.VAL][enums.Dataset.DATA][:], \
+            read_samples(file[enums.Dataset.VAL][enums.Dataset.DATA]), \
             file[enums.Dataset.VAL][enums.Dataset.LABELS][:],\
-            file[enums.Dataset.TEST][enums.Dataset.DATA][:], \
+            read_samples(file[enums.Dataset.TEST][enums.Dataset.DATA]), \
             file[enums.Dataset.TEST][enums.Dataset.LABELS][:]
     return build_data_dict(train_x=train_x, train_y=train_y,
                            val_x=val_x, val_y=val_y,
-                           test_x=test_x, test_y=test_y)
+                           test_x=test_x, test_y=test_y, stats=stats)
 
 
 def load_tiff(file_path: str) -> np.ndarray:
@@ -130,7 +612,65 @@ def load_tiff(file_path: str) -> np.ndarray:
     return tifffile.imread(file_path)
 
 
-def save_md5(output_path, train_x, train_y, val_x, val_y, test_x, test_y):
+def _create_dataset(group: h5py.Group, name: str, data: np.ndarray,
+                    chunk_size: int = None, compression: str = None,
+                    compression_level: int = None,
+                    shuffle_filter: bool = False,
+                    storage_dtype: str = None) -> h5py.Dataset:
+    """
+    Create the .h5 dataset with the given storage layout.
+
+    :param group: Group in which the dataset is created.
+    :param name: Name of the dataset.
+    :param data: Data to store.
+    :param chunk_size: Number of samples in a single chunk, the chunk spans
+        all remaining dimensions, i.e. samples x bands.
+        If None, contiguous storage is used unless a filter requires chunking.
+    :param compression: Compression filter, either "gzip" or "lzf".
+    :param compression_level: Level of the gzip compression (0-9).
+    :param shuffle_filter: Whether to apply the byte shuffle filter.
+    :param storage_dtype: Reduced dtype of the stored data, either "float16"
+        or "uint16". The latter stores the data scaled to the whole uint16
+        range with the scale and offset attributes needed for decoding.
+        If None, the floating point data is stored in the dtype of the dtype
+        policy and the integer data in its own dtype.
+    :return: Created dataset.
+    """
+    attrs = {}
+    if storage_dtype is None:
+        data = np.asarray(data).astype(get_samples_dtype(data.dtype),
+                                       copy=False)
+    elif storage_dtype == 'float16':
+        data = data.astype(np.float16)
+    elif storage_dtype == 'uint16':
+        offset = float(np.amin(data)) if data.size > 0 else 0.
+        data_range = float(np.amax(data)) - offset if data.size > 0 else 0.
+        scale = data_range / np.iinfo(np.uint16).max if data_range > 0 else 1.
+        attrs = {enums.StorageAttrs.SCALE: scale,
+                 enums.StorageAttrs.OFFSET: offset}
+        data = np.round((data - offset) / scale).astype(np.uint16)
+    elif storage_dtype is not None:
+        raise ValueError(
+            'The following storage dtype is not supported: {}'.format(
+                storage_dtype))
+    layout = {}
+    if len(data) > 0:
+        if chunk_size is not None:
+            layout['chunks'] = (min(chunk_size, len(data)),) + data.shape[1:]
+        if compression is not None:
+            layout['compression'] = compression
+            layout['compression_opts'] = compression_level
+        if shuffle_filter:
+            layout['shuffle'] = True
+    dataset = group.create_dataset(name, data=data, **layout)
+    dataset.attrs.update(attrs)
+    return dataset
+
+
+def save_md5(output_path, train_x, train_y, val_x, val_y, test_x, test_y,
+             chunk_size: int = None, compression: str = None,
+             compression_level: int = None, shuffle_filter: bool = False,
+             storage_dtype: str = None, stats: StatsAccumulator = None):
     """
     Save provided data as .md5 file
     :param output_path: Path to the filename
@@ -140,25 +680,40 @@ def save_md5(output_path, train_x, train_y, val_x, val_y, test_x, test_y):
     :param val_y: Validation labels
     :param test_x: Test set
     :param test_y: Test labels
+    :param chunk_size: Number of samples in a single chunk of the stored
+        subsets. If None, contiguous storage is used.
+    :param compression: Compression filter, either "gzip" or "lzf".
+        If None, data is not compressed.
+    :param compression_level: Level of the gzip compression (0-9).
+    :param shuffle_filter: Whether to apply the byte shuffle filter, which
+        usually improves the compression ratio.
+    :param storage_dtype: Reduced dtype of the stored samples, either
+        "float16" or "uint16" (scaled with stored scale and offset).
+        If None, floating point samples are stored in the dtype of
+        the dtype policy and integer samples in their own dtype.
+        The samples are decoded transparently by all readers in this module.
+    :param stats: Statistics of the train set stored as the attributes of
+        the file. If None, they are computed in a single pass over the train
+        set.
     :return:
     """
     data_file = h5py.File(output_path, 'w')
 
-    train_min, train_max = np.amin(train_x), np.amax(train_x)
-    data_file.attrs.create(enums.DataStats.MIN, train_min)
-    data_file.attrs.create(enums.DataStats.MAX, train_max)
-
-    train_group = data_file.create_group(enums.Dataset.TRAIN)
-    train_group.create_dataset(enums.Dataset.DATA, data=train_x)
-    train_group.create_dataset(enums.Dataset.LABELS, data=train_y)
-
-    val_group = data_file.create_group(enums.Dataset.VAL)
-    val_group.create_dataset(enums.Dataset.DATA, data=val_x)
-    val_group.create_dataset(enums.Dataset.LABELS, data=val_y)
-
-    test_group = data_file.create_group(enums.Dataset.TEST)
-    test_group.create_dataset(enums.Dataset.DATA, data=test_x)
-    test_group.create_dataset(enums.Dataset.LABELS, data=test_y)
+    if stats is None:
+        stats = compute_stats(train_x, train_y)
+    write_stats(data_file.attrs, stats)
+
+    layout = {'chunk_size': chunk_size, 'compression': compression,
+              'compression_level': compression_level,
+              'shuffle_filter': shuffle_filter}
+    for subset_key, subset_x, subset_y in [
+            (enums.Dataset.TRAIN, train_x, train_y),
+            (enums.Dataset.VAL, val_x, val_y),
+            (enums.Dataset.TEST, test_x, test_y)]:
+        group = data_file.create_group(subset_key)
+        _create_dataset(group, enums.Dataset.DATA, subset_x,
+                        storage_dtype=storage_dtype, **layout)
+        _create_dataset(group, enums.Dataset.LABELS, subset_y, **layout)
     data_file.close()
 
 
@@ -168,7 +723,7 @@ def read_min_max(path: str) -> Tuple[float, float]:
     :param path:
     :return: Tuple with min and max
     """
-    min_, max_ = np.loadtxt(path)
+    min_, max_ = np.loadtxt(path, delimiter=',')
     return min_, max_
 
 
@@ -1,16 +1,20 @@
 import abc
+import copy
 import json
 import math
 import sys
 from itertools import product
-from typing import Dict, List, NamedTuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Tuple
 
 import yaml
 import numpy as np
 import tensorflow as tf
 
+from ml_intuition.data.dtype_policy import cast_to_floatx, floatx
 from ml_intuition.enums import Dataset, Sample
 
+BLOCK_SIZE = 2 ** 14
+
 
 class Params(NamedTuple):
     """
@@ -18,7 +22,10 @@ class Params(NamedTuple):
 
     Attributes:
         pa:     Fraction of noisy pixels, the number of affected samples
-                is calculated by: floor(n_samples * pa).
+                is calculated by: floor(n_samples * pa). When the noise
+                is injected batch by batch, it is rounded randomly
+                instead, so the expected fraction of the affected
+                samples of the whole set is pa.
 
         pb:     Fraction of noisy bands. When established the number of
                 samples that undergo noise injection, for each sample
@@ -33,7 +40,11 @@ class Params(NamedTuple):
         std:    Standard deviation of the normal distribution.
 
         pw:     Ratio of whitened pixels for the affected set of samples
-                in the Impulsive noise injection.
+                in the Impulsive noise injection, rounded like pa.
+
+        inplace: Boolean indicating whether the Shot noise is injected
+                directly to the writable floating point input instead of
+                its copy.
     """
     pa: float = None
     pb: float = None
@@ -41,13 +52,15 @@ class Params(NamedTuple):
     mean: float = None
     std: float = None
     pw: float = None
+    inplace: bool = None
 
 
 class BaseNoise(abc.ABC):
     def __init__(self, params: Dict):
         super().__init__()
         self.params = Params(**params)
-        pass
+        self.batched = False
+        self.data_range = None
 
     @abc.abstractmethod
     def __call__(self, *args, **kwargs):
@@ -62,95 +75,164 @@ class BaseNoise(abc.ABC):
     def get_proba(n_samples: int, prob: float) -> int:
         return math.floor(n_samples * prob)
 
+    def get_count(self, n_samples: int, prob: float,
+                  random_state: np.random.RandomState) -> int:
+        """
+        Number of the samples drawn with the given probability. For the
+        batches, the count is rounded up with the probability equal to its
+        fractional part, so the expected count summed over the batches
+        equals the count of the whole set.
+
+        :param n_samples: Number of samples.
+        :param prob: Fraction of the drawn samples.
+        :param random_state: Random state used for rounding the count.
+        :return: Number of the drawn samples.
+        """
+        if not self.batched:
+            return self.get_proba(n_samples, prob)
+        count = n_samples * prob
+        return math.floor(count) + int(
+            random_state.random_sample() < count - math.floor(count))
+
+    def for_batches(self, data_range: Tuple[float, float] = None) -> \
+            'BaseNoise':
+        """
+        Copy of the injector applied batch by batch to the whole set.
+
+        :param data_range: Minimum and maximum of the whole set, used
+            instead of the ones of the batch by the noise depending on
+            the range of the data. If None, the range of the batch is used.
+        :return: Injector for the batches.
+        """
+        injector = copy.copy(self)
+        injector.batched, injector.data_range = True, data_range
+        return injector
+
+    def get_noisy_cells(self, data_shape: Tuple,
+                        random_state: np.random.RandomState = None,
+                        block_size: int = BLOCK_SIZE,
+                        n_affected: int = None) -> Iterator[
+            Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Draw the affected samples and their bands. When the bands are not
+        constant, the bands of each sample are drawn by partitioning a row of
+        random keys, so all affected cells are drawn without a Python loop.
+        The cells are yielded in blocks of samples to bound the memory
+        taken by the random keys.
+
+        :param data_shape: Shape of the data, first two dimensions are
+            the samples and the bands.
+        :param random_state: Random state used for drawing, defaults to
+            the global numpy random state.
+        :param block_size: Number of samples in a single block.
+        :param n_affected: Number of the affected samples, if None it is
+            drawn by get_count.
+        :return: Iterator over the position of the block in the affected
+            samples, the indices of samples with shape [SAMPLES, 1] and
+            the indices of their bands with shape [SAMPLES, BANDS],
+            which together index the affected cells.
+        """
+        n_samples, n_features = data_shape[Sample.SAMPLES_DIM], \
+                                data_shape[Sample.FEATURES_DIM]
+        random_state = np.random if random_state is None else random_state
+        if n_affected is None:
+            n_affected = self.get_count(n_samples, self.params.pa,
+                                        random_state)
+        n_bands = self.get_proba(n_features, self.params.pb)
+        noisy_bands = random_state.choice(n_features, n_bands, False)
+        noisy_samples = random_state.choice(n_samples, n_affected, False)
+        if n_bands == 0:
+            return
+        for start in range(0, n_affected, block_size):
+            samples = noisy_samples[start:start + block_size, np.newaxis]
+            if self.params.bc:
+                bands = np.broadcast_to(noisy_bands, (len(samples), n_bands))
+            else:
+                bands = np.argpartition(
+                    random_state.random_sample((len(samples), n_features)),
+                    n_bands - 1, axis=1)[:, :n_bands]
+            yield start, samples, bands
+
 
 class Gaussian(BaseNoise):
 
-    def __call__(self, data: np.ndarray, labels: np.ndarray) -> List[np.ndarray]:
+    def __call__(self, data: np.ndarray, labels: np.ndarray,
+                 random_state: np.random.RandomState = None) -> List[
+            np.ndarray]:
         """
-        Perform Gaussian noise injection.
+        Perform Gaussian noise injection. The noisy data is a copy
+        in the floating point dtype of the dtype policy.
 
         :param data: Input data that will undergo noise injection.
         :param label: Class value for each data.
+        :param random_state: Random state used for drawing the noise,
+            defaults to the global numpy random state.
         :return: List containing the noisy data and the class label.
         """
-        n_affected, n_bands = \
-            self.get_proba(data.shape[Sample.SAMPLES_DIM], self.params.pa), \
-            self.get_proba(data.shape[Sample.FEATURES_DIM], self.params.pb)
-        data = data.astype(np.float)
-        noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                       n_bands, False)
-        for sample_index in np.random.choice(data.shape[Sample.SAMPLES_DIM],
-                                             n_affected, False):
-            if not self.params.bc:
-                noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                               n_bands, False)
-            for band_index in noisy_bands:
-                data[sample_index, band_index] += \
-                    np.random.normal(loc=self.params.mean,
-                                     scale=self.params.std,
-                                     size=data[sample_index, band_index].shape)
+        random_state = np.random if random_state is None else random_state
+        data = cast_to_floatx(data, copy=True)
+        for _, samples, bands in self.get_noisy_cells(data.shape,
+                                                      random_state):
+            data[samples, bands] += random_state.normal(
+                loc=self.params.mean, scale=self.params.std,
+                size=data[samples, bands].shape).astype(data.dtype)
         return [data, labels]
 
 
 class Impulsive(BaseNoise):
 
-    def __call__(self, data: np.ndarray, labels: np.ndarray) -> List[np.ndarray]:
+    def __call__(self, data: np.ndarray, labels: np.ndarray,
+                 random_state: np.random.RandomState = None) -> List[
+            np.ndarray]:
         """
-        Perform impulsive noise injection.
+        Perform impulsive noise injection. The black and white levels are
+        the minimum and maximum of the data, or the range of the whole set
+        when injected batch by batch.
 
         :param data: Input data that will undergo noise injection.
         :param label: Class value for each data.
+        :param random_state: Random state used for drawing the noise,
+            defaults to the global numpy random state.
         :return: List containing the noisy data and the class label.
         """
-        n_affected, n_bands = \
-            self.get_proba(data.shape[Sample.SAMPLES_DIM], self.params.pa), \
-            self.get_proba(data.shape[Sample.FEATURES_DIM], self.params.pb)
-        n_white = self.get_proba(n_affected, self.params.pw)
-        black, white = np.amin(data), np.amax(data)
-        noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                       n_bands, False)
-        for noise_index, sample_index in enumerate(np.random.choice(
-                data.shape[Sample.SAMPLES_DIM], n_affected, False)):
-            if not self.params.bc:
-                noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                               n_bands, False)
-            for band_index in noisy_bands:
-                if noise_index < n_white:
-                    data[sample_index, band_index] = \
-                        np.full(shape=data[sample_index, band_index].shape,
-                                fill_value=white)
-                else:
-                    data[sample_index, band_index] = \
-                        np.full(shape=data[sample_index, band_index].shape,
-                                fill_value=black)
+        random_state = np.random if random_state is None else random_state
+        n_affected = self.get_count(data.shape[Sample.SAMPLES_DIM],
+                                    self.params.pa, random_state)
+        n_white = self.get_count(n_affected, self.params.pw, random_state)
+        black, white = (np.amin(data), np.amax(data)) \
+            if self.data_range is None else self.data_range
+        for start, samples, bands in self.get_noisy_cells(
+                data.shape, random_state, n_affected=n_affected):
+            is_white = np.arange(start, start + len(samples)) < n_white
+            data[samples, bands] = np.where(is_white, white, black).reshape(
+                (-1, 1) + (1,) * (data.ndim - 2))
         return [data, labels]
 
 
 class Shot(BaseNoise):
 
-    def __call__(self, data: np.ndarray, labels: np.ndarray) -> List[np.ndarray]:
+    def __call__(self, data: np.ndarray, labels: np.ndarray,
+                 random_state: np.random.RandomState = None) -> List[
+            np.ndarray]:
         """
-        Perform shot noise injection.
+        Perform shot noise injection. The Poisson noise is drawn only for
+        the affected cells, with rates given by their values clipped at zero,
+        and the data is kept in the floating point dtype of the dtype policy.
 
         :param data: Input data that will undergo noise injection.
         :param label: Class value for each data.
+        :param random_state: Random state used for drawing the noise,
+            defaults to the global numpy random state.
         :return: List containing the noisy data and the class label.
         """
-        n_affected, n_bands = \
-            self.get_proba(data.shape[Sample.SAMPLES_DIM], self.params.pa), \
-            self.get_proba(data.shape[Sample.FEATURES_DIM], self.params.pb)
-        data = data.astype(np.float)
-        data = np.clip(data, a_min=0, a_max=None)
-        noise = np.random.poisson(data)
-        noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                       n_bands, False)
-        for sample_index in np.random.choice(data.shape[Sample.SAMPLES_DIM],
-                                             n_affected, False):
-            if not self.params.bc:
-                noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
-                                               n_bands, False)
-            for band_index in noisy_bands:
-                data[sample_index, band_index] += noise[sample_index, band_index]
+        if not self.params.inplace or data.dtype != floatx() or \
+                not data.flags.writeable:
+            data = cast_to_floatx(data, copy=True)
+        random_state = np.random if random_state is None else random_state
+        for _, samples, bands in self.get_noisy_cells(data.shape,
+                                                      random_state):
+            cells = np.clip(data[samples, bands], a_min=0, a_max=None)
+            data[samples, bands] = cells + random_state.poisson(cells)
         return [data, labels]
 
 
@@ -173,14 +255,52 @@ def get_noise_functions(noise: List[str], noise_params: str) -> List[BaseNoise]:
     :param noise: List of noise injection methods.
     :param noise_params: Parameters of the noise injection.
     """
-    try:
-        noise_params = json.loads(noise_params)
-    except json.decoder.JSONDecodeError:
-        noise_params = yaml.load(noise_params)
+    noise_params = parse_noise_params(noise_params)
     return [noise_injector(noise_params)
             for noise_injector in get_all_noise_functions(noise)]
 
 
+def parse_noise_params(noise_params: str) -> Dict:
+    """
+    Parse the JSON or YAML parameters of the noise injection.
+
+    :param noise_params: Parameters of the noise injection.
+    :return: Dictionary with the parameters.
+    """
+    try:
+        return json.loads(noise_params)
+    except json.decoder.JSONDecodeError:
+        return yaml.load(noise_params)
+
+
+def get_noise_params_grid(noise_params: str) -> List[Dict]:
+    """
+    Expand the parameters of the noise injection into the grid of
+    configurations. Each parameter given as a list spans one axis of
+    the grid, e.g. "{"pa": [0.1, 0.2], "pb": 0.5}" yields two configurations.
+
+    :param noise_params: JSON or YAML parameters of the noise injection.
+    :return: List of the parameters of each configuration.
+    """
+    noise_params = parse_noise_params(noise_params)
+    grid = {key: value if isinstance(value, list) else [value]
+            for key, value in noise_params.items()}
+    return [dict(zip(grid.keys(), values)) for values in product(*grid.values())]
+
+
+def get_corrupted_samples(clean_data: np.ndarray,
+                          noisy_data: np.ndarray) -> np.ndarray:
+    """
+    Find the samples changed by the noise injection.
+
+    :param clean_data: Data before the noise injection.
+    :param noisy_data: Data after the noise injection.
+    :return: Indices of the samples in which any value differs.
+    """
+    return np.flatnonzero(np.any(
+        (noisy_data != clean_data).reshape(len(clean_data), -1), axis=1))
+
+
 def inject_noise(data_source: Dict, affected_subsets: List[str],
                  noise_injectors: List[str], noise_params: str):
     """
@@ -195,3 +315,68 @@ def inject_noise(data_source: Dict, affected_subsets: List[str],
             get_noise_functions(noise_injectors, noise_params), affected_subsets):
         data_source[affected_subset][Dataset.DATA], data_source[affected_subset][Dataset.LABELS] = f_noise(data_source[affected_subset][Dataset.DATA],
                                                                                                            data_source[affected_subset][Dataset.LABELS])
+
+
+def inject_batch_noise(noise_functions: List[BaseNoise], data: np.ndarray,
+                       seed: List[int],
+                       data_range: Tuple[float, float] = None) -> np.ndarray:
+    """
+    Inject noise into a single batch using the random state seeded
+    with the given seed, so the noise of each batch is reproducible
+    regardless of the order in which the batches are processed.
+
+    :param noise_functions: Noise injectors applied consecutively.
+    :param data: Batch of the data.
+    :param seed: Seed of the random state, e.g. the global seed
+        together with the index of the batch.
+    :param data_range: Minimum and maximum of the whole set, see
+        BaseNoise.for_batches.
+    :return: Noisy batch with the dtype of the input.
+    """
+    random_state = np.random.RandomState(seed)
+    noisy_data = data
+    for noise_function in noise_functions:
+        noisy_data, _ = noise_function.for_batches(data_range)(
+            noisy_data, None, random_state=random_state)
+    return noisy_data.astype(data.dtype)
+
+
+def get_noise_stage(noise_functions: List[BaseNoise], seed: int = 0,
+                    num_parallel_calls: int = None,
+                    data_range: Tuple[float, float] = None) -> Callable[
+        [tf.data.Dataset], tf.data.Dataset]:
+    """
+    Create the tf.data transformation injecting noise into each batch of
+    the (data, labels) dataset. Batches are enumerated, also across the
+    repetitions of the dataset, and the noise of each batch is drawn from
+    the random state seeded with the seed and the index of the batch,
+    so each epoch sees fresh noise and no noisy copy of the whole dataset
+    is stored.
+
+    :param noise_functions: Noise injectors applied to each batch.
+    :param seed: Seed of the noise.
+    :param num_parallel_calls: Number of batches processed in parallel,
+        defaults to tf.contrib.data.AUTOTUNE.
+    :param data_range: Minimum and maximum of the whole set, see
+        BaseNoise.for_batches.
+    :return: Function transforming the dataset, to be passed to
+        tf.data.Dataset.apply.
+    """
+    if num_parallel_calls is None:
+        num_parallel_calls = tf.contrib.data.AUTOTUNE
+
+    def inject(batch_index: tf.Tensor, batch: Tuple[tf.Tensor, tf.Tensor]):
+        data, labels = batch
+        noisy_data = tf.py_func(
+            lambda data, batch_index: inject_batch_noise(
+                noise_functions, data, [seed, batch_index], data_range),
+            [data, batch_index], data.dtype, stateful=False)
+        noisy_data.set_shape(data.shape)
+        return noisy_data, labels
+
+    def transformation(dataset: tf.data.Dataset) -> tf.data.Dataset:
+        batch_indices = tf.data.Dataset.range(np.iinfo(np.int32).max)
+        return tf.data.Dataset.zip((batch_indices, dataset)).map(
+            inject, num_parallel_calls=num_parallel_calls)
+
+    return transformation
@@ -1,10 +1,15 @@
-from typing import Tuple, Union, List
+from typing import NamedTuple, Tuple, Union, List
 import functools
+import tempfile
+from multiprocessing.pool import ThreadPool
 
 import cv2
 import numpy as np
 
-from ml_intuition.data.utils import shuffle_arrays_together, get_label_indices_per_class
+from ml_intuition.data.dtype_policy import get_samples_dtype
+from ml_intuition.data.utils import get_label_indices_per_class
+
+DEFAULT_BLOCK_SIZE = 2 ** 16
 
 
 def normalize_labels(labels: np.ndarray) -> np.ndarray:
@@ -13,47 +18,202 @@ def normalize_labels(labels: np.ndarray) -> np.ndarray:
     :param labels: labels to normalize
     :return: Normalized labels
     """
-    for label_index, label in enumerate(np.unique(labels)):
-        labels[labels == label] = label_index
+    labels[...] = np.unique(labels, return_inverse=True)[1].reshape(
+        labels.shape)
     return labels
 
 
+def _empty_like_samples(shape: Tuple, dtype: np.dtype,
+                        temporary: bool) -> np.ndarray:
+    """
+    Allocate the output samples either in the memory or as a memory map
+    backed by a temporary file, which is removed once the map is released.
+    The callers pass the dtype given by get_samples_dtype, so the floating
+    point samples follow the dtype policy.
+    """
+    if temporary:
+        return np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+',
+                         shape=shape)
+    return np.empty(shape, dtype=dtype)
+
+
 def reshape_cube_to_2d_samples(data: np.ndarray,
                                labels: np.ndarray,
-                               channels_idx: int = 0) -> Tuple[
+                               channels_idx: int = 0,
+                               block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[
         np.ndarray, np.ndarray]:
     """
     Reshape the data and labels from [CHANNELS, HEIGHT, WIDTH] to [PIXEL,
-    CHANNELS, 1], so it fits the 2D Conv models
+    CHANNELS, 1], so it fits the 2D Conv models.
+    If the data is memory mapped, it is never loaded into the memory as
+    a whole. When the channels are the last axis, a view is returned,
+    otherwise the transposed samples are copied block by block to
+    a temporary memory map.
     :param data: Data to reshape.
     :param labels: Corresponding labels.
     :param channels_idx: Index at which the channels are located in the
                          provided data file
+    :param block_size: Number of pixels copied at once from the memory
+        mapped data.
     :return: Reshape data and labels
     :rtype: tuple with reshaped data and labels
     """
-    data = np.rollaxis(data, channels_idx, len(data.shape))
+    data = np.moveaxis(data, channels_idx, -1)
     height, width, channels = data.shape
-    data = data.reshape(height * width, channels)
-    data = np.expand_dims(data, -1)
     labels = labels.reshape(-1)
-    return data, labels
+    if not isinstance(data, np.memmap) or data.flags['C_CONTIGUOUS']:
+        data = data.reshape(height * width, channels)
+        return np.expand_dims(data, -1), labels
+    samples = _empty_like_samples((height * width, channels, 1),
+                                  get_samples_dtype(data.dtype),
+                                  temporary=True)
+    n_rows = max(1, block_size // width)
+    for row in range(0, height, n_rows):
+        block = data[row:row + n_rows]
+        samples[row * width:row * width + block.shape[0] * width, :, 0] = \
+            block.reshape(-1, channels)
+    return samples, labels
+
+
+def get_labelled_samples(data: np.ndarray,
+                         labels: np.ndarray,
+                         background_label: int = 0,
+                         channels_idx: int = 0,
+                         block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[
+        np.ndarray, np.ndarray]:
+    """
+    Gather samples of the pixels which do not belong to the background
+    directly from the [CHANNELS, HEIGHT, WIDTH] cube, block of rows at a time,
+    so the background pixels are never loaded into the memory.
+    If the data is memory mapped, the samples are stored in a temporary
+    memory map as well.
+    :param data: Data cube, possibly memory mapped.
+    :param labels: Corresponding labels with [HEIGHT, WIDTH] dimensions.
+    :param background_label: Label indicating the background.
+    :param channels_idx: Index at which the channels are located in the
+                         provided data file
+    :param block_size: Number of pixels read at once from the data.
+    :return: Labelled samples with [PIXEL, CHANNELS, 1] dimensions
+        and their labels
+    """
+    data = np.moveaxis(data, channels_idx, -1)
+    height, width, channels = data.shape
+    labels = np.asarray(labels).reshape(height, width)
+    is_labelled = labels != background_label
+    samples = _empty_like_samples(
+        (np.count_nonzero(is_labelled), channels, 1),
+        get_samples_dtype(data.dtype),
+        temporary=isinstance(data, np.memmap))
+    n_rows, start = max(1, block_size // width), 0
+    for row in range(0, height, n_rows):
+        block_mask = is_labelled[row:row + n_rows]
+        n_labelled = np.count_nonzero(block_mask)
+        if n_labelled == 0:
+            continue
+        samples[start:start + n_labelled, :, 0] = \
+            data[row:row + n_rows][block_mask]
+        start += n_labelled
+    return samples, labels[is_labelled]
+
+
+def _get_translation(x: float, y: float) -> np.ndarray:
+    """
+    Return the matrix translating the coordinates by the given offsets.
+    """
+    return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+
+
+def _get_source_window(transform: np.ndarray, rows: slice, cols: slice,
+                       source_shape: Tuple[int, int]) -> Tuple[slice, slice]:
+    """
+    Compute the window of the source covering all pixels mapped to the tile.
+    The transform is monotonic between the corners of the tile, so the window
+    is the bounding box of the projected corners extended by a margin
+    accounting for the rounding, starting at even coordinates. If the tile crosses the horizon of
+    the perspective transform the whole source is returned.
+    :param transform: Output to source transformation matrix.
+    :param rows: Rows of the tile.
+    :param cols: Columns of the tile.
+    :param source_shape: Height and width of the source.
+    :return: Rows and columns slices of the window.
+    """
+    corners = np.array([[cols.start, cols.start, cols.stop - 1,
+                         cols.stop - 1],
+                        [rows.start, rows.stop - 1, rows.start,
+                         rows.stop - 1],
+                        [1, 1, 1, 1]], dtype=np.float64)
+    x, y, w = transform @ corners
+    if np.any(w <= 0):
+        return slice(0, source_shape[0]), slice(0, source_shape[1])
+    x, y = x / w, y / w
+    # Even start keeps the exact .5 ties rounded half to even as in the source
+    return tuple(slice(int(np.clip(np.floor(c.min() / 2) * 2 - 2, 0, limit)),
+                       int(np.clip(np.ceil(c.max()) + 2, 0, limit)))
+                 for c, limit in [(y, source_shape[0]), (x, source_shape[1])])
 
 
 def align_ground_truth(cube_2d_shape: Tuple[int, int], ground_truth: np.ndarray,
-                       cube_to_gt_transform: np.ndarray) -> np.ndarray:
+                       cube_to_gt_transform: np.ndarray,
+                       tile_size: int = None,
+                       n_threads: int = None,
+                       out: np.ndarray = None) -> np.ndarray:
     """
     Align original labels to match the satellite hyperspectral cube using
-    transformation matrix
+    transformation matrix. If the tile size is provided, the output is
+    divided into tiles processed by a pool of threads, each tile reads only
+    the window of the ground truth it is mapped from and warps it by
+    cv2.warpPerspective with the matrix translated to the tile. The rounding
+    of the translated matrix may differ, so the labels of the pixels whose
+    source coordinates lie at the boundary between two source pixels may
+    differ from the warp of the whole raster.
     :param cube_2d_shape: Shape of the hyperspectral data cube
-    :param ground_truth: Original labels as 2D array
+    :param ground_truth: Original labels as 2D array, possibly memory mapped
     :param cube_to_gt_transform: Cube to ground truth transformation matrix
+    :param tile_size: Height and width of a single output tile. If None,
+        the whole raster is warped at once.
+    :param n_threads: Number of threads aligning the tiles,
+        defaults to the number of CPUs.
+    :param out: Optional array, e.g. memory map, to which the tiles are
+        written, it should have the shape of the output.
     :return: Transformed ground truth
     """
     gt_to_chan_transform = np.linalg.inv(cube_to_gt_transform)
-    gt_transformed = cv2.warpPerspective(ground_truth, gt_to_chan_transform,
-                                         cube_2d_shape, flags=cv2.INTER_NEAREST)
-    return gt_transformed
+    if tile_size is None:
+        gt_transformed = cv2.warpPerspective(ground_truth,
+                                             gt_to_chan_transform,
+                                             cube_2d_shape,
+                                             flags=cv2.INTER_NEAREST)
+        if out is None:
+            return gt_transformed
+        out[...] = gt_transformed
+        return out
+    width, height = cube_2d_shape
+    if out is None:
+        out = np.empty((height, width), dtype=ground_truth.dtype)
+
+    def align_tile(origin: Tuple[int, int]):
+        row, col = origin
+        rows, cols = slice(row, min(row + tile_size, height)), \
+                     slice(col, min(col + tile_size, width))
+        window_rows, window_cols = _get_source_window(
+            cube_to_gt_transform, rows, cols, ground_truth.shape)
+        if window_rows.start >= window_rows.stop or \
+                window_cols.start >= window_cols.stop:
+            out[rows, cols] = 0
+            return
+        tile_transform = _get_translation(-col, -row) @ \
+            gt_to_chan_transform @ \
+            _get_translation(window_cols.start, window_rows.start)
+        out[rows, cols] = cv2.warpPerspective(
+            np.ascontiguousarray(ground_truth[window_rows, window_cols]),
+            tile_transform, (cols.stop - col, rows.stop - row),
+            flags=cv2.INTER_NEAREST)
+
+    origins = [(row, col) for row in range(0, height, tile_size)
+               for col in range(0, width, tile_size)]
+    with ThreadPool(n_threads) as pool:
+        pool.map(align_tile, origins)
+    return out
 
 
 def remove_nan_samples(data: np.ndarray, labels: np.ndarray) -> Tuple[
@@ -71,6 +231,106 @@ def remove_nan_samples(data: np.ndarray, labels: np.ndarray) -> Tuple[
     return data, labels
 
 
+def filter_samples(data: np.ndarray, labels: np.ndarray,
+                   background_label: int = 0,
+                   remove_nan: bool = True,
+                   chunk_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[
+        np.ndarray, np.ndarray]:
+    """
+    Remove the background samples and optionally the samples containing nans
+    and normalize the labels in a single pass over the data. The kept samples
+    are gathered chunk by chunk directly to the output, so the data is
+    copied only once. If the data is memory mapped, the output is stored
+    in a temporary memory map as well.
+    :param data: Data with dimensions [SAMPLES, ...], possibly memory mapped
+    :param labels: Corresponding labels
+    :param background_label: Label indicating the background
+    :param remove_nan: Whether to remove samples containing nans
+    :param chunk_size: Number of samples processed at once
+    :return: Kept samples and their normalized labels
+    """
+    labels = np.asarray(labels)
+    keep = labels != background_label
+    samples = _empty_like_samples((np.count_nonzero(keep),) + data.shape[1:],
+                                  get_samples_dtype(data.dtype),
+                                  temporary=isinstance(data, np.memmap))
+    all_but_samples_axes = tuple(range(1, data.ndim))
+    n_kept = 0
+    for start in range(0, len(labels), chunk_size):
+        chunk_keep = keep[start:start + chunk_size]
+        if not np.any(chunk_keep):
+            continue
+        chunk = data[start:start + chunk_size][chunk_keep]
+        if remove_nan:
+            is_valid = ~np.isnan(chunk).any(axis=all_but_samples_axes)
+            chunk_keep[chunk_keep] = is_valid
+            chunk = chunk[is_valid]
+        samples[n_kept:n_kept + len(chunk)] = chunk
+        n_kept += len(chunk)
+    _, normalized_labels = np.unique(labels[keep], return_inverse=True)
+    return samples[:n_kept], normalized_labels.astype(labels.dtype)
+
+
+class SplitIndices(NamedTuple):
+    """
+    Indices of the train, validation and test subsets.
+    """
+    train: np.ndarray
+    val: np.ndarray
+    test: np.ndarray
+
+    def materialize(self, data: np.ndarray, labels: np.ndarray) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+            np.ndarray]:
+        """
+        Gather the subsets from the samples.
+
+        :param data: Data with the [SAMPLES, ...] dimensions
+        :param labels: Vector with corresponding labels
+        :return: train_x, train_y, val_x, val_y, test_x, test_y
+        """
+        return data[self.train], labels[self.train], data[self.val], \
+               labels[self.val], data[self.test], labels[self.test]
+
+
+def get_split_indices(labels: np.ndarray,
+                      train_size: Union[List, float, int] = 0.8,
+                      val_size: float = 0.1,
+                      stratified: bool = True,
+                      seed: int = 0) -> SplitIndices:
+    """
+    Compute indices of the train, val and test sets using only the labels,
+    so the samples are neither shuffled nor copied. The samples are drawn
+    from the permutation seeded with the given seed, so the resulting sets
+    are identical to shuffling the data and labels with
+    shuffle_arrays_together and splitting them afterwards.
+    For the description of the size parameters please refer to
+    train_val_test_split function.
+
+    :param labels: Vector with labels
+    :param train_size: Size of the train set
+    :param val_size: Size of the validation set
+    :param stratified: Indicated whether the extracted training set should be
+                     stratified, defaults to True
+    :param seed: Seed used for data shuffling
+    :return: Indices of the train, val and test sets in the provided labels
+    """
+    permutation = np.random.RandomState(seed).permutation(len(labels))
+    shuffled_labels = labels[permutation]
+    train_indices = _get_set_indices(train_size, shuffled_labels, stratified)
+    val_indices = _get_set_indices(val_size, shuffled_labels[train_indices])
+    val_indices = train_indices[val_indices]
+    in_train, in_val = np.zeros(len(labels), dtype=bool), \
+                       np.zeros(len(labels), dtype=bool)
+    in_train[train_indices] = True
+    in_val[val_indices] = True
+    test_indices = np.flatnonzero(~in_train)
+    train_indices = np.flatnonzero(in_train & ~in_val)
+    return SplitIndices(train=permutation[train_indices],
+                        val=permutation[val_indices],
+                        test=permutation[test_indices])
+
+
 def train_val_test_split(data: np.ndarray, labels: np.ndarray,
                          train_size: Union[List, float, int] = 0.8,
                          val_size: float = 0.1,
@@ -104,14 +364,8 @@ def train_val_test_split(data: np.ndarray, labels: np.ndarray,
     :return: train_x, train_y, val_x, val_y, test_x, test_y
     :raises AssertionError: When wrong type is passed as train_size
     """
-    shuffle_arrays_together([data, labels], seed=seed)
-    train_indices = _get_set_indices(train_size, labels,  stratified)
-    val_indices = _get_set_indices(val_size, labels[train_indices])
-    val_indices = train_indices[val_indices]
-    test_indices = np.setdiff1d(np.arange(len(data)), train_indices)
-    train_indices = np.setdiff1d(train_indices, val_indices)
-    return data[train_indices], labels[train_indices], data[val_indices], \
-           labels[val_indices], data[test_indices], labels[test_indices]
+    return get_split_indices(labels, train_size, val_size, stratified,
+                             seed).materialize(data, labels)
 
 
 @functools.singledispatch
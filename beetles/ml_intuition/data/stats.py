@@ -0,0 +1,197 @@
+"""
+Statistics of the samples accumulated in a single pass over chunks and
+stored as the attributes of the prepared .h5 datasets.
+"""
+
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from ml_intuition import enums
+
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+
+class StatsAccumulator:
+    """
+    Accumulator of the global and per-band min, max, mean and standard
+    deviation of the samples and the histogram of their classes. The mean
+    and the variance of each chunk are combined with the accumulated ones
+    by the parallel variant of the Welford's algorithm, so the result does
+    not depend on the number of chunks up to the floating point error.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.band_min = None
+        self.band_max = None
+        self.band_mean = None
+        self.band_m2 = None
+        self.class_counts = {}
+
+    def update(self, data: np.ndarray, labels: np.ndarray = None):
+        """
+        Accumulate the chunk of samples and their labels.
+
+        :param data: Samples with the bands in the second dimension.
+        :param labels: Labels of the samples.
+        """
+        if labels is not None:
+            for label, count in zip(*np.unique(labels, return_counts=True)):
+                self.class_counts[label] = \
+                    self.class_counts.get(label, 0) + int(count)
+        if len(data) == 0:
+            return
+        data = np.asarray(data).reshape(len(data), -1)
+        chunk = StatsAccumulator()
+        chunk.count = len(data)
+        chunk.band_min, chunk.band_max = np.amin(data, axis=0), \
+                                         np.amax(data, axis=0)
+        chunk.band_mean = np.mean(data, axis=0, dtype=np.float64)
+        chunk.band_m2 = np.sum(np.square(data - chunk.band_mean), axis=0,
+                               dtype=np.float64)
+        self.merge(chunk)
+
+    def merge(self, other: 'StatsAccumulator'):
+        """
+        Merge the statistics accumulated by another accumulator,
+        e.g. of another scene.
+
+        :param other: Accumulator to merge.
+        """
+        for label, count in other.class_counts.items():
+            self.class_counts[label] = self.class_counts.get(label, 0) + count
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.band_min, self.band_max, self.band_mean, \
+                self.band_m2 = other.count, other.band_min, other.band_max, \
+                other.band_mean, other.band_m2
+            return
+        count = self.count + other.count
+        delta = other.band_mean - self.band_mean
+        self.band_mean = self.band_mean + delta * other.count / count
+        self.band_m2 = self.band_m2 + other.band_m2 + \
+            np.square(delta) * self.count * other.count / count
+        self.band_min = np.minimum(self.band_min, other.band_min)
+        self.band_max = np.maximum(self.band_max, other.band_max)
+        self.count = count
+
+    @property
+    def band_std(self) -> np.ndarray:
+        return np.sqrt(self.band_m2 / self.count)
+
+    @property
+    def min(self) -> float:
+        return np.amin(self.band_min)
+
+    @property
+    def max(self) -> float:
+        return np.amax(self.band_max)
+
+    @property
+    def mean(self) -> float:
+        return np.mean(self.band_mean)
+
+    @property
+    def std(self) -> float:
+        m2 = np.sum(self.band_m2) + self.count * np.sum(
+            np.square(self.band_mean - self.mean))
+        return np.sqrt(m2 / (self.count * len(self.band_mean)))
+
+    def to_dict(self) -> Dict:
+        """
+        Return the statistics keyed by the names of the h5 attributes.
+        """
+        classes = np.array(sorted(self.class_counts))
+        return {enums.DataStats.MIN: self.min,
+                enums.DataStats.MAX: self.max,
+                enums.DataStats.MEAN: self.mean,
+                enums.DataStats.STD: self.std,
+                enums.DataStats.COUNT: self.count,
+                enums.DataStats.BAND_MIN: self.band_min,
+                enums.DataStats.BAND_MAX: self.band_max,
+                enums.DataStats.BAND_MEAN: self.band_mean,
+                enums.DataStats.BAND_M2: self.band_m2,
+                enums.DataStats.BAND_STD: self.band_std,
+                enums.DataStats.CLASSES: classes,
+                enums.DataStats.CLASS_COUNTS: np.array(
+                    [self.class_counts[label] for label in classes],
+                    dtype=np.int64)}
+
+    @classmethod
+    def from_dict(cls, stats: Dict) -> 'StatsAccumulator':
+        """
+        Restore the accumulator from the statistics returned by to_dict,
+        e.g. read from the h5 attributes.
+
+        :param stats: Dictionary, or attributes, with the statistics.
+        :return: Accumulator which can be merged with others.
+        """
+        accumulator = cls()
+        accumulator.count = int(stats[enums.DataStats.COUNT])
+        accumulator.band_min = np.asarray(stats[enums.DataStats.BAND_MIN])
+        accumulator.band_max = np.asarray(stats[enums.DataStats.BAND_MAX])
+        accumulator.band_mean = np.asarray(stats[enums.DataStats.BAND_MEAN])
+        accumulator.band_m2 = np.asarray(stats[enums.DataStats.BAND_M2])
+        accumulator.class_counts = {
+            label: int(count) for label, count in zip(
+                stats[enums.DataStats.CLASSES],
+                stats[enums.DataStats.CLASS_COUNTS])}
+        return accumulator
+
+
+def compute_stats(data: np.ndarray, labels: np.ndarray = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> StatsAccumulator:
+    """
+    Accumulate the statistics of the samples in a single pass over chunks.
+
+    :param data: Samples, possibly memory mapped or .h5 dataset.
+    :param labels: Labels of the samples.
+    :param chunk_size: Number of samples read at once.
+    :return: Accumulator holding the statistics.
+    """
+    accumulator = StatsAccumulator()
+    for start in range(0, len(data), chunk_size):
+        accumulator.update(
+            data[start:start + chunk_size],
+            None if labels is None else labels[start:start + chunk_size])
+    return accumulator
+
+
+def merge_stats(accumulators: Iterable[StatsAccumulator]) -> StatsAccumulator:
+    """
+    Merge the statistics of several datasets, e.g. scenes.
+
+    :param accumulators: Accumulators to merge.
+    :return: Accumulator of all datasets.
+    """
+    merged = StatsAccumulator()
+    for accumulator in accumulators:
+        merged.merge(accumulator)
+    return merged
+
+
+def write_stats(attrs: Dict, accumulator: StatsAccumulator):
+    """
+    Store the statistics, e.g. as the attributes of the .h5 file.
+
+    :param attrs: Attributes or the data dict to which the statistics
+        are written.
+    :param accumulator: Accumulator holding the statistics.
+    """
+    for key, value in accumulator.to_dict().items():
+        attrs[key] = value
+
+
+def read_stats(attrs: Dict) -> Optional[StatsAccumulator]:
+    """
+    Read the statistics stored by write_stats.
+
+    :param attrs: Attributes or the data dict holding the statistics.
+    :return: Accumulator holding the statistics or None if they were not
+        stored, e.g. in the datasets prepared before they were introduced.
+    """
+    if enums.DataStats.COUNT not in attrs:
+        return None
+    return StatsAccumulator.from_dict(attrs)
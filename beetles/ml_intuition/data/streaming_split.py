@@ -0,0 +1,201 @@
+"""
+Stratified train, validation and test split of labels which do not fit in
+the memory, e.g. memory mapped or stored in the .h5 file. The labels are read
+sequentially in chunks and the indices of the subsets are written to .npy
+files, so the memory usage depends only on the size of the chunk.
+"""
+
+import os
+from typing import Dict, List, Union
+
+import numpy as np
+
+from ml_intuition.data.preprocessing import SplitIndices
+
+DEFAULT_CHUNK_SIZE = 2 ** 20
+INDICES_DTYPE = np.int64
+
+
+def count_classes(labels: np.ndarray,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[int, int]:
+    """
+    Count the samples of each class in a single pass over the labels.
+
+    :param labels: Vector of labels, possibly memory mapped or .h5 dataset.
+    :param chunk_size: Number of labels read at once.
+    :return: Dictionary with the number of samples of each class.
+    """
+    class_counts = {}
+    for start in range(0, len(labels), chunk_size):
+        for label, count in zip(*np.unique(labels[start:start + chunk_size],
+                                           return_counts=True)):
+            class_counts[label] = class_counts.get(label, 0) + int(count)
+    return class_counts
+
+
+def get_set_sizes(size: Union[List, float, int], class_counts: np.ndarray,
+                  stratified: bool = True) -> np.ndarray:
+    """
+    Compute the number of samples drawn from each class following
+    the semantics of the size parameter of train_val_test_split.
+
+    :param size: Size of the subset, float, int or list of ints.
+    :param class_counts: Number of samples of each class.
+    :param stratified: Whether the subset should be stratified, ignored if
+        the size is a list.
+    :return: Number of samples of each class, or a single element array
+        with the number of samples regardless of their class, if the subset
+        is not stratified.
+    """
+    if isinstance(size, list):
+        sizes = class_counts.copy()
+        n_classes = min(len(size), len(sizes))
+        sizes[:n_classes] = np.minimum(np.array(size[:n_classes], dtype=int),
+                                       sizes[:n_classes])
+        return sizes
+    counts = class_counts if stratified else \
+        np.array([np.sum(class_counts)])
+    if isinstance(size, float):
+        assert 0 <= size <= 1
+        return (counts * size).astype(int)
+    assert size >= 1
+    return np.minimum(size, counts)
+
+
+def _draw(groups: np.ndarray, needed: np.ndarray, remaining: np.ndarray,
+          random_state: np.random.RandomState) -> np.ndarray:
+    """
+    Draw samples of the chunk without replacement, so that in each group the
+    needed samples are drawn uniformly from all remaining samples of the group.
+    The number of samples drawn from the chunk follows the hypergeometric
+    distribution. The needed and remaining counts are updated in-place.
+
+    :param groups: Group of each sample in the chunk.
+    :param needed: Number of samples still to be drawn from each group.
+    :param remaining: Number of samples of each group not yet visited.
+    :param random_state: Random state used for drawing.
+    :return: Mask of the drawn samples.
+    """
+    in_chunk = np.bincount(groups, minlength=len(needed))
+    drawn = np.zeros_like(needed)
+    for group in np.flatnonzero(in_chunk):
+        if needed[group] == remaining[group]:
+            drawn[group] = in_chunk[group]
+        elif needed[group] > 0:
+            drawn[group] = random_state.hypergeometric(
+                needed[group], remaining[group] - needed[group],
+                in_chunk[group])
+    order = np.lexsort((random_state.random_sample(len(groups)), groups))
+    sorted_groups = groups[order]
+    rank = np.arange(len(groups)) - \
+        np.searchsorted(sorted_groups, sorted_groups)
+    mask = np.zeros(len(groups), dtype=bool)
+    mask[order] = rank < drawn[sorted_groups]
+    needed -= drawn
+    remaining -= in_chunk
+    return mask
+
+
+def stream_split_indices(labels: np.ndarray, dest_dir: str,
+                         train_size: Union[List, float, int] = 0.8,
+                         val_size: float = 0.1,
+                         stratified: bool = True,
+                         seed: int = 0,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> SplitIndices:
+    """
+    Split the labels into train, val and test sets without loading them into
+    the memory. The sizes of the sets are the same as in
+    train_val_test_split. The first pass counts the classes, the second one
+    draws the training samples and the test set is formed by the remaining
+    ones. The third pass draws the validation samples from the training set.
+    The split is deterministic for the given seed and chunk size.
+
+    :param labels: Vector of labels, possibly memory mapped or .h5 dataset.
+    :param dest_dir: Directory in which the "train.npy", "val.npy" and
+        "test.npy" files with sorted indices of each set are stored.
+    :param train_size: Size of the training set, for the description
+        please refer to train_val_test_split.
+    :param val_size: Size of the validation set drawn from the training set.
+    :param stratified: Whether the training set should be stratified.
+    :param seed: Seed used for drawing the samples.
+    :param chunk_size: Number of labels read at once.
+    :return: Memory mapped indices of the train, val and test sets.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    random_state = np.random.RandomState(seed)
+    class_counts = count_classes(labels, chunk_size)
+    classes = np.array(sorted(class_counts))
+    counts = np.array([class_counts[label] for label in classes])
+    group_train = stratified or isinstance(train_size, list)
+    needed = get_set_sizes(train_size, counts, stratified)
+    remaining = counts.copy() if group_train else np.array([len(labels)])
+
+    paths = {name: os.path.join(dest_dir, '{}.npy'.format(name))
+             for name in ['train', 'val', 'test', 'train_val']}
+    n_train = int(np.sum(needed))
+    train_val = np.lib.format.open_memmap(paths['train_val'], mode='w+',
+                                          dtype=INDICES_DTYPE,
+                                          shape=(n_train,))
+    test = np.lib.format.open_memmap(paths['test'], mode='w+',
+                                     dtype=INDICES_DTYPE,
+                                     shape=(len(labels) - n_train,))
+    train_counts = np.zeros(len(classes), dtype=int)
+    n_drawn, n_left = 0, 0
+    for start in range(0, len(labels), chunk_size):
+        chunk_classes = np.searchsorted(
+            classes, labels[start:start + chunk_size])
+        groups = chunk_classes if group_train else \
+            np.zeros_like(chunk_classes)
+        is_train = _draw(groups, needed, remaining, random_state)
+        indices = np.arange(start, start + len(chunk_classes),
+                            dtype=INDICES_DTYPE)
+        train_val[n_drawn:n_drawn + np.count_nonzero(is_train)] = \
+            indices[is_train]
+        test[n_left:n_left + np.count_nonzero(~is_train)] = indices[~is_train]
+        train_counts += np.bincount(chunk_classes[is_train],
+                                    minlength=len(classes))
+        n_drawn += np.count_nonzero(is_train)
+        n_left += np.count_nonzero(~is_train)
+
+    needed = get_set_sizes(val_size, train_counts)
+    remaining = train_counts.copy()
+    n_val = int(np.sum(needed))
+    val = np.lib.format.open_memmap(paths['val'], mode='w+',
+                                    dtype=INDICES_DTYPE, shape=(n_val,))
+    train = np.lib.format.open_memmap(paths['train'], mode='w+',
+                                      dtype=INDICES_DTYPE,
+                                      shape=(n_train - n_val,))
+    n_drawn, n_left, position = 0, 0, 0
+    for start in range(0, len(labels), chunk_size):
+        stop = np.searchsorted(train_val, start + chunk_size)
+        indices = np.asarray(train_val[position:stop])
+        position = stop
+        if len(indices) == 0:
+            continue
+        chunk_labels = labels[start:start + chunk_size]
+        is_val = _draw(np.searchsorted(classes, chunk_labels[indices - start]),
+                       needed, remaining, random_state)
+        val[n_drawn:n_drawn + np.count_nonzero(is_val)] = indices[is_val]
+        train[n_left:n_left + np.count_nonzero(~is_val)] = indices[~is_val]
+        n_drawn += np.count_nonzero(is_val)
+        n_left += np.count_nonzero(~is_val)
+
+    for indices in [train_val, test, val, train]:
+        indices.flush()
+    del train_val
+    os.remove(paths['train_val'])
+    return load_split_indices(dest_dir)
+
+
+def load_split_indices(split_dir: str) -> SplitIndices:
+    """
+    Memory map the indices of the split stored by stream_split_indices.
+
+    :param split_dir: Directory with the "train.npy", "val.npy"
+        and "test.npy" files.
+    :return: Indices of the train, val and test sets.
+    """
+    return SplitIndices(**{
+        name: np.load(os.path.join(split_dir, '{}.npy'.format(name)),
+                      mmap_mode='r')
+        for name in SplitIndices._fields})
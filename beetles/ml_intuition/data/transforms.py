@@ -8,6 +8,11 @@ from typing import List, Dict
 import numpy as np
 
 from ml_intuition import enums
+from ml_intuition.data.dtype_policy import cast_to_floatx, floatx
+
+DEFAULT_CHUNK_SIZE = 2 ** 14
+# Range of the train set normalized by MinMaxNormalize with its own statistics
+NORMALIZED_RANGE = (0., 1.)
 
 
 class BaseTransform(abc.ABC):
@@ -33,12 +38,13 @@ class SpectralTransform(BaseTransform):
         """
         Transform 1D samples along the spectral axis.
         Only the spectral features are present for each sample in the dataset.
+        The samples are cast to the floating point dtype of the dtype policy.
 
         :param sample: Input sample that will undergo transformation.
         :param label: Class value for each sample.
         :return: List containing the transformed sample and the class label.
         """
-        return [np.expand_dims(sample.astype(np.float32), -1), label]
+        return [np.expand_dims(cast_to_floatx(sample), -1), label]
 
 
 class OneHotEncode(BaseTransform):
@@ -59,9 +65,9 @@ class OneHotEncode(BaseTransform):
         :param label: Class value for each sample that will undergo one-hot encoding.
         :return: List containing the sample and the one-hot encoded class label.
         """
-        out_label = np.zeros((label.size, self.n_classes))
+        out_label = np.zeros((label.size, self.n_classes), dtype=np.uint8)
         out_label[np.arange(label.size), label] = 1
-        return [sample, out_label.astype(np.uint8)]
+        return [sample, out_label]
 
 
 class MinMaxNormalize(BaseTransform):
@@ -69,8 +75,8 @@ class MinMaxNormalize(BaseTransform):
         """
         Normalize each sample.
 
-        :param min_: Minimum value of features.
-        :param max_: Maximum value of features.
+        :param min_: Minimum value of features, either global or of each band.
+        :param max_: Maximum value of features, either global or of each band.
         """
         super().__init__()
         self.min_ = min_
@@ -78,13 +84,24 @@ class MinMaxNormalize(BaseTransform):
 
     def __call__(self, sample: np.ndarray, label: np.ndarray) -> List[np.ndarray]:
         """"
-        Perform min-max normalization on incoming samples.
+        Perform min-max normalization on incoming samples. The minimum and
+        maximum are cast to the dtype of the floating point samples,
+        other samples are cast to the dtype of the dtype policy, so
+        the normalized samples are never upcast.
 
         :param sample: Input sample that will undergo transformation.
         :param label: Class value for each sample.
         :return: List containing the normalized sample and the class label.
         """
-        return [(sample - self.min_) / (self.max_ - self.min_), label]
+        if not np.issubdtype(sample.dtype, np.floating):
+            sample = cast_to_floatx(sample)
+        min_, max_ = [np.asarray(value, dtype=sample.dtype)
+                      for value in [self.min_, self.max_]]
+        if np.ndim(min_) > 0:
+            min_, max_ = [np.reshape(value, np.shape(value) +
+                                     (1,) * (sample.ndim - 2))
+                          for value in [min_, max_]]
+        return [(sample - min_) / (max_ - min_), label]
 
 
 def apply_transformations(data: Dict,
@@ -99,3 +116,97 @@ def apply_transformations(data: Dict,
         data[enums.Dataset.DATA], data[enums.Dataset.LABELS] = transformation(
             data[enums.Dataset.DATA], data[enums.Dataset.LABELS])
     return data
+
+
+class FusedTransform(BaseTransform):
+    def __init__(self, transformations: List[BaseTransform],
+                 inplace: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Fusion of the SpectralTransform with the following MinMaxNormalize
+        and OneHotEncode transformations. The samples are cast and normalized
+        chunk by chunk in a single pass into the output in the floating point
+        dtype of the dtype policy, instead of
+        creating a full-size intermediate array for each transformation.
+
+        :param transformations: SpectralTransform followed by
+            the MinMaxNormalize and OneHotEncode transformations.
+        :param inplace: Whether to normalize writable samples in the policy
+            dtype in-place instead of writing them into a new array.
+        :param chunk_size: Number of samples processed at once.
+        """
+        super().__init__()
+        assert isinstance(transformations[0], SpectralTransform)
+        self.normalizations = [transformation
+                               for transformation in transformations
+                               if isinstance(transformation, MinMaxNormalize)]
+        self.label_transformations = [
+            transformation for transformation in transformations
+            if isinstance(transformation, OneHotEncode)]
+        assert len(self.normalizations) + len(self.label_transformations) \
+            == len(transformations) - 1, 'Only the MinMaxNormalize and ' \
+                                         'OneHotEncode can be fused.'
+        self.inplace = inplace
+        self.chunk_size = chunk_size
+
+    def __call__(self, sample: np.ndarray, label: np.ndarray,
+                 out: np.ndarray = None) -> List[np.ndarray]:
+        """
+        Transform the samples and their labels.
+
+        :param sample: Input sample that will undergo transformation.
+        :param label: Class value for each sample.
+        :param out: Preallocated array in the policy dtype for
+            the transformed samples, e.g. memory mapped, with the shape
+            of the input samples optionally expanded by the last dimension.
+        :return: List containing the transformed sample and the class label.
+        """
+        if out is None:
+            if self.inplace and isinstance(sample, np.ndarray) and \
+                    sample.dtype == floatx() and sample.flags.writeable:
+                out = sample
+            else:
+                out = np.empty(sample.shape, dtype=floatx())
+        out = out.reshape(sample.shape)
+        for start in range(0, len(sample), self.chunk_size):
+            chunk = out[start:start + self.chunk_size]
+            if out is not sample:
+                chunk[...] = sample[start:start + self.chunk_size]
+            for normalization in self.normalizations:
+                chunk -= out.dtype.type(normalization.min_)
+                chunk /= out.dtype.type(normalization.max_ -
+                                        normalization.min_)
+        for transformation in self.label_transformations:
+            _, label = transformation(None, label)
+        return [np.expand_dims(out, -1), label]
+
+
+def compile_transformations(transformations: List[BaseTransform],
+                            inplace: bool = False,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE) -> \
+        List[BaseTransform]:
+    """
+    Replace each SpectralTransform followed by the MinMaxNormalize and
+    OneHotEncode transformations with their FusedTransform. The remaining
+    transformations, e.g. the noise injection, are kept unchanged.
+
+    :param transformations: List of transformations.
+    :param inplace: Whether the fused transformations may normalize
+        the samples in the policy dtype in-place.
+    :param chunk_size: Number of samples processed at once.
+    :return: List of transformations giving the same result.
+    """
+    compiled, fused = [], []
+    for transformation in transformations + [None]:
+        if fused and isinstance(transformation,
+                                (MinMaxNormalize, OneHotEncode)):
+            fused.append(transformation)
+            continue
+        if fused:
+            compiled.append(FusedTransform(fused, inplace, chunk_size))
+            fused = []
+        if isinstance(transformation, SpectralTransform):
+            fused.append(transformation)
+        elif transformation is not None:
+            compiled.append(transformation)
+    return compiled
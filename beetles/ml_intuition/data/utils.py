@@ -10,6 +10,8 @@ import numpy as np
 import tensorflow as tf
 
 from ml_intuition import enums
+from ml_intuition.data.stats import StatsAccumulator, compute_stats, \
+    merge_stats, read_stats, write_stats
 from ml_intuition.data.transforms import BaseTransform
 
 SAMPLES_DIM = 0
@@ -90,7 +92,8 @@ def freeze_session(session: tf.Session,
     return frozen_graph
 
 
-def build_data_dict(train_x, train_y, val_x, val_y, test_x, test_y) -> Dict:
+def build_data_dict(train_x, train_y, val_x, val_y, test_x, test_y,
+                    stats: StatsAccumulator = None) -> Dict:
     """
     Build data dictionary with following structure:
     'train':
@@ -104,6 +107,7 @@ def build_data_dict(train_x, train_y, val_x, val_y, test_x, test_y) -> Dict:
         'labels' np.ndarray
     'min': float
     'max': float
+    and the remaining statistics of the train set, see stats.StatsAccumulator.
 
     :param train_x: Train set
     :param train_y: Train labels
@@ -111,12 +115,14 @@ def build_data_dict(train_x, train_y, val_x, val_y, test_x, test_y) -> Dict:
     :param val_y: Validation labels
     :param test_x: Test set
     :param test_y: Test labels
+    :param stats: Statistics of the train set, e.g. read from the .h5 file.
+        If None, they are computed in a single pass over the train set.
     :return: Dictionary containing train, validation and test subsets.
     """
     data_dict = {}
-    train_min, train_max = np.amin(train_x), np.amax(train_x)
-    data_dict[enums.DataStats.MIN] = train_min
-    data_dict[enums.DataStats.MAX] = train_max
+    if stats is None:
+        stats = compute_stats(train_x, train_y)
+    write_stats(data_dict, stats)
 
     data_dict[enums.Dataset.TRAIN] = {}
     data_dict[enums.Dataset.TRAIN][enums.Dataset.DATA] = train_x
@@ -151,10 +157,13 @@ def merge_datasets(dataset: List[Dict]):
     merged_dataset[enums.Dataset.VAL][enums.Dataset.LABELS] = np.concatenate(
         [dataset[enums.Dataset.VAL][enums.Dataset.LABELS] for dataset in
          dataset], axis=0)
-    merged_dataset[enums.DataStats.MIN] = np.amin(
-        merged_dataset[enums.Dataset.TRAIN][enums.Dataset.DATA])
-    merged_dataset[enums.DataStats.MAX] = np.amax(
-        merged_dataset[enums.Dataset.TRAIN][enums.Dataset.DATA])
+    scenes_stats = [read_stats(dataset) for dataset in dataset]
+    if any(scene_stats is None for scene_stats in scenes_stats):
+        scenes_stats = [compute_stats(
+            dataset[enums.Dataset.TRAIN][enums.Dataset.DATA],
+            dataset[enums.Dataset.TRAIN][enums.Dataset.LABELS])
+            for dataset in dataset]
+    write_stats(merged_dataset, merge_stats(scenes_stats))
     return merged_dataset
 
 
@@ -176,15 +185,27 @@ def restructure_per_class_accuracy(metrics: Dict[str, List[float]]) -> Dict[
     return metrics
 
 
-def predict_with_graph_in_batches(session: tf.Session, input_node: str,
-                                  output_node: str, data: np.ndarray,
+def predict_with_graph_in_batches(session: tf.Session, input_node: tf.Tensor,
+                                  output_node: tf.Tensor, data: np.ndarray,
                                   batch_size: int = 16384):
-    batches = np.array_split(data, len(data) // batch_size)
+    """
+    Predict the classes of the samples with the graph run by the session.
+    The argmax is added to the graph once per call and only the predicted
+    classes are fetched. For the repeated inference please refer to
+    ml_intuition.evaluation.graph_inference.GraphInference.
+    :param session: Session of the graph.
+    :param input_node: Input tensor of the graph.
+    :param output_node: Output tensor of the graph with the class scores.
+    :param data: Samples to predict.
+    :param batch_size: Number of samples in a single batch.
+    :return: Predicted classes.
+    """
+    with session.graph.as_default():
+        predictions = tf.argmax(output_node, axis=-1)
     outputs = []
-    for batch in batches:
-        prediction = session.run(output_node, feed_dict={input_node: batch})
-        prediction = session.run(tf.argmax(prediction, axis=-1))
-        outputs.append(prediction)
+    for start in range(0, len(data), batch_size):
+        outputs.append(session.run(predictions, feed_dict={
+            input_node: data[start:start + batch_size]}))
     return np.concatenate(outputs, axis=0)
 
 
@@ -253,3 +274,31 @@ def get_label_indices_per_class(labels, return_uniques: bool = True):
         return label_indices, unique_labels
     else:
         return label_indices
+
+
+def draw_stratified_indices(labels: np.ndarray, n_samples: int,
+                            random_state: np.random.RandomState = None) -> \
+        np.ndarray:
+    """
+    Draw the indices of exactly n_samples samples preserving the class
+    proportions of the labels. The floored share of each class is topped up
+    by the classes with the largest remainders, so the subset is always full.
+
+    :param labels: Vector of labels.
+    :param n_samples: Number of the drawn samples, at most the number of
+        the labels.
+    :param random_state: Random state used for drawing, defaults to
+        the global numpy random state.
+    :return: Indices of the drawn samples grouped by class.
+    """
+    random_state = np.random if random_state is None else random_state
+    n_samples = min(n_samples, len(labels))
+    label_indices = get_label_indices_per_class(labels, return_uniques=False)
+    quotas = np.array([len(indices) for indices in label_indices]) * \
+        n_samples / len(labels)
+    sizes = np.floor(quotas).astype(int)
+    sizes[np.argsort(sizes - quotas, kind='stable')[
+          :n_samples - sizes.sum()]] += 1
+    return np.concatenate(
+        [random_state.choice(indices, size, replace=False)
+         for indices, size in zip(label_indices, sizes)]).astype(int)
@@ -12,6 +12,9 @@ class Experiment(aenum.Constant):
     INFERENCE_METRICS = 'inference_metrics.csv'
     INFERENCE_GRAPH_METRICS = 'inference_graph_metrics.csv'
     INFERENCE_FAIR_METRICS = 'inference_fair_metrics.csv'
+    ROBUSTNESS_METRICS = 'robustness_metrics.csv'
+    CLASS_MAP = 'class_map'
+    PROBABILITY_MAP = 'probability_map'
     EXPERIMENT = 'experiment'
     REPORT = 'report.csv'
     REPORT_FAIR = 'report-fair.csv'
@@ -35,6 +38,21 @@ class SatelliteH5Keys(aenum.Constant):
 class DataStats(aenum.Constant):
     MIN = 'min'
     MAX = 'max'
+    MEAN = 'mean'
+    STD = 'std'
+    COUNT = 'count'
+    BAND_MIN = 'band_min'
+    BAND_MAX = 'band_max'
+    BAND_MEAN = 'band_mean'
+    BAND_M2 = 'band_m2'
+    BAND_STD = 'band_std'
+    CLASSES = 'classes'
+    CLASS_COUNTS = 'class_counts'
+
+
+class StorageAttrs(aenum.Constant):
+    SCALE = 'scale'
+    OFFSET = 'offset'
 
 
 class NodeNames(aenum.Constant):
@@ -42,6 +60,13 @@ class NodeNames(aenum.Constant):
     OUTPUT = 'output_node'
 
 
+class InferenceOutputs(aenum.Constant):
+    PREDICTIONS = 'predictions'
+    PROBABILITIES = 'probabilities'
+    TOP_K_CLASSES = 'top_k_classes'
+    TOP_K_PROBABILITIES = 'top_k_probabilities'
+
+
 class MLflowTags(aenum.Constant):
     SPLIT = 'split'
     FOLD = 'fold'
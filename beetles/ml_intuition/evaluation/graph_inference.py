@@ -0,0 +1,170 @@
+"""
+Inference with the frozen, possibly quantized, graph.
+"""
+
+from multiprocessing.pool import ThreadPool
+from time import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from ml_intuition import enums
+
+DEFAULT_BATCH_SIZE = 16384
+N_BUFFERS = 2
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+class GraphInference:
+    def __init__(self, graph: tf.Graph, input_node: str, output_node: str,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 probabilities: bool = False, top_k: int = None,
+                 session_config: tf.ConfigProto = None):
+        """
+        Persistent session running the frozen graph in batches. The argmax,
+        and optionally the top-k classes, are built into the graph once,
+        so only the requested outputs of each batch are transferred to
+        the host. The batches are staged in the preallocated buffers by
+        a background thread, so the next batch is prepared while
+        the current one is processed.
+
+        :param graph: Frozen graph.
+        :param input_node: Name of the input node.
+        :param output_node: Name of the output node with the class scores.
+        :param batch_size: Number of samples in a single batch. Ignored if
+            the input node of the graph has the fixed batch size.
+        :param probabilities: Whether to fetch the class scores.
+        :param top_k: Number of the most probable classes to fetch with
+            their scores. If None, top-k classes are not fetched.
+        :param session_config: Configuration of the session.
+        """
+        self.graph = graph
+        self.batch_size = batch_size
+        self.input_tensor = graph.get_tensor_by_name(input_node + ':0')
+        output_tensor = graph.get_tensor_by_name(output_node + ':0')
+        with graph.as_default():
+            self.fetches = {enums.InferenceOutputs.PREDICTIONS:
+                                tf.argmax(output_tensor, axis=-1)}
+            if probabilities:
+                self.fetches[enums.InferenceOutputs.PROBABILITIES] = \
+                    output_tensor
+            if top_k is not None:
+                top_k_probabilities, top_k_classes = tf.nn.top_k(
+                    output_tensor, k=top_k)
+                self.fetches[enums.InferenceOutputs.TOP_K_CLASSES] = \
+                    top_k_classes
+                self.fetches[enums.InferenceOutputs.TOP_K_PROBABILITIES] = \
+                    top_k_probabilities
+        self.session = tf.Session(graph=graph, config=session_config)
+        self.input_dtype = np.dtype(self.input_tensor.dtype.as_numpy_dtype)
+        self.fixed_batch_size = self.input_tensor.shape.as_list()[0] \
+            if self.input_tensor.shape.ndims else None
+        if self.fixed_batch_size is not None:
+            self.batch_size = self.fixed_batch_size
+        self.buffers = []
+        self.latencies = []
+        self.n_samples, self.total_time = 0, 0.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _needs_staging(self, data: np.ndarray) -> bool:
+        """
+        Check whether the batches have to be copied into the buffers.
+        Batches of the contiguous samples already in the input dtype are
+        passed without a copy, other ones, e.g. memory mapped, or all
+        batches of the graph with the fixed batch size, are staged.
+        """
+        return self.fixed_batch_size is not None or \
+            type(data) is not np.ndarray or \
+            data.dtype != self.input_dtype or not data.flags['C_CONTIGUOUS']
+
+    def _stage(self, data: np.ndarray, start: int,
+               buffer_index: int) -> np.ndarray:
+        """
+        Copy the batch starting at the given sample into the buffer.
+        """
+        batch = data[start:start + self.batch_size]
+        buffer = self.buffers[buffer_index]
+        buffer[:len(batch)] = batch
+        return buffer if self.fixed_batch_size is not None \
+            else buffer[:len(batch)]
+
+    def predict(self, data: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Run the graph on the samples batch by batch. If the batches have to
+        be copied, the next batch is staged by the background thread while
+        the current one is processed. The time of processing each batch is
+        stored in the latencies attribute and the time of the whole
+        prediction in the total_time attribute.
+
+        :param data: Samples, possibly memory mapped.
+        :return: Dictionary with the predicted classes and the other
+            requested outputs of each sample.
+        """
+        self.latencies, self.n_samples = [], len(data)
+        outputs, prediction_start = {}, time()
+        for start, batch in self._get_batches(data):
+            batch_start = time()
+            batch_outputs = self.session.run(
+                self.fetches, feed_dict={self.input_tensor: batch})
+            self.latencies.append(time() - batch_start)
+            n_samples = min(self.batch_size, len(data) - start)
+            for key, value in batch_outputs.items():
+                if key not in outputs:
+                    outputs[key] = np.empty(
+                        (len(data),) + value.shape[1:], dtype=value.dtype)
+                outputs[key][start:start + n_samples] = value[:n_samples]
+        self.total_time = time() - prediction_start
+        return outputs
+
+    def _get_batches(self, data: np.ndarray) -> Iterator[
+            Tuple[int, np.ndarray]]:
+        """
+        Yield the batches of the samples with their starts. The staged
+        batches alternate between the preallocated buffers, so the batch
+        being staged never overwrites the one being processed.
+        """
+        starts = range(0, len(data), self.batch_size)
+        if not self._needs_staging(data):
+            for start in starts:
+                yield start, data[start:start + self.batch_size]
+            return
+        buffer_shape = (self.batch_size,) + data.shape[1:]
+        if not self.buffers or self.buffers[0].shape != buffer_shape:
+            self.buffers = [np.zeros(buffer_shape, dtype=self.input_dtype)
+                            for _ in range(N_BUFFERS)]
+        with ThreadPool(1) as pool:
+            staged = pool.apply_async(self._stage, (data, 0, 0))
+            for index, start in enumerate(starts):
+                batch = staged.get()
+                if index + 1 < len(starts):
+                    staged = pool.apply_async(
+                        self._stage, (data, starts[index + 1],
+                                      (index + 1) % N_BUFFERS))
+                yield start, batch
+
+    def get_latency_stats(self,
+                          percentiles: List[int] = None) -> Dict[str, float]:
+        """
+        Summarize the latencies of the batches of the last prediction.
+
+        :param percentiles: Percentiles of the latency to report.
+        :return: Dictionary with the throughput in samples per second and
+            the percentiles of the batch latency in milliseconds.
+        """
+        percentiles = percentiles or LATENCY_PERCENTILES
+        latencies = np.array(self.latencies) * 1000
+        stats = {'batch_size': self.batch_size,
+                 'samples_per_second': self.n_samples / self.total_time}
+        for percentile, value in zip(percentiles,
+                                     np.percentile(latencies, percentiles)):
+            stats['latency_p{}_ms'.format(percentile)] = value
+        return stats
@@ -0,0 +1,395 @@
+"""
+Local inference service classifying the pixel spectra with the models kept
+loaded in memory. Concurrent requests of each model are coalesced into
+micro-batches, limited by the maximum number of samples and the maximum
+time the first request waits for the others. The service listens on
+the Unix socket or the TCP "host:port" address.
+
+Each message consists of the length of the JSON header, the header
+describing the dtype and shape of the attached arrays, and the raw data
+of the arrays. The request carries the samples and the name of the model,
+the response the predicted classes and their probabilities, or the error.
+The samples are the raw pixel spectra with [PIXEL, CHANNELS] dimensions,
+[PIXEL, CHANNELS, 1] samples of the datasets are accepted as well. They are
+reshaped by the service to [PIXEL, CHANNELS, 1], so the normalization yields
+the [PIXEL, CHANNELS, 1, 1] input of the 2D models.
+"""
+
+import asyncio
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ml_intuition.data import io, transforms
+from ml_intuition.evaluation.scene_inference import classify_tile, \
+    load_predict
+
+DEFAULT_MAX_BATCH_SIZE = 4096
+DEFAULT_MAX_WAIT = 0.002
+NODE_NAMES_FILE = 'freeze_input_output_node_name.json'
+MIN_MAX_FILE = 'min-max.csv'
+LATENCY_PERCENTILES = [50, 95, 99]
+HEADER_LENGTH = struct.Struct('!I')
+ARRAYS, ERROR, MODEL = 'arrays', 'error', 'model'
+
+Predict = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+def encode_message(header: Dict, arrays: List[np.ndarray]) -> bytes:
+    """
+    Encode the header and the arrays into a single message.
+
+    :param header: JSON serializable header.
+    :param arrays: Arrays attached to the message.
+    :return: Encoded message.
+    """
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    header = dict(header, **{ARRAYS: [[array.dtype.str, list(array.shape)]
+                                      for array in arrays]})
+    header = json.dumps(header).encode()
+    return b''.join([HEADER_LENGTH.pack(len(header)), header] +
+                    [array.tobytes() for array in arrays])
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[
+        Dict, List[np.ndarray]]:
+    """
+    Read the message encoded by the encode_message function.
+
+    :param reader: Reader of the connection.
+    :return: Header and the attached arrays.
+    :raises asyncio.IncompleteReadError: When the connection is closed.
+    """
+    header_length, = HEADER_LENGTH.unpack(
+        await reader.readexactly(HEADER_LENGTH.size))
+    header = json.loads((await reader.readexactly(header_length)).decode())
+    arrays = []
+    for dtype, shape in header.pop(ARRAYS):
+        dtype = np.dtype(dtype)
+        data = await reader.readexactly(
+            int(np.prod(shape)) * dtype.itemsize)
+        arrays.append(np.frombuffer(data, dtype=dtype).reshape(shape))
+    return header, arrays
+
+
+def to_samples(array: np.ndarray) -> np.ndarray:
+    """
+    Reshape the pixel spectra of the request to the samples with
+    [PIXEL, CHANNELS, 1] dimensions.
+
+    :param array: Pixel spectra with [PIXEL, CHANNELS] or
+        [PIXEL, CHANNELS, 1] dimensions.
+    :return: Samples with [PIXEL, CHANNELS, 1] dimensions.
+    :raises ValueError: When the array has other dimensions.
+    """
+    if array.ndim == 2 or array.ndim == 3 and array.shape[-1] == 1:
+        return array.reshape(len(array), -1, 1)
+    raise ValueError(
+        'The samples have to be [PIXEL, CHANNELS] pixel spectra, '
+        'got the array of shape {}.'.format(array.shape))
+
+
+def parse_address(address: str) -> Tuple[Optional[str], Optional[int],
+                                         Optional[str]]:
+    """
+    Parse the address of the service.
+
+    :param address: TCP "host:port" address or path to the Unix socket.
+    :return: Host, port and path, either the host and port or the path
+        are None.
+    """
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host or 'localhost', int(port), None
+    return None, None, address
+
+
+class MicroBatcher:
+    def __init__(self, predict: Predict,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT):
+        """
+        Coalesce the concurrent requests into micro-batches. The batch is
+        predicted by the background thread, so the next one is collected
+        in the meantime. The batch is closed when it reaches the maximum
+        number of samples or when its first request waited for the maximum
+        time. A single request larger than the maximum batch size forms
+        its own batch.
+
+        :param predict: Function returning the classes of the samples and
+            their probabilities.
+        :param max_batch_size: Maximum number of samples in a batch.
+        :param max_wait: Maximum time in seconds the first request of
+            the batch waits for the other ones.
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(1)
+        self._next_request = None
+
+    async def submit(self, samples: np.ndarray) -> Tuple[np.ndarray,
+                                                          np.ndarray]:
+        """
+        Classify the samples as a part of the micro-batch.
+
+        :param samples: Samples of the same shape, except the number of
+            pixels, as the samples of the other requests.
+        :return: Classes of the samples and their probabilities.
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self.requests.put((samples, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """
+        Collect the requests of the next batch.
+        """
+        loop = asyncio.get_event_loop()
+        batch = [self._next_request or await self.requests.get()]
+        self._next_request = None
+        n_samples = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while n_samples < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self.requests.get(),
+                                                 timeout)
+            except asyncio.TimeoutError:
+                break
+            if n_samples + len(request[0]) > self.max_batch_size:
+                self._next_request = request
+                break
+            batch.append(request)
+            n_samples += len(request[0])
+        return batch
+
+    async def run(self):
+        """
+        Predict the micro-batches until cancelled.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._collect()
+            try:
+                samples = np.concatenate([samples for samples, _ in batch])
+                classes, probabilities = await loop.run_in_executor(
+                    self.executor, self.predict, samples)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            start = 0
+            for request_samples, future in batch:
+                stop = start + len(request_samples)
+                if not future.done():
+                    future.set_result((classes[start:stop],
+                                       probabilities[start:stop]))
+                start = stop
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def load_model_predict(model_path: str = None, graph_path: str = None,
+                       batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> Tuple[
+        Predict, Callable[[], None]]:
+    """
+    Load the trained model or the frozen graph together with
+    the normalization stored next to it. The names of the nodes of
+    the graph are read from the file written by the freeze_model script.
+
+    :param model_path: Path to the trained model.
+    :param graph_path: Path to the .pb frozen graph, used if the model path
+        is not provided.
+    :param batch_size: Size of the batch for inference.
+    :return: Function returning the classes of the raw samples and their
+        probabilities, and the function releasing the session.
+    """
+    directory = os.path.dirname(model_path or graph_path)
+    node_names_path = None if model_path is not None else \
+        os.path.join(directory, NODE_NAMES_FILE)
+    predict, _, close = load_predict(model_path, graph_path, node_names_path,
+                                     batch_size, probability_map=True)
+    min_value, max_value = io.read_min_max(
+        os.path.join(directory, MIN_MAX_FILE))
+    transformations = transforms.compile_transformations(
+        [transforms.SpectralTransform(),
+         transforms.MinMaxNormalize(min_=min_value, max_=max_value)],
+        inplace=True)
+    return lambda samples: classify_tile(samples, predict,
+                                         transformations), close
+
+
+class InferenceServer:
+    def __init__(self, batchers: Dict[str, MicroBatcher]):
+        """
+        Service dispatching the requests to the micro-batchers of
+        the models. The pixel spectra of each request are reshaped to
+        the [PIXEL, CHANNELS, 1] samples. If the request does not name
+        the model, the only served model is used.
+
+        :param batchers: Micro-batchers of the models by their names.
+        """
+        self.batchers = batchers
+        self.tasks = []
+        self.server = None
+
+    async def start(self, address: str):
+        """
+        Start the micro-batchers and listen on the address.
+
+        :param address: TCP "host:port" address or path to the Unix socket.
+        """
+        self.tasks = [asyncio.ensure_future(batcher.run())
+                      for batcher in self.batchers.values()]
+        host, port, path = parse_address(address)
+        if path is None:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            self.server = await asyncio.start_unix_server(self.handle, path)
+
+    async def stop(self):
+        """
+        Stop listening and cancel the micro-batchers.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for batcher in self.batchers.values():
+            batcher.close()
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        """
+        Answer the requests of the connection until it is closed.
+        """
+        try:
+            while True:
+                try:
+                    header, arrays = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    name = header.get(MODEL)
+                    if name is None and len(self.batchers) == 1:
+                        name, = self.batchers
+                    if name not in self.batchers:
+                        raise ValueError(
+                            'The following model is not served: {}'.format(
+                                name))
+                    response = encode_message(
+                        {}, await self.batchers[name].submit(
+                            to_samples(arrays[0])))
+                except Exception as error:
+                    response = encode_message({ERROR: repr(error)}, [])
+                writer.write(response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class InferenceClient:
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        """
+        Connection to the inference service. Use the connect method
+        to create it.
+        """
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, address: str) -> 'InferenceClient':
+        """
+        :param address: TCP "host:port" address or path to the Unix socket.
+        """
+        host, port, path = parse_address(address)
+        if path is None:
+            return cls(*await asyncio.open_connection(host, port))
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def predict(self, samples: np.ndarray, model: str = None) -> Tuple[
+            np.ndarray, np.ndarray]:
+        """
+        Classify the samples.
+
+        :param samples: Pixel spectra with [PIXEL, CHANNELS] dimensions.
+        :param model: Name of the model. May be omitted if the service
+            serves only one model.
+        :return: Classes of the samples and their probabilities.
+        :raises RuntimeError: When the service failed to classify
+            the samples.
+        """
+        self.writer.write(encode_message({MODEL: model}, [samples]))
+        await self.writer.drain()
+        header, arrays = await read_message(self.reader)
+        if ERROR in header:
+            raise RuntimeError(header[ERROR])
+        return arrays[0], arrays[1]
+
+    def close(self):
+        self.writer.close()
+
+
+async def generate_load(address: str, samples: np.ndarray,
+                        n_requests: int, n_connections: int,
+                        request_size: int, model: str = None,
+                        percentiles: List[int] = None) -> Dict[str, float]:
+    """
+    Send the requests through the concurrent connections, each waiting for
+    the response before sending the next request, and measure
+    the throughput and the latency of the requests.
+
+    :param address: TCP "host:port" address or path to the Unix socket.
+    :param samples: Pixel spectra with [PIXEL, CHANNELS] dimensions from
+        which the requests are drawn.
+    :param n_requests: Total number of the requests.
+    :param n_connections: Number of the concurrent connections.
+    :param request_size: Number of samples in a single request.
+    :param model: Name of the model.
+    :param percentiles: Percentiles of the latency to report.
+    :return: Dictionary with the throughput in requests and samples per
+        second and the percentiles of the request latency in milliseconds.
+    """
+    percentiles = percentiles or LATENCY_PERCENTILES
+    clients = [await InferenceClient.connect(address)
+               for _ in range(n_connections)]
+    latencies = []
+    starts = iter(np.random.randint(0, max(1, len(samples) - request_size),
+                                    n_requests))
+
+    async def send(client: InferenceClient):
+        for start in starts:
+            request_start = time()
+            await client.predict(samples[start:start + request_size], model)
+            latencies.append(time() - request_start)
+
+    start = time()
+    try:
+        await asyncio.gather(*[send(client) for client in clients])
+    finally:
+        for client in clients:
+            client.close()
+    total_time = time() - start
+    stats = {'n_connections': n_connections,
+             'request_size': request_size,
+             'requests_per_second': len(latencies) / total_time,
+             'samples_per_second': len(latencies) * request_size / total_time}
+    for percentile, value in zip(percentiles, np.percentile(
+            np.array(latencies) * 1000, percentiles)):
+        stats['latency_p{}_ms'.format(percentile)] = value
+    return stats
@@ -74,6 +74,124 @@ def get_model_metrics(y_true, y_pred, metrics_to_compute: List = None) \
     return model_metrics
 
 
+class ConfusionMatrix:
+    def __init__(self, n_classes: int):
+        """
+        Confusion matrix accumulated batch by batch, so the metrics of
+        the whole set are computed without storing its predictions.
+        Rows correspond to the true labels and columns to the predictions.
+
+        :param n_classes: Number of classes.
+        """
+        self.n_classes = n_classes
+        self.matrix = np.zeros((n_classes, n_classes), dtype=np.int64)
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray):
+        """
+        Add the predictions of the batch to the matrix.
+
+        :param y_true: Labels as a one-dimensional numpy array.
+        :param y_pred: Model's predictions as a one-dimensional numpy array.
+        """
+        indices = np.asarray(y_true, dtype=np.int64) * self.n_classes + \
+            np.asarray(y_pred, dtype=np.int64)
+        self.matrix += np.bincount(
+            indices.ravel(), minlength=self.n_classes ** 2).reshape(
+            self.n_classes, self.n_classes)
+
+
+def get_present_classes(conf_matrix: np.ndarray) -> np.ndarray:
+    """
+    Return the classes present either in the labels or in the predictions,
+    which are the classes of the confusion matrix computed by sklearn.
+
+    :param conf_matrix: Confusion matrix.
+    """
+    return np.flatnonzero(conf_matrix.sum(axis=0) + conf_matrix.sum(axis=1))
+
+
+def matrix_accuracy(conf_matrix: np.ndarray) -> float:
+    """
+    Calculate the overall accuracy based on the confusion matrix.
+
+    :param conf_matrix: Confusion matrix.
+    """
+    return float(conf_matrix.trace() / conf_matrix.sum())
+
+
+def matrix_per_class_accuracy(conf_matrix: np.ndarray) -> np.ndarray:
+    """
+    Calculate the accuracy of each class present in the labels or
+    the predictions based on the confusion matrix. The accuracy of the class
+    present only in the predictions is nan.
+
+    :param conf_matrix: Confusion matrix.
+    """
+    classes = get_present_classes(conf_matrix)
+    conf_matrix = conf_matrix[np.ix_(classes, classes)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return conf_matrix.diagonal() / conf_matrix.sum(axis=1)
+
+
+def matrix_balanced_accuracy(conf_matrix: np.ndarray) -> float:
+    """
+    Calculate the balanced accuracy, i.e. the mean accuracy of the classes
+    present in the labels, based on the confusion matrix.
+
+    :param conf_matrix: Confusion matrix.
+    """
+    per_class_accuracy = matrix_per_class_accuracy(conf_matrix)
+    return float(np.mean(per_class_accuracy[~np.isnan(per_class_accuracy)]))
+
+
+def matrix_cohen_kappa(conf_matrix: np.ndarray) -> float:
+    """
+    Calculate the Cohen's kappa based on the confusion matrix.
+
+    :param conf_matrix: Confusion matrix.
+    """
+    n_samples = conf_matrix.sum()
+    observed = conf_matrix.trace() / n_samples
+    expected = np.dot(conf_matrix.sum(axis=1),
+                      conf_matrix.sum(axis=0)) / n_samples ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return float((observed - expected) / (1 - expected))
+
+
+DEFAULT_MATRIX_METRICS = {
+    metrics.accuracy_score.__name__: matrix_accuracy,
+    metrics.balanced_accuracy_score.__name__: matrix_balanced_accuracy,
+    metrics.cohen_kappa_score.__name__: matrix_cohen_kappa,
+    mean_per_class_accuracy.__name__: matrix_per_class_accuracy
+}
+
+DEFAULT_FAIR_MATRIX_METRICS = {
+    metrics.accuracy_score.__name__: matrix_accuracy,
+    metrics.balanced_accuracy_score.__name__: matrix_balanced_accuracy,
+    metrics.cohen_kappa_score.__name__: matrix_cohen_kappa
+}
+
+
+def get_matrix_metrics(conf_matrix: np.ndarray,
+                       metrics_to_compute: Dict = None) -> \
+        Dict[str, List[float]]:
+    """
+    Calculate the metrics directly from the confusion matrix, giving the same
+    results as the get_model_metrics function on the labels and predictions
+    the matrix was accumulated from.
+
+    :param conf_matrix: Confusion matrix with the true labels in rows.
+    :param metrics_to_compute: Dictionary of the metric names and functions
+        of the confusion matrix, defaults to None
+    :return: Dictionary with metric name as key and metric value as value
+    """
+    metrics_to_compute = DEFAULT_MATRIX_METRICS if metrics_to_compute is None \
+        else metrics_to_compute
+    model_metrics = {name: [metric_function(conf_matrix)]
+                     for name, metric_function in metrics_to_compute.items()}
+    return utils.restructure_per_class_accuracy(model_metrics)
+
+
 def get_fair_model_metrics(conf_matrix, labels_in_train) -> Dict[str, List[float]]:
     """
     Recalculate model metrics discarding classes which where not present in the
@@ -82,20 +200,7 @@ def get_fair_model_metrics(conf_matrix, labels_in_train) -> Dict[str, List[float
     :param labels_in_train: Labels which were present in the training set
     :return: Recalculated metrics as Dict
     """
-    conf_matrix = conf_matrix[labels_in_train, :]
-    conf_matrix = conf_matrix[:, labels_in_train]
-    all_preds = []
-    all_targets = []
-    for row_id in range(conf_matrix.shape[0]):
-        preds = []
-        targets = []
-        for column_id in range(conf_matrix.shape[1]):
-            for i in range(int(conf_matrix[row_id, column_id])):
-                preds.append(column_id)
-            targets = [row_id for _ in range(len(preds))]
-        all_preds.append(preds)
-        all_targets.append(targets)
-    y_pred = np.concatenate(all_preds, axis=0)
-    y_true = np.concatenate(all_targets, axis=0)
-    return get_model_metrics(y_true, y_pred,
-                             metrics_to_compute=DEFAULT_FAIR_METRICS)
+    labels_in_train = np.asarray(labels_in_train, dtype=np.int64)
+    return get_matrix_metrics(
+        conf_matrix[np.ix_(labels_in_train, labels_in_train)],
+        metrics_to_compute=DEFAULT_FAIR_MATRIX_METRICS)
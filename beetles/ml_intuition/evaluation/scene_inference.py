@@ -0,0 +1,268 @@
+"""
+Classification of the whole hyperspectral scene. The cube is read in tiles
+of rows and the class of each pixel, and optionally its probability, are
+written to the output maps tile by tile, so the memory usage depends only
+on the size of the tile, regardless of the size of the scene.
+"""
+
+import json
+import os
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+import tensorflow as tf
+import tifffile
+
+from ml_intuition import enums
+from ml_intuition.data import io
+from ml_intuition.data.transforms import BaseTransform, apply_transformations
+from ml_intuition.evaluation.graph_inference import GraphInference
+
+DEFAULT_TILE_SIZE = 2 ** 16
+EXTENSION = 1
+
+Predict = Callable[[np.ndarray], Tuple[np.ndarray, Optional[np.ndarray]]]
+
+
+def open_cube(data_file_path: str) -> Tuple[
+        Union[np.ndarray, h5py.Dataset], Union[h5py.File, None]]:
+    """
+    Open the hyperspectral cube without loading it into the memory.
+
+    :param data_file_path: Path to the .npy cube or the satellite .h5 file.
+    :return: Memory mapped cube or the .h5 dataset with the cube together
+        with the opened .h5 file, which should be closed by the caller.
+    :raises ValueError: When provided data file is not supported.
+    """
+    if data_file_path.endswith('.npy'):
+        return np.load(data_file_path, mmap_mode='r'), None
+    elif data_file_path.endswith('.h5'):
+        file = h5py.File(data_file_path, 'r')
+        return file[enums.SatelliteH5Keys.CUBE], file
+    raise ValueError(
+        "The following data file type is not supported: {}".format(
+            os.path.splitext(data_file_path)[EXTENSION]))
+
+
+def load_predict(model_path: str = None, graph_path: str = None,
+                 node_names_path: str = None, batch_size: int = 1024,
+                 probability_map: bool = False,
+                 session_config: tf.ConfigProto = None) -> Tuple[
+        Predict, int, Callable[[], None]]:
+    """
+    Load the trained model or, if the model path is not provided,
+    the frozen graph and create its prediction function.
+
+    :param model_path: Path to the trained model.
+    :param graph_path: Path to the .pb frozen graph.
+    :param node_names_path: Path to the .json file with the names of
+        the input and output nodes of the graph.
+    :param batch_size: Size of the batch for inference.
+    :param probability_map: Whether to return the probabilities of
+        the predicted classes.
+    :param session_config: Configuration of the session, e.g. limiting
+        the number of threads.
+    :return: Prediction function, which may be called from any thread,
+        the number of classes and the function releasing the session.
+    """
+    if model_path is not None:
+        if session_config is not None:
+            tf.keras.backend.set_session(tf.Session(config=session_config))
+        model = tf.keras.models.load_model(model_path, compile=True)
+        graph = tf.get_default_graph()
+
+        def predict(samples: np.ndarray):
+            with graph.as_default():
+                scores = model.predict(samples, batch_size=batch_size)
+            return np.argmax(scores, axis=-1), \
+                np.amax(scores, axis=-1) if probability_map else None
+
+        return predict, model.output_shape[-1], lambda: None
+
+    graph = io.load_pb(graph_path)
+    with open(node_names_path, 'r') as node_names_file:
+        node_names = json.loads(node_names_file.read())
+    inference = GraphInference(graph, node_names[enums.NodeNames.INPUT],
+                               node_names[enums.NodeNames.OUTPUT],
+                               batch_size, probabilities=probability_map,
+                               session_config=session_config)
+
+    def predict(samples: np.ndarray):
+        outputs = inference.predict(samples)
+        return outputs[enums.InferenceOutputs.PREDICTIONS], \
+            np.amax(outputs[enums.InferenceOutputs.PROBABILITIES], axis=-1) \
+            if probability_map else None
+
+    n_classes = graph.get_tensor_by_name(
+        node_names[enums.NodeNames.OUTPUT] + ':0').shape.as_list()[-1]
+    return predict, n_classes, inference.close
+
+
+def get_scene_shape(cube_shape: Tuple, channels_idx: int = 0) -> Tuple:
+    """
+    Return the height and width of the cube.
+
+    :param cube_shape: Shape of the cube.
+    :param channels_idx: Index at which the channels are located.
+    :return: Height and width of the scene.
+    """
+    return tuple(size for axis, size in enumerate(cube_shape)
+                 if axis != channels_idx % len(cube_shape))
+
+
+def read_row_tile(cube: np.ndarray, row: int, n_rows: int,
+                  channels_idx: int = 0) -> np.ndarray:
+    """
+    Read the tile of whole rows of the cube and reshape it to the samples.
+
+    :param cube: Hyperspectral cube, possibly memory mapped or .h5 dataset.
+    :param row: First row of the tile.
+    :param n_rows: Number of rows in the tile.
+    :param channels_idx: Index at which the channels are located.
+    :return: Samples of the tile with [PIXEL, CHANNELS, 1] dimensions,
+        like the samples of reshape_cube_to_2d_samples.
+    """
+    channels_idx = channels_idx % cube.ndim
+    index = [slice(None)] * cube.ndim
+    index[1 if channels_idx == 0 else 0] = slice(row, row + n_rows)
+    tile = np.moveaxis(np.asarray(cube[tuple(index)]), channels_idx, -1)
+    return tile.reshape(-1, tile.shape[-1], 1)
+
+
+def get_tile_rows(scene_shape: Tuple,
+                  tile_size: int = DEFAULT_TILE_SIZE) -> List[Tuple[int, int]]:
+    """
+    Divide the scene into tiles of whole rows.
+
+    :param scene_shape: Height and width of the scene.
+    :param tile_size: Maximum number of pixels in a single tile,
+        a tile has at least one row.
+    :return: First row and the number of rows of each tile.
+    """
+    height, width = scene_shape
+    n_rows = max(1, tile_size // width)
+    return [(row, min(n_rows, height - row))
+            for row in range(0, height, n_rows)]
+
+
+def iterate_row_tiles(cube: np.ndarray, channels_idx: int = 0,
+                      tile_size: int = DEFAULT_TILE_SIZE) -> Iterator[
+        Tuple[int, np.ndarray]]:
+    """
+    Read the cube in tiles of whole rows and reshape them to the samples.
+
+    :param cube: Hyperspectral cube, possibly memory mapped or .h5 dataset.
+    :param channels_idx: Index at which the channels are located.
+    :param tile_size: Maximum number of pixels in a single tile,
+        a tile has at least one row.
+    :return: Iterator over the first row of the tile and its samples with
+        [PIXEL, CHANNELS, 1] dimensions.
+    """
+    for row, n_rows in get_tile_rows(
+            get_scene_shape(cube.shape, channels_idx), tile_size):
+        yield row, read_row_tile(cube, row, n_rows, channels_idx)
+
+
+def get_class_map_dtype(n_classes: int, nodata_label: int = None) -> np.dtype:
+    """
+    Return the smallest dtype holding all classes and the nodata label.
+    """
+    return np.min_scalar_type(max(n_classes - 1, nodata_label or 0))
+
+
+def create_map(path: str, shape: Tuple, dtype: np.dtype) -> np.ndarray:
+    """
+    Create the memory mapped output map. If the path ends with .tif or
+    .tiff, the map is an uncompressed TIFF file, otherwise a .npy file.
+
+    :param path: Path to the output file.
+    :param shape: Shape of the map.
+    :param dtype: Dtype of the map.
+    :return: Writable memory map.
+    """
+    if os.path.splitext(path)[1].lower() in ['.tif', '.tiff']:
+        return tifffile.memmap(path, shape=shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                     shape=shape)
+
+
+def open_map(path: str) -> np.ndarray:
+    """
+    Open the map created by the create_map function for writing.
+
+    :param path: Path to the .npy or .tif/.tiff file.
+    :return: Writable memory map.
+    """
+    if os.path.splitext(path)[1].lower() in ['.tif', '.tiff']:
+        return tifffile.memmap(path, mode='r+')
+    return np.load(path, mmap_mode='r+')
+
+
+def classify_tile(samples: np.ndarray, predict: Predict,
+                  transformations: List[BaseTransform],
+                  nodata_label: int = None) -> Tuple[np.ndarray,
+                                                     Optional[np.ndarray]]:
+    """
+    Classify the samples of a single tile.
+
+    :param samples: Samples of the tile.
+    :param predict: Function returning the classes of the samples and,
+        if the probability map is requested, their probabilities.
+    :param transformations: Transformations of the samples, e.g. the
+        normalization.
+    :param nodata_label: Label of the pixels containing nans. Their
+        probability is set to zero. If None, the pixels are not checked
+        for nans.
+    :return: Classes of the samples and their probabilities or None.
+    """
+    is_nodata = None
+    if nodata_label is not None:
+        is_nodata = np.isnan(samples).any(axis=tuple(range(1, samples.ndim)))
+        if np.any(is_nodata):
+            samples = np.where(is_nodata.reshape((-1,) + (1,) * (
+                samples.ndim - 1)), 0, samples)
+    samples = apply_transformations(
+        {enums.Dataset.DATA: samples, enums.Dataset.LABELS: None},
+        transformations)[enums.Dataset.DATA]
+    classes, probabilities = predict(samples)
+    if is_nodata is not None:
+        classes[is_nodata] = nodata_label
+        if probabilities is not None:
+            probabilities[is_nodata] = 0
+    return classes, probabilities
+
+
+def classify_scene(cube: np.ndarray, predict: Predict,
+                   transformations: List[BaseTransform],
+                   class_map: np.ndarray,
+                   probability_map: np.ndarray = None,
+                   channels_idx: int = 0,
+                   tile_size: int = DEFAULT_TILE_SIZE,
+                   nodata_label: int = None):
+    """
+    Classify each pixel of the cube and write the results to the maps.
+
+    :param cube: Hyperspectral cube, possibly memory mapped or .h5 dataset.
+    :param predict: Function returning the classes of the samples and,
+        if the probability map is requested, their probabilities.
+    :param transformations: Transformations of the samples, e.g. the
+        normalization, applied to each tile.
+    :param class_map: Output map of classes with [HEIGHT, WIDTH] dimensions.
+    :param probability_map: Output map of the probabilities of
+        the predicted classes. If None, probabilities are not stored.
+    :param channels_idx: Index at which the channels are located.
+    :param tile_size: Maximum number of pixels in a single tile.
+    :param nodata_label: Label of the pixels containing nans, e.g. outside
+        of the scanned area. Their probability is set to zero. If None,
+        the pixels are not checked for nans.
+    """
+    width = class_map.shape[1]
+    for row, samples in iterate_row_tiles(cube, channels_idx, tile_size):
+        classes, probabilities = classify_tile(samples, predict,
+                                               transformations, nodata_label)
+        n_rows = len(classes) // width
+        class_map[row:row + n_rows] = classes.reshape(n_rows, width)
+        if probability_map is not None:
+            probability_map[row:row + n_rows] = \
+                probabilities.reshape(n_rows, width)
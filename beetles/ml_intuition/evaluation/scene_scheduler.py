@@ -0,0 +1,271 @@
+"""
+Parallel classification of multiple hyperspectral scenes. The fixed pool of
+worker processes is started once and each worker loads the model or
+the frozen graph only once. The scenes are divided into tiles of rows and
+only the descriptors of the tiles are dispatched through the bounded queue.
+Each worker reads its tiles directly from the memory mapped cube and writes
+the results directly into the memory mapped output maps, so the data of
+the tiles is never copied between the processes.
+"""
+
+import multiprocessing
+import os
+import queue
+import traceback
+from collections import OrderedDict
+from time import time
+from typing import Dict, List
+
+import tensorflow as tf
+
+from ml_intuition import enums
+from ml_intuition.data.transforms import BaseTransform
+from ml_intuition.evaluation.scene_inference import DEFAULT_TILE_SIZE, \
+    classify_tile, create_map, get_class_map_dtype, get_scene_shape, \
+    get_tile_rows, load_predict, open_cube, open_map, read_row_tile
+
+QUEUE_SIZE_PER_WORKER = 2
+MAX_OPEN_SCENES = 2
+POLL_INTERVAL = 1.
+READY, DONE, ERROR = 'ready', 'done', 'error'
+
+
+def _close_scene(scene: tuple):
+    cube_file, maps = scene
+    for output_map in maps:
+        output_map.flush()
+    if cube_file is not None:
+        cube_file.close()
+
+
+def _work(tasks: multiprocessing.Queue, results: multiprocessing.Queue,
+          predictor_kwargs: Dict, transformations: List[BaseTransform],
+          channels_idx: int, nodata_label: int, n_threads: int):
+    """
+    Load the predictor once and classify the tiles from the task queue
+    until the None sentinel is received. Each task consists of the index
+    of the scene, path to its cube, paths to its output maps, the first
+    row and the number of rows of the tile.
+    """
+    try:
+        session_config = tf.ConfigProto(
+            intra_op_parallelism_threads=n_threads,
+            inter_op_parallelism_threads=1)
+        predict, n_classes, close = load_predict(
+            session_config=session_config, **predictor_kwargs)
+    except Exception:
+        results.put((ERROR, traceback.format_exc()))
+        return
+    results.put((READY, n_classes))
+    scenes = OrderedDict()
+    try:
+        for scene_index, data_file_path, map_paths, row, n_rows in iter(
+                tasks.get, None):
+            if scene_index not in scenes:
+                if len(scenes) == MAX_OPEN_SCENES:
+                    _close_scene(scenes.popitem(last=False)[1][1:])
+                cube, cube_file = open_cube(data_file_path)
+                scenes[scene_index] = (cube, cube_file,
+                                       [open_map(path) for path in map_paths])
+            cube, _, maps = scenes[scene_index]
+            outputs = classify_tile(
+                read_row_tile(cube, row, n_rows, channels_idx), predict,
+                transformations, nodata_label)
+            for output_map, output in zip(maps, outputs):
+                output_map[row:row + n_rows] = output.reshape(n_rows, -1)
+            results.put((DONE, scene_index, n_rows * maps[0].shape[1]))
+    except Exception:
+        results.put((ERROR, traceback.format_exc()))
+    finally:
+        for scene in scenes.values():
+            _close_scene(scene[1:])
+        close()
+
+
+class SceneScheduler:
+    def __init__(self, model_path: str = None, graph_path: str = None,
+                 node_names_path: str = None,
+                 transformations: List[BaseTransform] = None,
+                 n_workers: int = None, n_threads: int = None,
+                 batch_size: int = 1024, probability_map: bool = False,
+                 channels_idx: int = 0, tile_size: int = DEFAULT_TILE_SIZE,
+                 nodata_label: int = None, verbose: bool = True):
+        """
+        Pool of worker processes classifying the scenes tile by tile.
+        The workers are started, and the model or the graph is loaded
+        by each of them, once, so the pool can classify any number of
+        scenes without reloading the weights.
+
+        :param model_path: Path to the trained model.
+        :param graph_path: Path to the .pb frozen graph, used if the model
+            path is not provided.
+        :param node_names_path: Path to the .json file with the names of
+            the input and output nodes of the graph.
+        :param transformations: Transformations of the samples, e.g.
+            the normalization, applied to each tile.
+        :param n_workers: Number of the worker processes. If None,
+            the number of CPUs is used.
+        :param n_threads: Number of the threads of each worker. If None,
+            the CPUs are divided evenly between the workers, so they do not
+            compete for the cores.
+        :param batch_size: Size of the batch for inference.
+        :param probability_map: Whether to store the map of the
+            probabilities of the predicted classes.
+        :param channels_idx: Index at which the channels are located.
+        :param tile_size: Maximum number of pixels in a single tile.
+        :param nodata_label: Label of the pixels containing nans. If None,
+            the pixels are not checked for nans.
+        :param verbose: Whether to print the progress.
+        """
+        self.n_workers = n_workers or os.cpu_count()
+        self.n_threads = n_threads or max(
+            1, os.cpu_count() // self.n_workers)
+        self.probability_map = probability_map
+        self.channels_idx = channels_idx
+        self.tile_size = tile_size
+        self.nodata_label = nodata_label
+        self.verbose = verbose
+        context = multiprocessing.get_context('spawn')
+        self.tasks = context.Queue(QUEUE_SIZE_PER_WORKER * self.n_workers)
+        self.results = context.Queue()
+        predictor_kwargs = {'model_path': model_path,
+                            'graph_path': graph_path,
+                            'node_names_path': node_names_path,
+                            'batch_size': batch_size,
+                            'probability_map': probability_map}
+        self.workers = [
+            context.Process(
+                target=_work,
+                args=(self.tasks, self.results, predictor_kwargs,
+                      transformations or [], channels_idx, nodata_label,
+                      self.n_threads),
+                daemon=True)
+            for _ in range(self.n_workers)]
+        start = time()
+        for worker in self.workers:
+            worker.start()
+        try:
+            self.n_classes = max(self._get_result()[1]
+                                 for _ in range(self.n_workers))
+        except Exception:
+            self.terminate()
+            raise
+        self.startup_time = time() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def close(self):
+        """
+        Stop the workers after they finish the dispatched tiles.
+        """
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def terminate(self):
+        """
+        Stop the workers immediately.
+        """
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+
+    def _get_result(self) -> tuple:
+        """
+        Wait for the next result of the workers.
+
+        :raises RuntimeError: When any worker failed or exited.
+        """
+        while True:
+            try:
+                result = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError('Worker process exited unexpectedly.')
+                continue
+            if result[0] == ERROR:
+                raise RuntimeError(
+                    'Worker process failed:\n{}'.format(result[1]))
+            return result
+
+    def classify(self, data_file_paths: List[str], dest_paths: List[str],
+                 map_format: str = 'npy') -> Dict[str, float]:
+        """
+        Classify each pixel of the scenes and store their maps. Tiles of
+        all scenes are dispatched in order, so the workers move to the next
+        scene while the last tiles of the previous one are processed.
+
+        :param data_file_paths: Paths to the scenes, either the .npy cubes
+            or the satellite .h5 files.
+        :param dest_paths: Directories in which the "class_map" and
+            "probability_map" files of each scene are stored.
+        :param map_format: Format of the maps, either "npy" or "tiff".
+        :return: Dictionary with the number of classified pixels,
+            the total time and the throughput in pixels per second.
+        """
+        if map_format not in ['npy', 'tiff']:
+            raise ValueError(
+                'The following map format is not supported: {}'.format(
+                    map_format))
+        map_names = [enums.Experiment.CLASS_MAP]
+        if self.probability_map:
+            map_names.append(enums.Experiment.PROBABILITY_MAP)
+        class_map_dtype = get_class_map_dtype(self.n_classes,
+                                              self.nodata_label)
+        tasks, scene_pixels = [], []
+        for scene_index, (data_file_path, dest_path) in enumerate(
+                zip(data_file_paths, dest_paths)):
+            cube, cube_file = open_cube(data_file_path)
+            shape = get_scene_shape(cube.shape, self.channels_idx)
+            if cube_file is not None:
+                cube_file.close()
+            os.makedirs(dest_path, exist_ok=True)
+            map_paths = [os.path.join(dest_path, '{}.{}'.format(
+                name, map_format)) for name in map_names]
+            for path, dtype in zip(map_paths, [class_map_dtype, 'float32']):
+                create_map(path, shape, dtype).flush()
+            tasks.extend((scene_index, data_file_path, map_paths, row, n_rows)
+                         for row, n_rows in get_tile_rows(shape,
+                                                          self.tile_size))
+            scene_pixels.append(shape[0] * shape[1])
+
+        done_pixels = [0] * len(scene_pixels)
+        n_scenes_done = scene_pixels.count(0)
+        start = time()
+        tasks.reverse()
+        try:
+            while n_scenes_done < len(scene_pixels):
+                while tasks:
+                    try:
+                        self.tasks.put_nowait(tasks[-1])
+                    except queue.Full:
+                        break
+                    tasks.pop()
+                _, scene_index, n_pixels = self._get_result()
+                done_pixels[scene_index] += n_pixels
+                if done_pixels[scene_index] == scene_pixels[scene_index]:
+                    n_scenes_done += 1
+                    if self.verbose:
+                        print('Scene {}/{} classified: {}, {:.1f} pixels/s'
+                              .format(n_scenes_done, len(scene_pixels),
+                                      data_file_paths[scene_index],
+                                      sum(done_pixels) / (time() - start)))
+        except Exception:
+            self.terminate()
+            raise
+        total_time = time() - start
+        return {'n_workers': self.n_workers,
+                'n_threads': self.n_threads,
+                'n_scenes': len(scene_pixels),
+                'n_pixels': sum(scene_pixels),
+                'startup_time': self.startup_time,
+                'total_time': total_time,
+                'pixels_per_second': sum(scene_pixels) / total_time}
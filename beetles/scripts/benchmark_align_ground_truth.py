@@ -0,0 +1,87 @@
+"""
+Benchmark the tiled alignment of the ground truth. For each tile size and
+number of threads report the time of preprocessing.align_ground_truth,
+its speed-up over the warp of the whole raster and the number of labels
+differing from it, which are the pixels mapped to the boundary between
+two source pixels.
+"""
+
+from time import time
+
+import clize
+import cv2
+import numpy as np
+from clize.parameters import multi
+
+from ml_intuition.data import io, preprocessing
+
+
+def main(*, height: int = 8000, width: int = 8000,
+         tile_sizes: ('tile_size', multi(min=0)),
+         threads: ('n_threads', multi(min=0)),
+         data_file_path: str = None, ground_truth_path: str = None,
+         dest_path: str = None):
+    """
+    :param height: Height of the synthetic scene.
+    :param width: Width of the synthetic scene.
+    :param tile_sizes: Tile sizes to benchmark, defaults to 256, 1024, 4096.
+    :param threads: Numbers of threads to benchmark, defaults to 1, 2, 4, 8.
+    :param data_file_path: Path to the satellite .h5 file providing the shape
+        of the cube and the transformation matrix. If None, synthetic scene
+        with height and width is used.
+    :param ground_truth_path: Path to the .tiff ground truth, used only with
+        the data_file_path.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    tile_sizes = [int(tile_size) for tile_size in tile_sizes] or \
+                 [256, 1024, 4096]
+    threads = [int(n_threads) for n_threads in threads] or [1, 2, 4, 8]
+    if data_file_path is None:
+        cube_2d_shape = (width, height)
+        ground_truth = np.random.randint(0, 20, (height + height // 10,
+                                                 width + width // 10)) \
+            .astype(np.uint8)
+        angle = np.deg2rad(3)
+        cube_to_gt_transform = np.array(
+            [[1.1 * np.cos(angle), -np.sin(angle), width / 20],
+             [np.sin(angle), 1.1 * np.cos(angle), 0],
+             [0, 0, 1]])
+    else:
+        cube, cube_to_gt_transform = io.load_satellite_h5(data_file_path)
+        cube_2d_shape = cube.shape[1:]
+        del cube
+        ground_truth = io.load_tiff(ground_truth_path)
+
+    start = time()
+    expected = cv2.warpPerspective(ground_truth,
+                                   np.linalg.inv(cube_to_gt_transform),
+                                   cube_2d_shape, flags=cv2.INTER_NEAREST)
+    reference_time = time() - start
+    print('whole raster warp: {:.3f} s'.format(reference_time))
+
+    results = {'tile_size': [], 'n_threads': [], 'time': [], 'speed_up': [],
+               'mismatched': []}
+    for tile_size in tile_sizes:
+        for n_threads in threads:
+            start = time()
+            aligned = preprocessing.align_ground_truth(
+                cube_2d_shape, ground_truth, cube_to_gt_transform,
+                tile_size=tile_size, n_threads=n_threads)
+            elapsed = time() - start
+            results['tile_size'].append(tile_size)
+            results['n_threads'].append(n_threads)
+            results['time'].append(round(elapsed, 4))
+            results['speed_up'].append(round(reference_time / elapsed, 2))
+            results['mismatched'].append(
+                int(np.count_nonzero(aligned != expected)))
+            print('tile size: {:>5} threads: {:>3} time: {:>8.3f} s '
+                  'speed-up: {:>6.2f} mismatched: {}'.format(
+                      tile_size, n_threads, elapsed, results['speed_up'][-1],
+                      results['mismatched'][-1]))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
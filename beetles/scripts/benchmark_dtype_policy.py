@@ -0,0 +1,115 @@
+"""
+Benchmark the memory taken by a representative prepare, train and evaluate
+run for each floating point dtype of the dtype policy. The synthetic float64
+cube is prepared into the .h5 file, the model is trained on it in the memory
+and evaluated on the test set. Each stage of each dtype is run in
+a separate process and its peak resident set size is reported, so the peak
+memory of one stage does not hide the ones of the next stages.
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+
+import clize
+import numpy as np
+from clize.parameters import multi
+
+from ml_intuition.data import io
+from scripts import evaluate_model, prepare_data, train_model
+
+STAGES = ['prepare', 'train', 'evaluate']
+
+
+def get_peak_rss() -> float:
+    """
+    Return the peak resident set size of the process in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_stage(stage: str, floatx: str, data_path: str,
+              ground_truth_path: str, dest_dir: str, n_classes: int,
+              epochs: int, batch_size: int, queue: multiprocessing.Queue):
+    """
+    Run the given stage with the given dtype policy, reading the outputs of
+    the previous stages from the destination directory, and put the peak
+    resident set size in MB into the queue.
+    """
+    output_path = os.path.join(dest_dir, 'data.h5')
+    if stage == 'prepare':
+        prepare_data.main(data_file_path=data_path,
+                          ground_truth_path=ground_truth_path,
+                          output_path=output_path, train_size=['0.8'],
+                          save_data=True, floatx=floatx)
+    elif stage == 'train':
+        n_bands = np.load(data_path, mmap_mode='r').shape[0]
+        train_model.train(model_name='model_2d', kernel_size=5, n_kernels=16,
+                          n_layers=1, dest_path=dest_dir, data=output_path,
+                          sample_size=n_bands, n_classes=n_classes,
+                          batch_size=batch_size, epochs=epochs, verbose=0,
+                          noise=[], noise_sets=[], floatx=floatx)
+    else:
+        evaluate_model.evaluate(
+            model_path=os.path.join(dest_dir, 'model_2d'), data=output_path,
+            dest_path=dest_dir, n_classes=n_classes, batch_size=batch_size,
+            noise=[], noise_sets=[], floatx=floatx)
+    queue.put(get_peak_rss())
+
+
+def main(*, height: int = 700, width: int = 700, n_bands: int = 103,
+         n_classes: int = 9, epochs: int = 1, batch_size: int = 1024,
+         dtypes: ('floatx', multi(min=0)),
+         dest_path: str = None):
+    """
+    :param height: Height of the synthetic cube.
+    :param width: Width of the synthetic cube.
+    :param n_bands: Number of bands of the synthetic cube.
+    :param n_classes: Number of classes of the synthetic ground truth,
+        the background is not counted.
+    :param epochs: Number of the training epochs.
+    :param batch_size: Size of the batch.
+    :param dtypes: Floating point dtypes of the dtype policy to compare.
+        If not provided, "float32" and "float64" are compared.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    dtypes = dtypes or ['float32', 'float64']
+    context = multiprocessing.get_context('spawn')
+    results = {'floatx': []}
+    results.update({'{}_peak_rss_mb'.format(stage): [] for stage in STAGES})
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path, ground_truth_path = os.path.join(temp_dir, 'cube.npy'), \
+                                       os.path.join(temp_dir, 'gt.npy')
+        np.save(data_path, np.random.rand(n_bands, height, width))
+        np.save(ground_truth_path,
+                np.random.randint(0, n_classes + 1, (height, width)))
+        for dtype in dtypes:
+            dest_dir = os.path.join(temp_dir, dtype)
+            os.makedirs(dest_dir)
+            peak_rss = []
+            for stage in STAGES:
+                queue = context.Queue()
+                process = context.Process(target=run_stage, args=(
+                    stage, dtype, data_path, ground_truth_path, dest_dir,
+                    n_classes, epochs, batch_size, queue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError('The {} {} stage failed.'.format(
+                        dtype, stage))
+                peak_rss.append(queue.get())
+            results['floatx'].append(dtype)
+            for stage, stage_rss in zip(STAGES, peak_rss):
+                results['{}_peak_rss_mb'.format(stage)].append(
+                    round(stage_rss, 1))
+            print('{:>8} '.format(dtype) + ' '.join(
+                '{}: {:>8.1f} MB'.format(stage, stage_rss)
+                for stage, stage_rss in zip(STAGES, peak_rss)))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
@@ -0,0 +1,87 @@
+"""
+Benchmark the inference with the frozen graph. For each batch size,
+report the throughput and the percentiles of the batch latency of
+the persistent GraphInference session together with the throughput of
+utils.predict_with_graph_in_batches, which feeds the batches one by one
+without staging them.
+"""
+
+import json
+
+import clize
+import numpy as np
+import tensorflow as tf
+from clize.parameters import multi
+
+from ml_intuition import enums
+from ml_intuition.data import io, utils
+from ml_intuition.evaluation.graph_inference import GraphInference
+from ml_intuition.evaluation.time_metrics import timeit
+
+
+def main(*, graph_path: str, node_names_path: str, dataset_path: str = None,
+         n_samples: int = 200000,
+         batch_sizes: ('batch_size', multi(min=1)),
+         n_repeats: int = 3,
+         dest_path: str = None):
+    """
+    :param graph_path: Path to the .pb graph.
+    :param node_names_path: Path to the .json file with the names of
+        the input and output nodes.
+    :param dataset_path: Path to the .h5 dataset, the test set is used.
+        If None, random samples with the shape of the input node are used.
+    :param n_samples: Number of the random samples.
+    :param batch_sizes: Sizes of the batch to compare.
+    :param n_repeats: Number of the predictions of each configuration,
+        the fastest one is reported.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    graph = io.load_pb(graph_path)
+    with open(node_names_path, 'r') as node_names_file:
+        node_names = json.loads(node_names_file.read())
+    input_node = graph.get_tensor_by_name(
+        node_names[enums.NodeNames.INPUT] + ':0')
+    output_node = graph.get_tensor_by_name(
+        node_names[enums.NodeNames.OUTPUT] + ':0')
+    if dataset_path is None:
+        data = np.random.rand(n_samples, *input_node.shape.as_list()[1:])
+    else:
+        data = io.extract_set(dataset_path, enums.Dataset.TEST)[
+            enums.Dataset.DATA]
+        data = np.expand_dims(data, -1) if data.ndim < input_node.shape.ndims \
+            else data
+    data = data.astype(input_node.dtype.as_numpy_dtype)
+
+    results = {}
+    for batch_size in [int(batch_size) for batch_size in batch_sizes]:
+        with GraphInference(graph, node_names[enums.NodeNames.INPUT],
+                            node_names[enums.NodeNames.OUTPUT],
+                            batch_size) as inference:
+            inference.predict(data[:batch_size])
+            stats = None
+            for _ in range(n_repeats):
+                inference.predict(data)
+                repeat_stats = inference.get_latency_stats()
+                if stats is None or repeat_stats['samples_per_second'] > \
+                        stats['samples_per_second']:
+                    stats = repeat_stats
+        with tf.Session(graph=graph) as session:
+            predict = timeit(utils.predict_with_graph_in_batches)
+            predict(session, input_node, output_node, data[:batch_size],
+                    batch_size)
+            batched_time = min(
+                predict(session, input_node, output_node, data,
+                        batch_size)[1] for _ in range(n_repeats))
+        stats['batched_session_run_samples_per_second'] = \
+            len(data) / batched_time
+        print(' '.join('{}: {:.1f}'.format(key, value)
+                       for key, value in stats.items()))
+        for key, value in stats.items():
+            results.setdefault(key, []).append(round(value, 3))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
@@ -0,0 +1,92 @@
+"""
+Benchmark the storage layouts of the processed .h5 datasets. For each
+configuration of chunking, compression and storage dtype report the write
+and read throughput together with the size of the file on disk.
+"""
+
+import os
+import tempfile
+from time import time
+
+import clize
+import numpy as np
+
+from ml_intuition import enums
+from ml_intuition.data import io
+
+CONFIGURATIONS = [
+    {},
+    {'chunk_size': 1024},
+    {'chunk_size': 1024, 'compression': 'lzf'},
+    {'chunk_size': 1024, 'compression': 'lzf', 'shuffle_filter': True},
+    {'chunk_size': 1024, 'compression': 'gzip', 'compression_level': 1},
+    {'chunk_size': 1024, 'compression': 'gzip', 'compression_level': 4,
+     'shuffle_filter': True},
+    {'chunk_size': 1024, 'compression': 'gzip', 'compression_level': 9,
+     'shuffle_filter': True},
+    {'chunk_size': 1024, 'compression': 'lzf', 'shuffle_filter': True,
+     'storage_dtype': 'float16'},
+    {'chunk_size': 1024, 'compression': 'lzf', 'shuffle_filter': True,
+     'storage_dtype': 'uint16'},
+]
+
+
+def main(*, data_file_path: str = None, n_samples: int = 100000,
+         n_bands: int = 200, dest_path: str = None):
+    """
+    :param data_file_path: Path to the processed .h5 dataset used as the
+        benchmark input. If None, synthetic data with n_samples and
+        n_bands is used.
+    :param n_samples: Number of samples in the synthetic dataset.
+    :param n_bands: Number of bands in the synthetic dataset.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    if data_file_path is None:
+        x = np.random.rand(n_samples, n_bands) * 4096
+        x = (np.cumsum(x, axis=1) / np.arange(1, n_bands + 1)).astype(
+            np.float32)
+        y = np.random.randint(0, 10, n_samples).astype(np.uint8)
+    else:
+        data = io.load_processed_h5(data_file_path)
+        subset_keys = [enums.Dataset.TRAIN, enums.Dataset.VAL,
+                       enums.Dataset.TEST]
+        x = np.concatenate([data[subset_key][enums.Dataset.DATA]
+                            for subset_key in subset_keys], axis=0)
+        y = np.concatenate([data[subset_key][enums.Dataset.LABELS]
+                            for subset_key in subset_keys], axis=0)
+    n_train, n_val = int(len(x) * 0.8), int(len(x) * 0.1)
+    subsets = [x[:n_train], y[:n_train],
+               x[n_train:n_train + n_val], y[n_train:n_train + n_val],
+               x[n_train + n_val:], y[n_train + n_val:]]
+    raw_mb = (x.nbytes + y.nbytes) / 2 ** 20
+
+    results = {'configuration': [], 'write_mb_s': [], 'read_mb_s': [],
+               'size_mb': []}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for configuration in CONFIGURATIONS:
+            path = os.path.join(temp_dir, 'data.h5')
+            start = time()
+            io.save_md5(path, *subsets, **configuration)
+            write_time = time() - start
+            start = time()
+            io.load_processed_h5(path)
+            read_time = time() - start
+            name = ','.join('{}={}'.format(key, value) for key, value in
+                            configuration.items()) or 'contiguous'
+            results['configuration'].append(name)
+            results['write_mb_s'].append(round(raw_mb / write_time, 2))
+            results['read_mb_s'].append(round(raw_mb / read_time, 2))
+            results['size_mb'].append(
+                round(os.path.getsize(path) / 2 ** 20, 2))
+            os.remove(path)
+            print('{:<90} write: {:>9.2f} MB/s read: {:>9.2f} MB/s '
+                  'size: {:>9.2f} MB'.format(name, results['write_mb_s'][-1],
+                                             results['read_mb_s'][-1],
+                                             results['size_mb'][-1]))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
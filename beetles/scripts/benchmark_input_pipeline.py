@@ -0,0 +1,140 @@
+"""
+Benchmark the input pipelines of the training. For the in-memory path,
+which loads the whole training and validation sets before model.fit, and
+for the streaming tf.data path with and without the cache, report the time
+of each epoch and the peak resident set size of the process. Each pipeline
+is run in a separate process, so the peak memory of one does not affect
+the others.
+"""
+
+import multiprocessing
+import os
+import resource
+import tempfile
+
+import clize
+import numpy as np
+
+from ml_intuition import enums, models
+from ml_intuition.data import io, transforms
+from ml_intuition.evaluation import time_metrics
+
+PIPELINES = ['in_memory', 'streaming', 'streaming_cache']
+
+
+def run_pipeline(pipeline: str, data_path: str, n_classes: int, epochs: int,
+                 batch_size: int, chunk_size: int, shuffle_buffer_size: int,
+                 cache_dir: str, queue: multiprocessing.Queue):
+    """
+    Train the small model using the given pipeline and put the epoch times
+    and the peak resident set size in MB into the queue.
+    """
+    with io.LazyDataset(data_path, chunk_size) as dataset:
+        transformations = transforms.compile_transformations(
+            [transforms.SpectralTransform(),
+             transforms.OneHotEncode(n_classes=n_classes),
+             transforms.MinMaxNormalize(min_=dataset.min, max_=dataset.max)],
+            inplace=True)
+        n_bands = dataset.read(enums.Dataset.TRAIN, 0, 1)[
+            enums.Dataset.DATA].shape[-1]
+        if pipeline == 'in_memory':
+            train_dict = transforms.apply_transformations(
+                io.extract_set(data_path, enums.Dataset.TRAIN),
+                transformations)
+            val_dict = transforms.apply_transformations(
+                io.extract_set(data_path, enums.Dataset.VAL), transformations)
+            fit_kwargs = {
+                'x': train_dict[enums.Dataset.DATA],
+                'y': train_dict[enums.Dataset.LABELS],
+                'shuffle': True,
+                'validation_data': (val_dict[enums.Dataset.DATA],
+                                    val_dict[enums.Dataset.LABELS]),
+                'batch_size': batch_size
+            }
+        else:
+            tr_cache_path, val_cache_path = [
+                os.path.join(cache_dir, dataset_key)
+                if pipeline == 'streaming_cache' else None
+                for dataset_key in [enums.Dataset.TRAIN, enums.Dataset.VAL]]
+            train_data, n_train = dataset.to_tf_dataset(
+                enums.Dataset.TRAIN, batch_size, transformations, True,
+                shuffle_buffer_size=shuffle_buffer_size,
+                cache_path=tr_cache_path)
+            val_data, n_val = dataset.to_tf_dataset(
+                enums.Dataset.VAL, batch_size, transformations,
+                cache_path=val_cache_path)
+            fit_kwargs = {
+                'x': train_data,
+                'steps_per_epoch': int(np.ceil(n_train / batch_size)),
+                'validation_data': val_data,
+                'validation_steps': int(np.ceil(n_val / batch_size))
+            }
+        model = models.get_model(model_key='model_2d', kernel_size=5,
+                                 n_kernels=16, n_layers=1, input_size=n_bands,
+                                 n_classes=n_classes)
+        model.compile('adam', 'categorical_crossentropy')
+        time_history = time_metrics.TimeHistory()
+        model.fit(epochs=epochs, verbose=0, callbacks=[time_history],
+                  **fit_kwargs)
+    queue.put((time_history.average,
+               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main(*, n_samples: int = 500000, n_bands: int = 103, n_classes: int = 9,
+         epochs: int = 3, batch_size: int = 1024, chunk_size: int = 2 ** 14,
+         shuffle_buffer_size: int = 2 ** 16, data_path: str = None,
+         dest_path: str = None):
+    """
+    :param n_samples: Number of the synthetic training samples, validation
+        and test sets have a tenth of this size.
+    :param n_bands: Number of bands of the synthetic samples.
+    :param n_classes: Number of classes of the synthetic samples.
+    :param epochs: Number of the training epochs.
+    :param batch_size: Size of the batch.
+    :param chunk_size: Number of samples read from the file at once.
+    :param shuffle_buffer_size: Number of samples in the shuffle buffer of
+        the streaming pipelines.
+    :param data_path: Path to the processed .h5 dataset. If None, synthetic
+        dataset is created.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if data_path is None:
+            data_path = os.path.join(temp_dir, 'data.h5')
+            subsets = []
+            for size in [n_samples, n_samples // 10, n_samples // 10]:
+                subsets += [np.random.rand(size, n_bands).astype(np.float32),
+                            np.random.randint(0, n_classes, size)
+                                .astype(np.uint8)]
+            io.save_md5(data_path, *subsets)
+            del subsets
+        results = {'pipeline': [], 'first_epoch_time': [],
+                   'mean_next_epochs_time': [], 'peak_rss_mb': []}
+        for pipeline in PIPELINES:
+            queue = context.Queue()
+            process = context.Process(target=run_pipeline, args=(
+                pipeline, data_path, n_classes, epochs, batch_size,
+                chunk_size, shuffle_buffer_size, temp_dir, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError('The {} pipeline failed.'.format(pipeline))
+            epoch_times, peak_rss = queue.get()
+            results['pipeline'].append(pipeline)
+            results['first_epoch_time'].append(round(epoch_times[0], 3))
+            results['mean_next_epochs_time'].append(
+                round(float(np.mean(epoch_times[1:])), 3)
+                if len(epoch_times) > 1 else None)
+            results['peak_rss_mb'].append(round(peak_rss, 1))
+            print('{:>16} first epoch: {:>8.3f} s next epochs: {} s '
+                  'peak RSS: {:>8.1f} MB'.format(
+                      pipeline, epoch_times[0],
+                      results['mean_next_epochs_time'][-1], peak_rss))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
@@ -0,0 +1,103 @@
+"""
+Benchmark the noise injection methods. For each method report the throughput
+in samples per second of the vectorized injector and of the reference
+implementation looping over the affected samples and bands.
+"""
+
+import json
+from time import time
+
+import clize
+import numpy as np
+from clize.parameters import multi
+
+from ml_intuition.data import io, noise
+from ml_intuition.enums import Sample
+
+
+def reference_injection(injector: noise.BaseNoise,
+                        data: np.ndarray) -> np.ndarray:
+    """
+    Inject the noise with a Python loop over the affected samples and bands.
+
+    :param injector: Noise injector providing the parameters.
+    :param data: Input data.
+    :return: Noisy data.
+    """
+    params = injector.params
+    n_affected, n_bands = \
+        injector.get_proba(data.shape[Sample.SAMPLES_DIM], params.pa), \
+        injector.get_proba(data.shape[Sample.FEATURES_DIM], params.pb)
+    n_white = injector.get_proba(n_affected, params.pw or 0)
+    black, white = np.amin(data), np.amax(data)
+    data = data.astype(np.float64)
+    if isinstance(injector, noise.Shot):
+        data = np.clip(data, a_min=0, a_max=None)
+        shot = np.random.poisson(data)
+    noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
+                                   n_bands, False)
+    for noise_index, sample_index in enumerate(np.random.choice(
+            data.shape[Sample.SAMPLES_DIM], n_affected, False)):
+        if not params.bc:
+            noisy_bands = np.random.choice(data.shape[Sample.FEATURES_DIM],
+                                           n_bands, False)
+        for band_index in noisy_bands:
+            if isinstance(injector, noise.Gaussian):
+                data[sample_index, band_index] += np.random.normal(
+                    loc=params.mean, scale=params.std,
+                    size=data[sample_index, band_index].shape)
+            elif isinstance(injector, noise.Impulsive):
+                data[sample_index, band_index] = \
+                    white if noise_index < n_white else black
+            else:
+                data[sample_index, band_index] += \
+                    shot[sample_index, band_index]
+    return data
+
+
+def main(*, n_samples: int = 20000, n_bands: int = 200,
+         noise_methods: ('noise', multi(min=0)),
+         pa: float = 1.0, pb: float = 1.0, bc: bool = False,
+         skip_reference: bool = False, dest_path: str = None):
+    """
+    :param n_samples: Number of samples in the synthetic dataset.
+    :param n_bands: Number of bands in the synthetic dataset.
+    :param noise_methods: Names of the benchmarked noise injection methods,
+        defaults to gaussian, impulsive and shot.
+    :param pa: Fraction of noisy pixels.
+    :param pb: Fraction of noisy bands.
+    :param bc: Whether the affected bands are constant for each sample.
+    :param skip_reference: Whether to skip the looping implementation,
+        which can take long for large datasets.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    noise_methods = noise_methods or ['gaussian', 'impulsive', 'shot']
+    params = {'pa': pa, 'pb': pb, 'bc': bc, 'mean': 0, 'std': 1, 'pw': 0.5}
+    data = np.random.rand(n_samples, n_bands, 1).astype(np.float32) * 100
+    results = {'noise': [], 'reference_samples_s': [],
+               'vectorized_samples_s': [], 'speed_up': []}
+    for injector in noise.get_noise_functions(noise_methods,
+                                              json.dumps(params)):
+        start = time()
+        injector(data.copy(), None)
+        vectorized = n_samples / (time() - start)
+        reference = np.nan
+        if not skip_reference:
+            start = time()
+            reference_injection(injector, data.copy())
+            reference = n_samples / (time() - start)
+        name = type(injector).__name__
+        results['noise'].append(name)
+        results['reference_samples_s'].append(round(reference, 2))
+        results['vectorized_samples_s'].append(round(vectorized, 2))
+        results['speed_up'].append(round(vectorized / reference, 2))
+        print('{:<10} reference: {:>14.2f} samples/s vectorized: {:>14.2f} '
+              'samples/s speed-up: {:>8.2f}'.format(
+                  name, reference, vectorized, results['speed_up'][-1]))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
@@ -0,0 +1,97 @@
+"""
+Classify each pixel of the whole hyperspectral scene with the trained model
+or the frozen graph and store the map of classes, and optionally the map of
+their probabilities. The scene is processed in tiles of rows, so it can be
+larger than the available memory.
+"""
+
+import os
+
+import clize
+import numpy as np
+
+from ml_intuition import enums
+from ml_intuition.data import io, transforms
+from ml_intuition.evaluation.scene_inference import DEFAULT_TILE_SIZE, \
+    classify_scene, create_map, get_class_map_dtype, get_scene_shape, \
+    load_predict, open_cube
+
+
+def classify(*,
+             data_file_path: str,
+             dest_path: str,
+             model_path: str = None,
+             graph_path: str = None,
+             node_names_path: str = None,
+             min_max_path: str = None,
+             channels_idx: int = 0,
+             batch_size: int = 1024,
+             tile_size: int = DEFAULT_TILE_SIZE,
+             probability_map: bool = False,
+             map_format: str = 'npy',
+             nodata_label: int = None):
+    """
+    :param data_file_path: Path to the scene, either the .npy cube or
+        the satellite .h5 file.
+    :param dest_path: Directory in which the "class_map" and
+        "probability_map" files are stored.
+    :param model_path: Path to the trained model.
+    :param graph_path: Path to the .pb frozen graph, used if the model path
+        is not provided.
+    :param node_names_path: Path to the .json file with the names of
+        the input and output nodes of the graph.
+    :param min_max_path: Path to the .csv file with the minimum and maximum
+        used for the normalization. If None, the "min-max.csv" file stored
+        next to the model or the graph is used.
+    :param channels_idx: Index at which the channels are located in the cube.
+    :param batch_size: Size of the batch for inference.
+    :param tile_size: Maximum number of pixels read from the cube at once,
+        a tile consists of at least one row.
+    :param probability_map: Whether to store the map of the probabilities
+        of the predicted classes.
+    :param map_format: Format of the maps, either "npy" or "tiff".
+        Both are uncompressed and written incrementally through
+        the memory map.
+    :param nodata_label: Label of the pixels containing nans. If None,
+        the pixels are not checked for nans.
+    """
+    if map_format not in ['npy', 'tiff']:
+        raise ValueError(
+            'The following map format is not supported: {}'.format(
+                map_format))
+    if min_max_path is None:
+        min_max_path = os.path.join(
+            os.path.dirname(model_path or graph_path), 'min-max.csv')
+    min_value, max_value = io.read_min_max(min_max_path)
+    transformations = transforms.compile_transformations(
+        [transforms.SpectralTransform(),
+         transforms.MinMaxNormalize(min_=min_value, max_=max_value)],
+        inplace=True)
+
+    predict, n_classes, close = load_predict(
+        model_path, graph_path, node_names_path, batch_size, probability_map)
+    cube, file = open_cube(data_file_path)
+    shape = get_scene_shape(cube.shape, channels_idx)
+    os.makedirs(dest_path, exist_ok=True)
+    class_map = create_map(
+        os.path.join(dest_path, '{}.{}'.format(enums.Experiment.CLASS_MAP,
+                                               map_format)),
+        shape, get_class_map_dtype(n_classes, nodata_label))
+    scores_map = create_map(
+        os.path.join(dest_path, '{}.{}'.format(
+            enums.Experiment.PROBABILITY_MAP, map_format)),
+        shape, np.float32) if probability_map else None
+    try:
+        classify_scene(cube, predict, transformations, class_map, scores_map,
+                       channels_idx, tile_size, nodata_label)
+    finally:
+        for output_map in [class_map, scores_map]:
+            if output_map is not None:
+                output_map.flush()
+        if file is not None:
+            file.close()
+        close()
+
+
+if __name__ == '__main__':
+    clize.run(classify)
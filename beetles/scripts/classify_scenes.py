@@ -0,0 +1,86 @@
+"""
+Classify each pixel of multiple hyperspectral scenes in parallel with
+the pool of worker processes, each of which loads the trained model or
+the frozen graph once. The maps of each scene are stored in its own
+directory named after the scene, together with the throughput of the whole
+run in the "scheduler_metrics.csv" file.
+"""
+
+import os
+
+import clize
+from clize.parameters import multi
+
+from ml_intuition.data import io, transforms
+from ml_intuition.evaluation.scene_inference import DEFAULT_TILE_SIZE
+from ml_intuition.evaluation.scene_scheduler import SceneScheduler
+
+
+def classify(*,
+             data_file_paths: ('scene', multi(min=1)),
+             dest_path: str,
+             model_path: str = None,
+             graph_path: str = None,
+             node_names_path: str = None,
+             min_max_path: str = None,
+             n_workers: int = None,
+             n_threads: int = None,
+             channels_idx: int = 0,
+             batch_size: int = 1024,
+             tile_size: int = DEFAULT_TILE_SIZE,
+             probability_map: bool = False,
+             map_format: str = 'npy',
+             nodata_label: int = None):
+    """
+    :param data_file_paths: Paths to the scenes, either the .npy cubes or
+        the satellite .h5 files.
+    :param dest_path: Directory in which the maps of each scene are stored.
+    :param model_path: Path to the trained model.
+    :param graph_path: Path to the .pb frozen graph, used if the model path
+        is not provided.
+    :param node_names_path: Path to the .json file with the names of
+        the input and output nodes of the graph.
+    :param min_max_path: Path to the .csv file with the minimum and maximum
+        used for the normalization. If None, the "min-max.csv" file stored
+        next to the model or the graph is used.
+    :param n_workers: Number of the worker processes. If None, the number
+        of CPUs is used.
+    :param n_threads: Number of the threads of each worker. If None,
+        the CPUs are divided evenly between the workers.
+    :param channels_idx: Index at which the channels are located in the cube.
+    :param batch_size: Size of the batch for inference.
+    :param tile_size: Maximum number of pixels in a single tile dispatched
+        to the worker, a tile consists of at least one row.
+    :param probability_map: Whether to store the map of the probabilities
+        of the predicted classes.
+    :param map_format: Format of the maps, either "npy" or "tiff".
+    :param nodata_label: Label of the pixels containing nans. If None,
+        the pixels are not checked for nans.
+    """
+    if min_max_path is None:
+        min_max_path = os.path.join(
+            os.path.dirname(model_path or graph_path), 'min-max.csv')
+    min_value, max_value = io.read_min_max(min_max_path)
+    transformations = transforms.compile_transformations(
+        [transforms.SpectralTransform(),
+         transforms.MinMaxNormalize(min_=min_value, max_=max_value)],
+        inplace=True)
+    dest_paths = [os.path.join(dest_path, os.path.splitext(
+        os.path.basename(data_file_path))[0])
+        for data_file_path in data_file_paths]
+    if len(set(dest_paths)) != len(dest_paths):
+        raise ValueError('Names of the scenes have to be unique.')
+
+    with SceneScheduler(model_path, graph_path, node_names_path,
+                        transformations, n_workers, n_threads, batch_size,
+                        probability_map, channels_idx, tile_size,
+                        nodata_label) as scheduler:
+        stats = scheduler.classify(data_file_paths, dest_paths, map_format)
+    print(' '.join('{}: {:.1f}'.format(key, value)
+                   for key, value in stats.items()))
+    io.save_metrics(dest_path, {key: [value] for key, value in stats.items()},
+                    'scheduler_metrics.csv')
+
+
+if __name__ == '__main__':
+    clize.run(classify)
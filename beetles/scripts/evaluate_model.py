@@ -8,13 +8,12 @@ import clize
 import numpy as np
 import tensorflow as tf
 from clize.parameters import multi
-from sklearn.metrics import confusion_matrix
 
 from ml_intuition import enums
-from ml_intuition.data import io, transforms
-from ml_intuition.data.noise import get_noise_functions
-from ml_intuition.evaluation.performance_metrics import get_model_metrics, \
-    get_fair_model_metrics
+from ml_intuition.data import dtype_policy, io, transforms
+from ml_intuition.data.noise import get_noise_functions, inject_batch_noise
+from ml_intuition.evaluation.performance_metrics import ConfusionMatrix, \
+    get_fair_model_metrics, get_matrix_metrics
 from ml_intuition.evaluation.time_metrics import timeit
 
 
@@ -26,12 +25,18 @@ def evaluate(*,
              batch_size: int = 1024,
              noise: ('post', multi(min=0)),
              noise_sets: ('spost', multi(min=0)),
-             noise_params: str = None):
+             noise_params: str = None,
+             lazy: bool = False,
+             online_noise: bool = False,
+             seed: int = 0,
+             sparse_labels: bool = False,
+             floatx: str = None):
     """
     Function for evaluating the trained model.
 
     :param model_path: Path to the model.
-    :param data: Either path to the input data or the data dict.
+    :param data: Either path to the input data, the data dict or
+        the io.ChunkedDataset, e.g. io.LazyDataset handle.
     :param dest_path: Directory in which to store the calculated metrics
     :param n_classes: Number of classes.
     :param batch_size: Size of the batch for inference
@@ -46,55 +51,104 @@ def evaluate(*,
         functions that are specified in the noise argument.
         For the accurate description of each parameter, please
         refer to the ml_intuition/data/noise.py module.
+    :param lazy: Whether to stream the data from the .h5 file in chunks
+        instead of loading it into the memory. Used only if the path to
+        the data is provided, the file is closed on return.
+    :param online_noise: Whether to inject the noise into each chunk of
+        the test set right before its inference instead of the whole set.
+    :param seed: Seed of the noise injected into the chunks.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them.
+    :param floatx: Floating point dtype of the samples, either "float16",
+        "float32" or "float64", see ml_intuition.data.dtype_policy. If None,
+        the current dtype policy is kept.
     """
-    if type(data) is str:
-        test_dict = io.extract_set(data, enums.Dataset.TEST)
-    else:
-        test_dict = data[enums.Dataset.TEST]
-    min_max_path = os.path.join(os.path.dirname(model_path), "min-max.csv")
-    if os.path.exists(min_max_path):
-        min_value, max_value = io.read_min_max(min_max_path)
-    else:
-        min_value, max_value = data[enums.DataStats.MIN], \
-                               data[enums.DataStats.MAX]
+    if floatx is not None:
+        dtype_policy.set_floatx(floatx)
+    opened = type(data) is str and (lazy or online_noise)
+    if opened:
+        data = io.LazyDataset(data)
+    elif isinstance(data, dict) and online_noise:
+        data = io.ArrayDataset(data)
 
-    transformations = [transforms.SpectralTransform(),
-                       transforms.OneHotEncode(n_classes=n_classes),
-                       transforms.MinMaxNormalize(min_=min_value, max_=max_value)]
-    transformations = transformations + get_noise_functions(noise, noise_params) \
-        if enums.Dataset.TEST in noise_sets else transformations
+    try:
+        if isinstance(data, io.ChunkedDataset):
+            test_dict = None
+        elif type(data) is str:
+            test_dict = io.extract_set(data, enums.Dataset.TEST)
+        else:
+            test_dict = data[enums.Dataset.TEST]
+        min_max_path = os.path.join(os.path.dirname(model_path), "min-max.csv")
+        if os.path.exists(min_max_path):
+            min_value, max_value = io.read_min_max(min_max_path)
+        elif isinstance(data, io.ChunkedDataset):
+            min_value, max_value = data.min, data.max
+        else:
+            min_value, max_value = data[enums.DataStats.MIN], \
+                                   data[enums.DataStats.MAX]
 
-    test_dict = transforms.apply_transformations(test_dict, transformations)
+        transformations = [transforms.SpectralTransform(),
+                           transforms.MinMaxNormalize(min_=min_value,
+                                                      max_=max_value)]
+        if not sparse_labels:
+            transformations.insert(
+                1, transforms.OneHotEncode(n_classes=n_classes))
+        transformations = transforms.compile_transformations(
+            transformations,
+            inplace=type(data) is str or isinstance(data, io.LazyDataset))
+        test_noise = get_noise_functions(noise, noise_params) \
+            if enums.Dataset.TEST in noise_sets else []
+        if not online_noise:
+            transformations = transformations + test_noise
 
-    model = tf.keras.models.load_model(model_path, compile=True)
+        if isinstance(data, io.ChunkedDataset):
+            test_chunks = data.chunks(enums.Dataset.TEST, transformations)
+        else:
+            test_chunks = [transforms.apply_transformations(test_dict,
+                                                            transformations)]
 
-    predict = timeit(model.predict)
-    y_pred, inference_time = predict(test_dict[enums.Dataset.DATA],
-                                     batch_size=batch_size)
+        model = tf.keras.models.load_model(model_path, compile=True)
 
-    y_pred = np.argmax(y_pred, axis=-1)
-    y_true = np.argmax(test_dict[enums.Dataset.LABELS], axis=-1)
+        predict = timeit(model.predict)
+        conf_matrix, inference_time = ConfusionMatrix(n_classes), 0
+        for chunk_index, test_chunk in enumerate(test_chunks):
+            if online_noise and test_noise:
+                test_chunk[enums.Dataset.DATA] = inject_batch_noise(
+                    test_noise, test_chunk[enums.Dataset.DATA],
+                    [seed, chunk_index], transforms.NORMALIZED_RANGE)
+            chunk_pred, chunk_time = predict(test_chunk[enums.Dataset.DATA],
+                                             batch_size=batch_size)
+            conf_matrix.update(
+                test_chunk[enums.Dataset.LABELS] if sparse_labels else
+                np.argmax(test_chunk[enums.Dataset.LABELS], axis=-1),
+                np.argmax(chunk_pred, axis=-1))
+            inference_time += chunk_time
 
-    model_metrics = get_model_metrics(y_true, y_pred)
-    model_metrics['inference_time'] = [inference_time]
-    conf_matrix = confusion_matrix(y_true, y_pred)
-    io.save_metrics(dest_path=dest_path,
-                    file_name=enums.Experiment.INFERENCE_METRICS,
-                    metrics=model_metrics)
-    io.save_confusion_matrix(conf_matrix, dest_path)
-    if enums.Splits.GRIDS in model_path:
-        if type(data) is str:
-            train_dict = io.extract_set(data, enums.Dataset.TRAIN)
-            labels_in_train = np.unique(train_dict[enums.Dataset.LABELS])
-        else:
-            train_labels = data[enums.Dataset.TRAIN][enums.Dataset.LABELS]
-            if train_labels.ndim > 1:
-                train_labels = np.argmax(train_labels, axis=-1)
-            labels_in_train = np.unique(train_labels)
-        fair_metrics = get_fair_model_metrics(conf_matrix, labels_in_train)
+        model_metrics = get_matrix_metrics(conf_matrix.matrix)
+        model_metrics['inference_time'] = [inference_time]
         io.save_metrics(dest_path=dest_path,
-                        file_name=enums.Experiment.INFERENCE_FAIR_METRICS,
-                        metrics=fair_metrics)
+                        file_name=enums.Experiment.INFERENCE_METRICS,
+                        metrics=model_metrics)
+        io.save_confusion_matrix(conf_matrix.matrix, dest_path)
+        if enums.Splits.GRIDS in model_path:
+            if isinstance(data, io.ChunkedDataset):
+                labels_in_train = np.unique(data.labels(enums.Dataset.TRAIN))
+            elif type(data) is str:
+                train_dict = io.extract_set(data, enums.Dataset.TRAIN)
+                labels_in_train = np.unique(train_dict[enums.Dataset.LABELS])
+            else:
+                train_labels = data[enums.Dataset.TRAIN][enums.Dataset.LABELS]
+                if train_labels.ndim > 1:
+                    train_labels = np.argmax(train_labels, axis=-1)
+                labels_in_train = np.unique(train_labels)
+            fair_metrics = get_fair_model_metrics(conf_matrix.matrix,
+                                                  labels_in_train)
+            io.save_metrics(dest_path=dest_path,
+                            file_name=enums.Experiment.INFERENCE_FAIR_METRICS,
+                            metrics=fair_metrics)
+    finally:
+        if opened:
+            data.close()
 
 
 if __name__ == '__main__':
@@ -47,9 +47,13 @@ def run_experiments(*,
                     post_noise: ('post', multi(min=0)),
                     post_noise_sets: ('spost', multi(min=0)),
                     noise_params: str = None,
+                    sparse_labels: bool = False,
                     use_mlflow: bool = False,
                     experiment_name: str = None,
-                    run_name: str = None):
+                    run_name: str = None,
+                    cache_dir: str = None,
+                    load_once: bool = False,
+                    split_dir: str = None):
     """
     Function for running experiments given a set of hyper parameters.
     :param data_file_path: Path to the data file. Supported types are: .npy
@@ -108,10 +112,24 @@ def run_experiments(*,
         functions that are specified in pre_noise and post_noise arguments.
         For the accurate description of each parameter, please
         refer to the ml_intuition/data/noise.py module.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them.
     :param use_mlflow: Whether to log metrics and artifacts to mlflow.
     :param experiment_name: Name of the experiment. Used only if
         use_mlflow = True
     :param run_name: Name of the run. Used only if use_mlflow = True.
+    :param cache_dir: Directory of the prepared datasets cache. If provided,
+        the prepared splits are reused across invocations with identical
+        inputs and parameters.
+    :param load_once: Whether to load and preprocess the data only once and
+        share it as a read-only memory map across all runs, so that each run
+        only draws its split. Unless the pre noise is injected, the sets of
+        the split are gathered chunk by chunk from the shared samples
+        instead of being copied.
+    :param split_dir: Directory in which the indices of the split of each
+        run are stored. If provided, the labels are split chunk by chunk
+        by streaming_split.stream_split_indices instead of being split in
+        the memory.
     """
     train_size = parse_train_size(train_size)
     if use_mlflow:
@@ -125,6 +143,16 @@ def run_experiments(*,
     if dest_path is None:
         dest_path = os.path.join(os.path.curdir, "temp_artifacts")
 
+    samples, shared_samples_path = None, os.path.join(dest_path,
+                                                      'shared_samples')
+    if load_once and ground_truth_path is not None:
+        samples = prepare_data.share_samples(
+            *prepare_data.load_samples(data_file_path=data_file_path,
+                                       ground_truth_path=ground_truth_path,
+                                       background_label=background_label,
+                                       channels_idx=channels_idx),
+            dest_dir=shared_samples_path)
+
     for experiment_id in range(n_runs):
         experiment_dest_path = os.path.join(
             dest_path, '{}_{}'.format(enums.Experiment.EXPERIMENT, str(experiment_id)))
@@ -134,8 +162,21 @@ def run_experiments(*,
             data_source = None
 
         os.makedirs(experiment_dest_path, exist_ok=True)
+        run_split_dir = None if split_dir is None else os.path.join(
+            split_dir, '{}_{}'.format(enums.Experiment.EXPERIMENT,
+                                      str(experiment_id)))
         if data_file_path.endswith('.h5') and ground_truth_path is None:
             data = load_processed_h5(data_file_path=data_file_path)
+        elif samples is not None:
+            data = prepare_data.split_samples(*samples,
+                                              output_path=data_source,
+                                              train_size=train_size,
+                                              val_size=val_size,
+                                              stratified=stratified,
+                                              save_data=save_data,
+                                              seed=experiment_id,
+                                              lazy=len(pre_noise) == 0,
+                                              split_dir=run_split_dir)
         else:
             data = prepare_data.main(data_file_path=data_file_path,
                                      ground_truth_path=ground_truth_path,
@@ -146,7 +187,9 @@ def run_experiments(*,
                                      background_label=background_label,
                                      channels_idx=channels_idx,
                                      save_data=save_data,
-                                     seed=experiment_id)
+                                     seed=experiment_id,
+                                     cache_dir=cache_dir,
+                                     split_dir=run_split_dir)
         if not save_data:
             data_source = data
 
@@ -172,7 +215,8 @@ def run_experiments(*,
                           patience=patience,
                           noise=post_noise,
                           noise_sets=pre_noise_sets,
-                          noise_params=noise_params)
+                          noise_params=noise_params,
+                          sparse_labels=sparse_labels)
 
         evaluate_model.evaluate(
             model_path=os.path.join(experiment_dest_path, model_name),
@@ -182,9 +226,14 @@ def run_experiments(*,
             batch_size=batch_size,
             noise=post_noise,
             noise_sets=pre_noise_sets,
-            noise_params=noise_params)
+            noise_params=noise_params,
+            sparse_labels=sparse_labels)
         tf.keras.backend.clear_session()
 
+    if samples is not None:
+        del samples
+        shutil.rmtree(shared_samples_path)
+
     artifacts_reporter.collect_artifacts_report(experiments_path=dest_path,
                                                 dest_path=dest_path,
                                                 use_mlflow=use_mlflow)
@@ -0,0 +1,65 @@
+"""
+Generate the load of the inference service and report its throughput and
+the percentiles of the request latency. For each number of the concurrent
+connections, the requests are sent until the given number of them is
+answered, so the maximum size and wait of the micro-batches can be chosen
+for the expected load.
+"""
+
+import asyncio
+
+import clize
+import numpy as np
+from clize.parameters import multi
+
+from ml_intuition import enums
+from ml_intuition.data import io
+from ml_intuition.evaluation.inference_server import generate_load
+
+
+def main(*, address: str = 'localhost:8500',
+         dataset_path: str = None,
+         n_bands: int = 103,
+         model: str = None,
+         n_connections: ('connections', multi(min=1)),
+         n_requests: int = 1000,
+         request_size: int = 1,
+         dest_path: str = None):
+    """
+    :param address: TCP "host:port" address or path to the Unix socket
+        of the service.
+    :param dataset_path: Path to the .h5 dataset, the samples of the test
+        set are sent as the [PIXEL, CHANNELS] pixel spectra. If None,
+        random spectra are sent.
+    :param n_bands: Number of the bands of the random samples.
+    :param model: Name of the model. May be omitted if the service serves
+        only one model.
+    :param n_connections: Numbers of the concurrent connections to compare.
+    :param n_requests: Number of the requests of each configuration.
+    :param request_size: Number of pixels in a single request.
+    :param dest_path: Path to the .csv file in which the results are saved.
+        If None, results are only printed.
+    """
+    if dataset_path is None:
+        samples = np.random.rand(max(request_size, 10000), n_bands)
+    else:
+        samples = io.extract_set(dataset_path, enums.Dataset.TEST)[
+            enums.Dataset.DATA]
+    samples = samples.reshape(len(samples), -1).astype(np.float32)
+
+    loop = asyncio.get_event_loop()
+    results = {}
+    for connections in [int(value) for value in n_connections]:
+        stats = loop.run_until_complete(generate_load(
+            address, samples, n_requests, connections, request_size,
+            model))
+        print(' '.join('{}: {:.1f}'.format(key, value)
+                       for key, value in stats.items()))
+        for key, value in stats.items():
+            results.setdefault(key, []).append(round(value, 3))
+    if dest_path is not None:
+        io.save_metrics(dest_path, results)
+
+
+if __name__ == '__main__':
+    clize.run(main)
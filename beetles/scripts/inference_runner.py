@@ -10,7 +10,8 @@ import mlflow
 import tensorflow as tf
 from clize.parameters import multi
 
-from scripts import evaluate_model, prepare_data, artifacts_reporter
+from scripts import evaluate_model, prepare_data, artifacts_reporter, \
+    noise_sweep
 from ml_intuition.enums import Splits, Experiment
 from ml_intuition.data.io import load_processed_h5
 from ml_intuition.data.utils import get_mlflow_artifacts_path, parse_train_size
@@ -35,6 +36,8 @@ def run_experiments(*,
                     post_noise_sets: ('spost', multi(min=0)),
                     post_noise: ('post', multi(min=0)),
                     noise_params: str = None,
+                    sweep: bool = False,
+                    sparse_labels: bool = False,
                     use_mlflow: bool = False,
                     experiment_name: str = None,
                     run_name: str = None):
@@ -80,6 +83,13 @@ def run_experiments(*,
         functions that are specified in pre_noise and post_noise arguments.
         For the accurate description of each parameter, please
         refer to the ml_intuition/data/noise.py module.
+    :param sweep: Whether to evaluate each model once against the grid of
+        noise configurations given by the noise_params, in which parameters
+        given as lists span the axes of the grid. Only the corrupted samples
+        are predicted again for each configuration and one robustness
+        table per model is stored instead of the inference metrics.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them.
     :param use_mlflow: Whether to log metrics and artifacts to mlflow.
     :param experiment_name: Name of the experiment. Used only if
         use_mlflow = True
@@ -124,18 +134,36 @@ def run_experiments(*,
                                             save_data=save_data,
                                             seed=experiment_id)
 
-        evaluate_model.evaluate(
-            model_path=model_path,
-            data=data_source,
-            dest_path=experiment_dest_path,
-            n_classes=n_classes,
-            noise=post_noise,
-            noise_sets=post_noise_sets,
-            noise_params=noise_params,
-            batch_size=batch_size)
+        if sweep:
+            noise_sweep.sweep(
+                model_path=model_path,
+                data=data_source,
+                dest_path=experiment_dest_path,
+                n_classes=n_classes,
+                noise=post_noise,
+                noise_params=noise_params,
+                batch_size=batch_size,
+                seed=experiment_id,
+                sparse_labels=sparse_labels)
+        else:
+            evaluate_model.evaluate(
+                model_path=model_path,
+                data=data_source,
+                dest_path=experiment_dest_path,
+                n_classes=n_classes,
+                noise=post_noise,
+                noise_sets=post_noise_sets,
+                noise_params=noise_params,
+                batch_size=batch_size,
+                sparse_labels=sparse_labels)
 
         tf.keras.backend.clear_session()
 
+    if sweep:
+        if use_mlflow:
+            mlflow.log_artifacts(dest_path, artifact_path=dest_path)
+            shutil.rmtree(dest_path)
+        return
     artifacts_reporter.collect_artifacts_report(experiments_path=dest_path,
                                                 dest_path=dest_path,
                                                 use_mlflow=use_mlflow)
@@ -0,0 +1,83 @@
+"""
+Serve the trained models or the frozen graphs over the Unix socket or TCP.
+Each model is loaded once and the concurrent requests are coalesced into
+micro-batches. The normalization is read from the "min-max.csv" file stored
+next to each model and the names of the nodes of each graph from the file
+written by the freeze_model script.
+"""
+
+import asyncio
+import os
+from typing import Tuple
+
+import clize
+from clize.parameters import multi
+
+from ml_intuition.evaluation.inference_server import DEFAULT_MAX_BATCH_SIZE, \
+    DEFAULT_MAX_WAIT, InferenceServer, MicroBatcher, load_model_predict
+
+NAME_SEPARATOR = '='
+
+
+def parse_model(spec: str) -> Tuple[str, str]:
+    """
+    Split the "name=path" specification of the model. If the name is
+    omitted, the name of the directory of the model is used.
+
+    :param spec: Specification of the model.
+    :return: Name of the model and its path.
+    """
+    name, separator, path = spec.rpartition(NAME_SEPARATOR)
+    if not separator:
+        name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return name, path
+
+
+def serve(*,
+          model_paths: ('model', multi(min=0)),
+          graph_paths: ('graph', multi(min=0)),
+          address: str = 'localhost:8500',
+          max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+          max_wait: float = DEFAULT_MAX_WAIT):
+    """
+    :param model_paths: Trained models to serve, either the paths or
+        the "name=path" specifications.
+    :param graph_paths: Frozen .pb graphs to serve, either the paths or
+        the "name=path" specifications.
+    :param address: TCP "host:port" address or path to the Unix socket.
+    :param max_batch_size: Maximum number of samples in a micro-batch.
+    :param max_wait: Maximum time in seconds the first request of
+        the micro-batch waits for the other ones.
+    """
+    specs = [(name, {'model_path': path})
+             for name, path in map(parse_model, model_paths)] + \
+        [(name, {'graph_path': path})
+         for name, path in map(parse_model, graph_paths)]
+    if not specs:
+        raise ValueError('At least one model or graph has to be provided.')
+    names = [name for name, _ in specs]
+    if len(set(names)) != len(names):
+        raise ValueError('Names of the models have to be unique.')
+
+    loop = asyncio.get_event_loop()
+    batchers, closes = {}, []
+    for name, kwargs in specs:
+        predict, close = load_model_predict(batch_size=max_batch_size,
+                                            **kwargs)
+        batchers[name] = MicroBatcher(predict, max_batch_size, max_wait)
+        closes.append(close)
+    server = InferenceServer(batchers)
+    loop.run_until_complete(server.start(address))
+    print('Serving {} at {}'.format(', '.join(names), address))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        for close in closes:
+            close()
+
+
+if __name__ == '__main__':
+    clize.run(serve)
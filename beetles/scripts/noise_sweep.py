@@ -0,0 +1,113 @@
+"""
+Evaluate the robustness of the trained model against the grid of noise
+configurations. The model and the test set are loaded once, the clean
+predictions are cached and for each configuration only the samples
+corrupted by the noise are predicted again.
+"""
+
+import json
+import os
+from typing import Dict, Union
+
+import clize
+import numpy as np
+import tensorflow as tf
+from clize.parameters import multi
+
+from ml_intuition import enums
+from ml_intuition.data import io, transforms
+from ml_intuition.data.noise import get_corrupted_samples, \
+    get_noise_functions, get_noise_params_grid
+from ml_intuition.evaluation.performance_metrics import get_model_metrics
+from ml_intuition.evaluation.time_metrics import timeit
+
+
+def sweep(*,
+          model_path: str,
+          data: Union[str, Dict],
+          dest_path: str,
+          n_classes: int,
+          batch_size: int = 1024,
+          noise: ('post', multi(min=1)),
+          noise_params: str,
+          seed: int = 0,
+          sparse_labels: bool = False):
+    """
+    Function for evaluating the trained model on the noisy test sets.
+
+    :param model_path: Path to the model.
+    :param data: Either path to the input data or the data dict.
+    :param dest_path: Directory in which to store the robustness table.
+    :param n_classes: Number of classes.
+    :param batch_size: Size of the batch for inference.
+    :param noise: List containing names of used noise injection methods
+        that are performed after the normalization transformations.
+    :param noise_params: JSON containing the grid of the parameters of noise
+        injection methods. Each parameter given as a list spans one axis of
+        the grid, e.g. "{"mean": 0, "std": 1, "pa": [0.1, 0.2], "pb": 0.5}".
+    :param seed: Seed of the noise, the same for each configuration.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them.
+    """
+    min_max_path = os.path.join(os.path.dirname(model_path), "min-max.csv")
+    if type(data) is str:
+        test_dict = io.extract_set(data, enums.Dataset.TEST)
+        if os.path.exists(min_max_path):
+            min_value, max_value = io.read_min_max(min_max_path)
+        else:
+            with io.LazyDataset(data) as dataset:
+                min_value, max_value = dataset.min, dataset.max
+    else:
+        test_dict = data[enums.Dataset.TEST]
+        if os.path.exists(min_max_path):
+            min_value, max_value = io.read_min_max(min_max_path)
+        else:
+            min_value, max_value = data[enums.DataStats.MIN], \
+                                   data[enums.DataStats.MAX]
+
+    transformations = [transforms.SpectralTransform(),
+                       transforms.MinMaxNormalize(min_=min_value,
+                                                  max_=max_value)]
+    if not sparse_labels:
+        transformations.insert(1, transforms.OneHotEncode(n_classes=n_classes))
+    transformations = transforms.compile_transformations(
+        transformations,
+        inplace=type(data) is str)
+    test_dict = transforms.apply_transformations(test_dict, transformations)
+    clean_data = test_dict[enums.Dataset.DATA]
+    y_true = test_dict[enums.Dataset.LABELS] if sparse_labels else \
+        np.argmax(test_dict[enums.Dataset.LABELS], axis=-1)
+
+    model = tf.keras.models.load_model(model_path, compile=True)
+    predict = timeit(model.predict)
+    clean_pred, _ = predict(clean_data, batch_size=batch_size)
+    clean_pred = np.argmax(clean_pred, axis=-1)
+
+    robustness = {}
+    for params in get_noise_params_grid(noise_params):
+        random_state = np.random.RandomState(seed)
+        noisy_data = clean_data.copy()
+        for noise_function in get_noise_functions(noise, json.dumps(params)):
+            noisy_data, _ = noise_function(noisy_data, None,
+                                           random_state=random_state)
+        corrupted = get_corrupted_samples(clean_data, noisy_data)
+        y_pred, inference_time = clean_pred.copy(), 0
+        if len(corrupted) > 0:
+            corrupted_pred, inference_time = predict(noisy_data[corrupted],
+                                                     batch_size=batch_size)
+            y_pred[corrupted] = np.argmax(corrupted_pred, axis=-1)
+        row = {key: [value] for key, value in params.items()}
+        row['n_corrupted'] = [len(corrupted)]
+        row.update(get_model_metrics(y_true, y_pred))
+        row['inference_time'] = [inference_time]
+        for key, value in row.items():
+            robustness.setdefault(key, []).extend(value)
+
+    os.makedirs(dest_path, exist_ok=True)
+    io.save_metrics(dest_path=dest_path,
+                    file_name=enums.Experiment.ROBUSTNESS_METRICS,
+                    metrics=robustness)
+
+
+if __name__ == '__main__':
+    clize.run(sweep)
@@ -5,18 +5,154 @@ split it into train, test and val sets and save them in .h5 file with
 """
 
 import os
+import shutil
 
 import clize
+import numpy as np
 from clize.parameters import argument_decorator
 from clize.parameters import multi
 
+import ml_intuition.data.dtype_policy as dtype_policy
 import ml_intuition.data.preprocessing as preprocessing
 import ml_intuition.data.io as io
 import ml_intuition.data.utils as utils
-from typing import Union, List
+import ml_intuition.enums as enums
+from ml_intuition.data.cache import DatasetCache, GB, get_cache_key
+from ml_intuition.data.stats import StatsAccumulator, compute_stats, \
+    read_stats
+from ml_intuition.data.streaming_split import stream_split_indices
+from typing import Dict, Union, List, Tuple
 EXTENSION = 1
 
 
+def load_samples(data_file_path: str, ground_truth_path: str,
+                 background_label: int = 0,
+                 channels_idx: int = 0,
+                 mmap: bool = False,
+                 align_tile_size: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the data and labels, reshape them to [SAMPLES, ...] dimensions,
+    remove samples containing nans and the background and normalize the
+    labels. The result does not depend on the seed of the split, so it can
+    be shared by all runs of the experiment.
+    For the description of parameters please refer to the main function.
+
+    :return: Preprocessed data and labels
+    :raises TypeError: When provided data or labels file is not supported
+    """
+    if data_file_path.endswith('.npy') and ground_truth_path.endswith('.npy') \
+            and mmap:
+        data, labels = preprocessing.get_labelled_samples(
+            *io.load_npy(data_file_path, ground_truth_path, mmap_mode='r'),
+            background_label=background_label, channels_idx=channels_idx)
+        return data, preprocessing.normalize_labels(labels)
+    elif data_file_path.endswith('.npy') and \
+            ground_truth_path.endswith('.npy'):
+        data, labels = io.load_npy(data_file_path, ground_truth_path)
+        data, labels = preprocessing.reshape_cube_to_2d_samples(
+            data, labels, channels_idx)
+        remove_nan = False
+    elif data_file_path.endswith('.h5') and ground_truth_path.endswith('.tiff'):
+        data, gt_transform_mat = io.load_satellite_h5(data_file_path)
+        labels = io.load_tiff(ground_truth_path)
+        data_2d_shape = data.shape[1:]
+        labels = preprocessing.align_ground_truth(data_2d_shape, labels,
+                                                  gt_transform_mat,
+                                                  align_tile_size)
+        data, labels = preprocessing.reshape_cube_to_2d_samples(data, labels,
+                                                                channels_idx)
+        remove_nan = True
+    else:
+        raise ValueError(
+            "The following data file type is not supported: {}".format(
+                os.path.splitext(data_file_path)[EXTENSION]))
+
+    return preprocessing.filter_samples(data, labels, background_label,
+                                        remove_nan)
+
+
+def share_samples(data: np.ndarray, labels: np.ndarray,
+                  dest_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Store the preprocessed data and labels as .npy files and return them as
+    read-only memory maps, so that consecutive runs share one copy
+    of the samples.
+
+    :param data: Preprocessed data.
+    :param labels: Preprocessed labels.
+    :param dest_dir: Directory in which the .npy files are stored.
+    :return: Memory mapped data and labels.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    data_path, labels_path = os.path.join(dest_dir, 'data.npy'), \
+                             os.path.join(dest_dir, 'labels.npy')
+    np.save(data_path, data)
+    np.save(labels_path, labels)
+    return io.load_npy(data_path, labels_path, mmap_mode='r')
+
+
+def split_samples(data: np.ndarray, labels: np.ndarray, *,
+                  output_path: str = None,
+                  train_size: Union[List, float, int],
+                  val_size: float = 0.1,
+                  stratified: bool = True,
+                  save_data: bool = False,
+                  seed: int = 0,
+                  lazy: bool = False,
+                  split_dir: str = None,
+                  **storage_options) -> Union[Dict, io.IndexedDataset, None]:
+    """
+    Split already preprocessed samples into train, val and test sets.
+    The samples are not modified, therefore the same (possibly memory
+    mapped) samples can be split for each run. Only the indices of
+    the split and the gather of the sets depend on the seed.
+    For the description of parameters please refer to the main function.
+
+    :param data: Preprocessed data returned by load_samples.
+    :param labels: Preprocessed labels returned by load_samples.
+    :param lazy: Whether to return the io.IndexedDataset gathering the sets
+        chunk by chunk instead of copying them. Ignored if the data is saved.
+    :param split_dir: Directory in which the indices of the split are
+        stored. If provided, the labels are split chunk by chunk
+        by streaming_split.stream_split_indices, so they are never loaded
+        into the memory as a whole.
+    :param storage_options: Storage layout of the saved .h5 file, passed
+        to io.save_md5.
+    :return: Data dict, io.IndexedDataset or None if the data is saved.
+    """
+    if split_dir is None:
+        indices = preprocessing.get_split_indices(labels, train_size,
+                                                  val_size, stratified,
+                                                  seed=seed)
+    else:
+        indices = stream_split_indices(labels, split_dir, train_size,
+                                       val_size, stratified, seed=seed)
+    if lazy and not save_data:
+        return io.IndexedDataset(data, labels, indices)
+    return _output_split(indices.materialize(data, labels), output_path,
+                         save_data, **storage_options)
+
+
+def _output_split(split: Tuple, output_path: str, save_data: bool,
+                  stats: StatsAccumulator = None,
+                  **storage_options) -> Union[Dict, None]:
+    """
+    Either save the split as .h5 file or build the data dict.
+
+    :param split: train_x, train_y, val_x, val_y, test_x, test_y
+    :param output_path: Path to the output .h5 file.
+    :param save_data: Whether to save the split.
+    :param stats: Statistics of the train set. If None, they are computed.
+    :param storage_options: Storage layout passed to io.save_md5.
+    :return: Data dict or None if the data is saved.
+    """
+    if save_data:
+        io.save_md5(output_path, *split, stats=stats, **storage_options)
+        return None
+    else:
+        return utils.build_data_dict(*split, stats=stats)
+
+
 def main(*,
          data_file_path: str,
          ground_truth_path: str,
@@ -27,7 +163,19 @@ def main(*,
          background_label: int = 0,
          channels_idx: int = 0,
          save_data: bool = False,
-         seed: int = 0):
+         seed: int = 0,
+         chunk_size: int = None,
+         compression: str = None,
+         compression_level: int = None,
+         shuffle_filter: bool = False,
+         storage_dtype: str = None,
+         cache_dir: str = None,
+         cache_size_limit: float = 20,
+         invalidate_cache: bool = False,
+         mmap: bool = False,
+         align_tile_size: int = None,
+         split_dir: str = None,
+         floatx: str = None):
     """
     :param data_file_path: Path to the data file. Supported types are: .npy
     :param ground_truth_path: Path to the data file.
@@ -55,40 +203,93 @@ def main(*,
                          data
     :param save_data: Whether to save data as .md5 or to return it as a dict
     :param seed: Seed used for data shuffling
+    :param chunk_size: Number of samples in a single chunk of the saved
+        .h5 subsets. Used only if save_data is set to True
+    :param compression: Compression filter of the saved .h5 subsets,
+        either "gzip" or "lzf". Used only if save_data is set to True
+    :param compression_level: Level of the gzip compression (0-9)
+    :param shuffle_filter: Whether to apply the byte shuffle filter
+    :param storage_dtype: Reduced dtype of the saved samples, either
+        "float16" or "uint16". Used only if save_data is set to True
+    :param cache_dir: Directory of the prepared datasets cache. If provided,
+        the split is looked up by the hash of the input files fingerprints
+        and the preparation parameters and computed only on a cache miss
+    :param cache_size_limit: Maximum size of the cache in GB, the least
+        recently used datasets are evicted when it is exceeded
+    :param invalidate_cache: Whether to drop the cached dataset for the given
+        inputs and parameters and prepare it again
+    :param mmap: Whether to memory map the .npy cube instead of loading it,
+        only the samples of the labelled pixels are then gathered from it,
+        so the cube can be larger than the available memory
+    :param align_tile_size: Size of the tiles in which the ground truth is
+        aligned to the satellite cube by a pool of threads. The labels of
+        the pixels mapped to the boundary between two ground truth pixels
+        may differ from the alignment at once. If None, the whole ground
+        truth is aligned at once
+    :param split_dir: Directory in which the indices of the split are
+        stored. If provided, the labels are split chunk by chunk by
+        streaming_split.stream_split_indices instead of being split in
+        the memory. The indices are not written when the split is read
+        from the cache
+    :param floatx: Floating point dtype of the samples, either "float16",
+        "float32" or "float64", see ml_intuition.data.dtype_policy. If None,
+        the current dtype policy is kept
     :raises TypeError: When provided data or labels file is not supported
     """
+    if floatx is not None:
+        dtype_policy.set_floatx(floatx)
     train_size = utils.parse_train_size(train_size)
-    if data_file_path.endswith('.npy') and ground_truth_path.endswith('.npy'):
-        data, labels = io.load_npy(data_file_path, ground_truth_path)
-        data, labels = preprocessing.reshape_cube_to_2d_samples(
-            data, labels, channels_idx)
-    elif data_file_path.endswith('.h5') and ground_truth_path.endswith('.tiff'):
-        data, gt_transform_mat = io.load_satellite_h5(data_file_path)
-        labels = io.load_tiff(ground_truth_path)
-        data_2d_shape = data.shape[1:]
-        labels = preprocessing.align_ground_truth(data_2d_shape, labels,
-                                                  gt_transform_mat)
-        data, labels = preprocessing.reshape_cube_to_2d_samples(data, labels,
-                                                                channels_idx)
-        data, labels = preprocessing.remove_nan_samples(data, labels)
-    else:
-        raise ValueError(
-            "The following data file type is not supported: {}".format(
-                os.path.splitext(data_file_path)[EXTENSION]))
+    cached_path, cache = None, None
+    if cache_dir is not None:
+        cache = DatasetCache(cache_dir, cache_size_limit * GB)
+        cache_key = get_cache_key([data_file_path, ground_truth_path],
+                                  train_size=train_size, val_size=val_size,
+                                  stratified=stratified,
+                                  background_label=background_label,
+                                  channels_idx=channels_idx, seed=seed,
+                                  align_tile_size=align_tile_size,
+                                  streaming_split=split_dir is not None,
+                                  floatx=str(dtype_policy.floatx()))
+        if invalidate_cache:
+            cache.invalidate(cache_key)
+        cached_path = cache.get(cache_key)
 
-    data = data[labels != background_label]
-    labels = labels[labels != background_label]
-    labels = preprocessing.normalize_labels(labels)
-    train_x, train_y, val_x, val_y, test_x, test_y = \
-        preprocessing.train_val_test_split(data, labels, train_size, val_size,
-                                           stratified, seed=seed)
+    storage_options = {'chunk_size': chunk_size, 'compression': compression,
+                       'compression_level': compression_level,
+                       'shuffle_filter': shuffle_filter,
+                       'storage_dtype': storage_dtype}
+    split, stats = None, None
+    if cached_path is None:
+        data, labels = load_samples(data_file_path, ground_truth_path,
+                                    background_label, channels_idx, mmap,
+                                    align_tile_size)
+        if split_dir is None:
+            split = preprocessing.train_val_test_split(
+                data, labels, train_size, val_size, stratified, seed=seed)
+        else:
+            split = stream_split_indices(labels, split_dir, train_size,
+                                         val_size, stratified,
+                                         seed=seed).materialize(data, labels)
+        if cache is not None:
+            stats = compute_stats(*split[:2])
+            cached_path = cache.put(cache_key, *split, stats=stats)
 
-    if save_data:
-        io.save_md5(output_path, train_x, train_y, val_x, val_y, test_x, test_y)
+    # The cached file is stored with the default layout
+    if save_data and cached_path is not None and \
+            not any(storage_options.values()):
+        shutil.copyfile(cached_path, output_path)
         return None
-    else:
-        return utils.build_data_dict(train_x, train_y, val_x, val_y, test_x,
-                                     test_y)
+    if split is None:
+        data = io.load_processed_h5(cached_path)
+        if not save_data:
+            return data
+        split = [data[subset_key][data_key]
+                 for subset_key in [enums.Dataset.TRAIN, enums.Dataset.VAL,
+                                    enums.Dataset.TEST]
+                 for data_key in [enums.Dataset.DATA, enums.Dataset.LABELS]]
+        stats = read_stats(data)
+    return _output_split(split, output_path, save_data, stats=stats,
+                         **storage_options)
 
 
 if __name__ == '__main__':
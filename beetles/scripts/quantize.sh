@@ -10,6 +10,7 @@
 #   6: Batch size
 #   7: Output directory
 #   8: GPU
+#   9: Whether to draw a stratified calibration subset (0 or 1), defaults to 0
 
 
 INPUT_NODE_NAME=$(jq -r '.input_node' "$1")
@@ -18,6 +19,8 @@ OUTPUT_NODE_NAME=$(jq -r '.output_node' "$1")
 export INPUT_NODE_NAME
 export DATA_PATH=$3
 export BATCH_SIZE="$6"
+export CALIB_ITER=15
+export CALIB_STRATIFIED="${9:-0}"
 
 decent_q quantize \
  --input_frozen_graph "$2" \
@@ -27,5 +30,5 @@ decent_q quantize \
  --input_fn "$5" \
  --method 1 \
  --gpu "$8" \
- --calib_iter 15 \
+ --calib_iter "$CALIB_ITER" \
  --output_dir "$7" \
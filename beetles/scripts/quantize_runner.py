@@ -25,7 +25,8 @@ def run_experiments(*,
                     train_size: ('train_size', multi(min=0)),
                     batch_size: int = 64,
                     stratified: bool = True,
-                    gpu: bool = 0):
+                    gpu: bool = 0,
+                    stratified_calibration: bool = False):
     """
     Function for running experiments given a set of hyperparameters.
     :param input_dir: Directory with saved data and models, each in separate
@@ -57,6 +58,9 @@ def run_experiments(*,
                  stratified, defaults to True
     :param batch_size: Batch size
     :param gpu: Whether to run quantization on gpu.
+    :param stratified_calibration: Whether to calibrate the quantization on
+        a stratified subset of the training set drawn once, instead of
+        consecutive batches.
     """
     for experiment_id in range(n_runs):
         experiment_dest_path = os.path.join(
@@ -97,7 +101,7 @@ def run_experiments(*,
               '?,{},1,1'.format(channels_count) + ' ' + \
               'ml_intuition.data.input_fn.calibrate_2d_input' + ' ' + \
               '128' + ' ' + experiment_dest_path + \
-              ' ' + str(gpu)
+              ' ' + str(gpu) + ' ' + str(int(stratified_calibration))
         subprocess.call(cmd, shell=True, env=os.environ.copy())
 
         graph_path = os.path.join(experiment_dest_path,
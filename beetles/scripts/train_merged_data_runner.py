@@ -3,6 +3,7 @@ Run experiments given set of hyperparameters.
 """
 
 import os
+import shutil
 
 import clize
 import tensorflow as tf
@@ -11,7 +12,7 @@ from scripts import prepare_data, train_model
 
 import ml_intuition.data.utils as utils
 import ml_intuition.enums as enums
-from ml_intuition.data import noise
+from ml_intuition.data import io, noise
 
 
 def run_experiments(*,
@@ -41,7 +42,12 @@ def run_experiments(*,
                     pre_noise_sets: ('spre', multi(min=0)),
                     post_noise: ('post', multi(min=0)),
                     post_noise_sets: ('spost', multi(min=0)),
-                    noise_params: str = None):
+                    noise_params: str = None,
+                    load_once: bool = False,
+                    sparse_labels: bool = False,
+                    out_of_core: bool = False,
+                    scene_weights: ('scene_weight', multi(min=0)),
+                    split_dir: str = None):
     """
     Function for running experiments given a set of hyperparameters.
     :param data_file_paths: Paths to the data files. Supported types are:
@@ -101,7 +107,40 @@ def run_experiments(*,
         functions that are specified in pre_noise and post_noise arguments.
         For the accurate description of each parameter, please
         refer to the ml_intuition/data/noise.py module.
+    :param load_once: Whether to load and preprocess each scene only once and
+        share it as a read-only memory map across all runs, so that each run
+        only draws its split.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them.
+    :param out_of_core: Whether to keep the split of each scene in its own
+        .h5 file, or the memory map shared when load_once is set, and stream
+        the training batches from all scenes instead of merging them
+        in the memory. The noise cannot be injected before the training
+        in this mode.
+    :param scene_weights: Probabilities of drawing the training batch from
+        each scene in the out_of_core mode, defaults to the shares of
+        the scenes in the training set.
+    :param split_dir: Directory in which the indices of the split of each
+        scene in each run are stored. If provided, the labels are split
+        chunk by chunk by streaming_split.stream_split_indices instead of
+        being split in the memory.
     """
+    if out_of_core and len(pre_noise) > 0:
+        raise ValueError('The noise cannot be injected into the scenes '
+                         'before the out-of-core training.')
+    scene_weights = [float(weight) for weight in scene_weights] or None
+    shared_samples_path = os.path.join(dest_path, 'shared_samples')
+    scenes_samples = [None] * len(data_file_paths)
+    if load_once:
+        scenes_samples = [
+            prepare_data.share_samples(
+                *prepare_data.load_samples(data_file_path=data_file_path,
+                                           ground_truth_path=ground_truth_path,
+                                           background_label=background_label,
+                                           channels_idx=channels_idx),
+                dest_dir=os.path.join(shared_samples_path, str(scene_id)))
+            for scene_id, data_file_path in enumerate(data_file_paths)]
+
     for experiment_id in range(n_runs):
         experiment_dest_path = os.path.join(
             dest_path, 'experiment_' + str(experiment_id))
@@ -111,26 +150,72 @@ def run_experiments(*,
             data_source = None
 
         os.makedirs(experiment_dest_path, exist_ok=True)
-        data_to_merge = []
-        for data_file_path in data_file_paths:
-            data = prepare_data.main(data_file_path=data_file_path,
-                                     ground_truth_path=ground_truth_path,
-                                     output_path=data_source,
-                                     train_size=train_size,
-                                     val_size=val_size,
-                                     stratified=stratified,
-                                     background_label=background_label,
-                                     channels_idx=channels_idx,
-                                     save_data=save_data,
-                                     seed=experiment_id)
-            del data[enums.Dataset.TEST]
-            data_to_merge.append(data)
+        scenes_split_dirs = [None] * len(data_file_paths)
+        if split_dir is not None:
+            scenes_split_dirs = [
+                os.path.join(split_dir, 'experiment_' + str(experiment_id),
+                             'scene_{}'.format(scene_id))
+                for scene_id in range(len(data_file_paths))]
+        if out_of_core:
+            scenes = []
+            for scene_id, (data_file_path, samples, scene_split_dir) in \
+                    enumerate(zip(data_file_paths, scenes_samples,
+                                  scenes_split_dirs)):
+                if samples is not None:
+                    scenes.append(prepare_data.split_samples(
+                        *samples, train_size=train_size, val_size=val_size,
+                        stratified=stratified, lazy=True, seed=experiment_id,
+                        split_dir=scene_split_dir))
+                else:
+                    scene_path = os.path.join(experiment_dest_path,
+                                              'scene_{}.h5'.format(scene_id))
+                    prepare_data.main(data_file_path=data_file_path,
+                                      ground_truth_path=ground_truth_path,
+                                      output_path=scene_path,
+                                      train_size=train_size,
+                                      val_size=val_size,
+                                      stratified=stratified,
+                                      background_label=background_label,
+                                      channels_idx=channels_idx,
+                                      save_data=True,
+                                      seed=experiment_id,
+                                      split_dir=scene_split_dir)
+                    scenes.append(io.LazyDataset(scene_path))
+            data_source = io.MergedDataset(scenes, scene_weights)
+        else:
+            data_to_merge = []
+            for data_file_path, samples, scene_split_dir in zip(
+                    data_file_paths, scenes_samples, scenes_split_dirs):
+                if samples is not None:
+                    data = prepare_data.split_samples(*samples,
+                                                      output_path=data_source,
+                                                      train_size=train_size,
+                                                      val_size=val_size,
+                                                      stratified=stratified,
+                                                      save_data=save_data,
+                                                      seed=experiment_id,
+                                                      split_dir=scene_split_dir)
+                else:
+                    data = prepare_data.main(
+                        data_file_path=data_file_path,
+                        ground_truth_path=ground_truth_path,
+                        output_path=data_source,
+                        train_size=train_size,
+                        val_size=val_size,
+                        stratified=stratified,
+                        background_label=background_label,
+                        channels_idx=channels_idx,
+                        save_data=save_data,
+                        seed=experiment_id,
+                        split_dir=scene_split_dir)
+                del data[enums.Dataset.TEST]
+                data_to_merge.append(data)
 
-        data = utils.merge_datasets(data_to_merge)
-        del data_to_merge
+            data = utils.merge_datasets(data_to_merge)
+            del data_to_merge
 
-        if not save_data:
-            data_source = data
+            if not save_data:
+                data_source = data
 
         if len(pre_noise) > 0:
             noise.inject_noise(data_source=data_source,
@@ -154,10 +239,17 @@ def run_experiments(*,
                           patience=patience,
                           noise=post_noise,
                           noise_sets=pre_noise_sets,
-                          noise_params=noise_params)
+                          noise_params=noise_params,
+                          sparse_labels=sparse_labels)
 
+        if out_of_core:
+            data_source.close()
         tf.keras.backend.clear_session()
 
+    if load_once:
+        del scenes_samples
+        shutil.rmtree(shared_samples_path)
+
 
 if __name__ == '__main__':
     clize.run(run_experiments)
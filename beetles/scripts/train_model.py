@@ -10,8 +10,10 @@ import tensorflow as tf
 from clize.parameters import multi
 
 from ml_intuition import enums, models
-from ml_intuition.data import io, transforms
-from ml_intuition.data.noise import get_noise_functions
+from ml_intuition.data import dtype_policy, io, transforms
+from ml_intuition.data.cache import get_cache_key
+from ml_intuition.data.noise import get_noise_functions, get_noise_stage
+from ml_intuition.data.stats import compute_stats, read_stats
 from ml_intuition.evaluation import time_metrics
 
 
@@ -33,7 +35,14 @@ def train(*,
           seed: int = 0,
           noise: ('post', multi(min=0)),
           noise_sets: ('spost', multi(min=0)),
-          noise_params: str = None):
+          noise_params: str = None,
+          lazy: bool = False,
+          online_noise: bool = False,
+          sparse_labels: bool = False,
+          shuffle_buffer_size: int = None,
+          cache_path: str = None,
+          band_normalization: bool = False,
+          floatx: str = None):
     """
     Function for training tensorflow models given a dataset.
 
@@ -47,8 +56,9 @@ def train(*,
     :param n_classes: Number of classes.
     :param lr: Learning rate for the model, i.e., regulates the size of the step
         in the gradient descent process.
-    :param data: Either path to the input data or the data dict itself.
-        First dimension of the dataset should be the number of samples.
+    :param data: Either path to the input data, the data dict itself or
+        the io.ChunkedDataset, e.g. io.LazyDataset handle. First dimension
+        of the dataset should be the number of samples.
     :param batch_size: Size of the batch used in training phase,
         it is the size of samples per gradient step.
     :param epochs: Number of epochs for model to train.
@@ -68,68 +78,173 @@ def train(*,
         functions that are specified in the noise argument.
         For the accurate description of each parameter, please
         refer to the ml_intuition/data/noise.py module.
+    :param lazy: Whether to stream the data from the .h5 file in chunks
+        instead of loading it into the memory. Used only if the path to
+        the data is provided, the file is closed on return.
+    :param online_noise: Whether to inject the noise into each batch by
+        the tf.data map stage instead of the whole sets before the training.
+        The noise of each batch is seeded by the seed and the index of
+        the batch, so each epoch sees fresh noise.
+    :param sparse_labels: Whether to keep the labels as the vector of
+        class indices instead of one-hot encoding them, the model is then
+        trained with the sparse categorical cross-entropy.
+    :param shuffle_buffer_size: Number of samples in the shuffle buffer
+        of the streamed training set. Used only if the data is streamed.
+    :param cache_path: Path prefix of the local files caching the transformed
+        training and validation sets after the first epoch, suffixed with
+        the key of the dataset, normalization and noise and the name of
+        the set. The order of the chunks is then drawn only in the first
+        epoch. The files are removed after the training. Used only if
+        the data is streamed.
+    :param band_normalization: Whether to normalize each band with its own
+        min and max values, read from the statistics stored with the dataset.
+        The values are saved in the "min-max.csv" used by the evaluation.
+    :param floatx: Floating point dtype of the samples, either "float16",
+        "float32" or "float64", see ml_intuition.data.dtype_policy. If None,
+        the current dtype policy is kept.
     """
 
     # Reproducibility
     tf.reset_default_graph()
     tf.set_random_seed(seed=seed)
     np.random.seed(seed=seed)
-
-    if type(data) is str:
-        train_dict = io.extract_set(data, enums.Dataset.TRAIN)
-        val_dict = io.extract_set(data, enums.Dataset.VAL)
-        min_, max_ = train_dict[enums.DataStats.MIN], \
-            train_dict[enums.DataStats.MAX]
-    else:
-        train_dict = data[enums.Dataset.TRAIN]
-        val_dict = data[enums.Dataset.VAL]
-        min_, max_ = data[enums.DataStats.MIN], \
-            data[enums.DataStats.MAX]
-
-    transformations = [transforms.SpectralTransform(),
-                       transforms.OneHotEncode(n_classes=n_classes),
-                       transforms.MinMaxNormalize(min_=min_, max_=max_)]
-
-    tr_transformations = transformations + get_noise_functions(noise, noise_params) \
-        if enums.Dataset.TRAIN in noise_sets else transformations
-    val_transformations = transformations + get_noise_functions(noise, noise_params) \
-        if enums.Dataset.VAL in noise_sets else transformations
-
-    train_dict = transforms.apply_transformations(train_dict, tr_transformations)
-    val_dict = transforms.apply_transformations(val_dict, val_transformations)
-
-    model = models.get_model(model_key=model_name, kernel_size=kernel_size,
-                             n_kernels=n_kernels, n_layers=n_layers,
-                             input_size=sample_size, n_classes=n_classes)
-    model.summary()
-    model.compile(tf.keras.optimizers.Adam(lr=lr),
-                  'categorical_crossentropy',
-                  metrics=['accuracy'])
-
-    time_history = time_metrics.TimeHistory()
-    mcp_save = tf.keras.callbacks.ModelCheckpoint(
-        os.path.join(dest_path, model_name), save_best_only=True,
-        monitor='val_loss', mode='min')
-    early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_loss',
-                                                      patience=patience)
-    callbacks = [time_history, mcp_save, early_stopping]
-    history = model.fit(x=train_dict[enums.Dataset.DATA],
-                        y=train_dict[enums.Dataset.LABELS],
-                        epochs=epochs,
-                        verbose=verbose,
-                        shuffle=shuffle,
-                        validation_data=(val_dict[enums.Dataset.DATA],
-                                         val_dict[enums.Dataset.LABELS]),
-                        callbacks=callbacks,
-                        batch_size=batch_size)
-
-    history.history[time_metrics.TimeHistory.__name__] = time_history.average
-    io.save_metrics(dest_path=dest_path,
-                    file_name='training_metrics.csv',
-                    metrics=history.history)
-
-    np.savetxt(os.path.join(dest_path, 'min-max.csv'),
-               np.array([min_, max_]), delimiter=',', fmt='%f')
+    if floatx is not None:
+        dtype_policy.set_floatx(floatx)
+
+    data_path = data if type(data) is str else getattr(data, 'data_path',
+                                                       None)
+    opened = type(data) is str and (lazy or online_noise)
+    if opened:
+        data = io.LazyDataset(data)
+    elif isinstance(data, dict) and online_noise:
+        data = io.ArrayDataset(data)
+
+    try:
+        if isinstance(data, io.ChunkedDataset):
+            min_, max_ = data.min, data.max
+        elif type(data) is str:
+            train_dict = io.extract_set(data, enums.Dataset.TRAIN)
+            val_dict = io.extract_set(data, enums.Dataset.VAL)
+            min_, max_ = train_dict[enums.DataStats.MIN], \
+                train_dict[enums.DataStats.MAX]
+        else:
+            train_dict = data[enums.Dataset.TRAIN]
+            val_dict = data[enums.Dataset.VAL]
+            min_, max_ = data[enums.DataStats.MIN], \
+                data[enums.DataStats.MAX]
+        if band_normalization:
+            if isinstance(data, io.ChunkedDataset):
+                train_stats = data.stats
+            else:
+                train_stats = read_stats(
+                    train_dict if type(data) is str else data) or \
+                    compute_stats(train_dict[enums.Dataset.DATA])
+            min_, max_ = train_stats.band_min, train_stats.band_max
+
+        transformations = [transforms.SpectralTransform(),
+                           transforms.MinMaxNormalize(min_=min_, max_=max_)]
+        if not sparse_labels:
+            transformations.insert(
+                1, transforms.OneHotEncode(n_classes=n_classes))
+        transformations = transforms.compile_transformations(
+            transformations,
+            inplace=type(data) is str or isinstance(data, io.LazyDataset))
+
+        tr_noise = get_noise_functions(noise, noise_params) \
+            if enums.Dataset.TRAIN in noise_sets else []
+        val_noise = get_noise_functions(noise, noise_params) \
+            if enums.Dataset.VAL in noise_sets else []
+        if online_noise:
+            tr_transformations, val_transformations = transformations, \
+                                                      transformations
+        else:
+            tr_transformations, val_transformations = transformations + \
+                tr_noise, transformations + val_noise
+
+        if isinstance(data, io.ChunkedDataset) and cache_path is not None:
+            cache_path = '{}_{}'.format(cache_path, get_cache_key(
+                [] if data_path is None else [data_path],
+                min_=np.asarray(min_).tolist(), max_=np.asarray(max_).tolist(),
+                sparse_labels=sparse_labels, noise=noise,
+                noise_sets=noise_sets,
+                noise_params=noise_params, online_noise=online_noise,
+                seed=seed)[:16])
+        else:
+            cache_path = None
+
+        if isinstance(data, io.ChunkedDataset):
+            tr_noise_stage, val_noise_stage = [
+                get_noise_stage(noise_functions, seed,
+                                data_range=transforms.NORMALIZED_RANGE)
+                if online_noise and noise_functions else None
+                for noise_functions in [tr_noise, val_noise]]
+            tr_cache_path, val_cache_path = [
+                None if cache_path is None else
+                '{}_{}'.format(cache_path, dataset_key)
+                for dataset_key in [enums.Dataset.TRAIN, enums.Dataset.VAL]]
+            train_data, n_train = data.to_tf_dataset(
+                enums.Dataset.TRAIN, batch_size, tr_transformations, shuffle,
+                tr_noise_stage, shuffle_buffer_size, tr_cache_path)
+            val_data, n_val = data.to_tf_dataset(
+                enums.Dataset.VAL, batch_size, val_transformations,
+                batch_transformation=val_noise_stage,
+                cache_path=val_cache_path)
+            fit_kwargs = {
+                'x': train_data,
+                'steps_per_epoch': int(np.ceil(n_train / batch_size)),
+                'validation_data': val_data,
+                'validation_steps': int(np.ceil(n_val / batch_size))
+            }
+        else:
+            train_dict = transforms.apply_transformations(train_dict,
+                                                          tr_transformations)
+            val_dict = transforms.apply_transformations(val_dict,
+                                                        val_transformations)
+            fit_kwargs = {
+                'x': train_dict[enums.Dataset.DATA],
+                'y': train_dict[enums.Dataset.LABELS],
+                'shuffle': shuffle,
+                'validation_data': (val_dict[enums.Dataset.DATA],
+                                    val_dict[enums.Dataset.LABELS]),
+                'batch_size': batch_size
+            }
+
+        model = models.get_model(model_key=model_name, kernel_size=kernel_size,
+                                 n_kernels=n_kernels, n_layers=n_layers,
+                                 input_size=sample_size, n_classes=n_classes)
+        model.summary()
+        model.compile(tf.keras.optimizers.Adam(lr=lr),
+                      'sparse_categorical_crossentropy' if sparse_labels
+                      else 'categorical_crossentropy',
+                      metrics=['accuracy'])
+
+        time_history = time_metrics.TimeHistory()
+        mcp_save = tf.keras.callbacks.ModelCheckpoint(
+            os.path.join(dest_path, model_name), save_best_only=True,
+            monitor='val_loss', mode='min')
+        early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_loss',
+                                                          patience=patience)
+        callbacks = [time_history, mcp_save, early_stopping]
+        try:
+            history = model.fit(epochs=epochs,
+                                verbose=verbose,
+                                callbacks=callbacks,
+                                **fit_kwargs)
+        finally:
+            if cache_path is not None:
+                io.remove_tf_cache(cache_path)
+
+        history.history[time_metrics.TimeHistory.__name__] = \
+            time_history.average
+        io.save_metrics(dest_path=dest_path,
+                        file_name='training_metrics.csv',
+                        metrics=history.history)
+
+        np.savetxt(os.path.join(dest_path, 'min-max.csv'),
+                   np.array([min_, max_]), delimiter=',', fmt='%f')
+    finally:
+        if opened:
+            data.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from ml_intuition import enums
+from ml_intuition.data import io
+from ml_intuition.data.cache import DatasetCache, get_cache_key
+
+
+def get_split(n_samples: int = 30):
+    data = np.random.rand(n_samples, 5).astype(np.float32)
+    labels = np.arange(n_samples) % 3
+    return data[:10], labels[:10], data[10:20], labels[10:20], \
+        data[20:], labels[20:]
+
+
+@pytest.fixture
+def input_path(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.npy')
+    np.save(path, np.zeros(10))
+    return path
+
+
+class TestGetCacheKey:
+    def test_if_key_depends_on_params(self, input_path):
+        key = get_cache_key([input_path], train_size=0.5, seed=0)
+        assert key == get_cache_key([input_path], train_size=0.5, seed=0)
+        assert key != get_cache_key([input_path], train_size=0.5, seed=1)
+        assert key != get_cache_key([input_path], train_size=[5, 5], seed=0)
+
+    def test_if_key_depends_on_input_content(self, input_path):
+        key = get_cache_key([input_path], seed=0)
+        np.save(input_path, np.zeros(20))
+        assert key != get_cache_key([input_path], seed=0)
+
+
+class TestDatasetCache:
+    def test_if_returns_stored_split(self, tmpdir):
+        cache = DatasetCache(str(tmpdir))
+        split = get_split()
+        assert cache.get('key') is None
+        data = io.load_processed_h5(cache.put('key', *split))
+        np.testing.assert_array_equal(
+            data[enums.Dataset.TEST][enums.Dataset.DATA], split[4])
+        assert cache.get('key') is not None
+
+    def test_if_evicts_least_recently_used(self, tmpdir):
+        cache = DatasetCache(str(tmpdir))
+        cache.put('first', *get_split())
+        time.sleep(0.01)
+        cache.put('second', *get_split())
+        time.sleep(0.01)
+        cache.get('first')
+        cache.size_limit = os.path.getsize(cache.get('first')) * 2.5
+        cache.put('third', *get_split())
+        assert cache.get('second') is None
+        assert cache.get('first') is not None
+        assert cache.get('third') is not None
+
+    def test_if_invalidates_entries(self, tmpdir):
+        cache = DatasetCache(str(tmpdir))
+        cache.put('first', *get_split())
+        cache.put('second', *get_split())
+        cache.invalidate('first')
+        assert cache.get('first') is None and cache.get('second') is not None
+        cache.invalidate()
+        assert cache.get('second') is None
+
+
+class TestPrepareDataCache:
+    @pytest.fixture
+    def scene(self, tmpdir):
+        data_file_path = os.path.join(str(tmpdir), 'data.npy')
+        ground_truth_path = os.path.join(str(tmpdir), 'gt.npy')
+        np.save(data_file_path, np.random.rand(4, 10, 8))
+        np.save(ground_truth_path, np.random.randint(0, 3, (10, 8)))
+        return {'data_file_path': data_file_path,
+                'ground_truth_path': ground_truth_path,
+                'train_size': ['0.5'],
+                'cache_dir': os.path.join(str(tmpdir), 'cache')}
+
+    def test_if_key_depends_on_align_tile_size(self, scene):
+        from scripts import prepare_data
+        prepare_data.main(**scene)
+        prepare_data.main(align_tile_size=256, **scene)
+        assert len(os.listdir(scene['cache_dir'])) == 2
+
+    def test_if_hit_is_copied_without_recomputation(self, tmpdir, scene,
+                                                    monkeypatch):
+        from scripts import prepare_data
+        first_path, second_path = os.path.join(str(tmpdir), 'first.h5'), \
+            os.path.join(str(tmpdir), 'second.h5')
+        prepare_data.main(output_path=first_path, save_data=True, **scene)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('The cached split should be reused.')
+
+        monkeypatch.setattr(prepare_data, 'load_samples', fail)
+        monkeypatch.setattr(prepare_data, 'compute_stats', fail)
+        monkeypatch.setattr(io, 'save_md5', fail)
+        prepare_data.main(output_path=second_path, save_data=True, **scene)
+        first, second = io.load_processed_h5(first_path), \
+            io.load_processed_h5(second_path)
+        for subset_key in [enums.Dataset.TRAIN, enums.Dataset.TEST]:
+            np.testing.assert_array_equal(
+                first[subset_key][enums.Dataset.DATA],
+                second[subset_key][enums.Dataset.DATA])
+        assert first[enums.DataStats.MIN] == second[enums.DataStats.MIN]
+        data = prepare_data.main(**scene)
+        np.testing.assert_array_equal(
+            data[enums.Dataset.VAL][enums.Dataset.LABELS],
+            first[enums.Dataset.VAL][enums.Dataset.LABELS])
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+
+from ml_intuition import enums
+from ml_intuition.data import dtype_policy, io, noise, preprocessing, \
+    transforms
+
+NOISE_PARAMS = {"mean": 0, "std": 1, "pa": 0.5, "pb": 0.5, "bc": False,
+                "pw": 0.5}
+
+
+@pytest.fixture(params=['float32', 'float64'])
+def floatx(request):
+    dtype_policy.set_floatx(request.param)
+    yield np.dtype(request.param)
+    dtype_policy.set_floatx(dtype_policy.DEFAULT_FLOATX)
+
+
+class TestDtypePolicy:
+    def test_if_rejects_unsupported_dtype(self):
+        with pytest.raises(ValueError):
+            dtype_policy.set_floatx('int32')
+        assert dtype_policy.floatx() == np.float32
+
+    @pytest.mark.parametrize("input_dtype", [np.float64, np.uint16])
+    def test_if_preprocessing_follows_policy(self, floatx, input_dtype):
+        cube = (np.random.rand(4, 10, 8) * 100).astype(input_dtype)
+        labels = np.random.randint(0, 3, (10, 8))
+        expected_dtype = dtype_policy.get_samples_dtype(input_dtype)
+        samples, _ = preprocessing.get_labelled_samples(cube, labels)
+        assert samples.dtype == expected_dtype
+        samples, _ = preprocessing.filter_samples(
+            np.moveaxis(cube, 0, -1).reshape(80, 4, 1), labels.reshape(-1))
+        assert samples.dtype == expected_dtype
+
+    @pytest.mark.parametrize("noise_function", [
+        noise.Gaussian, noise.Impulsive, noise.Shot])
+    def test_if_noise_does_not_upcast(self, floatx, noise_function):
+        data = np.random.rand(40, 10, 1).astype(floatx)
+        noisy_data, _ = noise_function(NOISE_PARAMS)(data, None)
+        assert noisy_data.dtype == floatx
+
+    def test_if_transformations_do_not_upcast(self, floatx):
+        sample = np.random.rand(30, 10).astype(floatx)
+        labels = np.random.randint(0, 3, 30)
+        transformations = [
+            transforms.SpectralTransform(),
+            transforms.OneHotEncode(n_classes=3),
+            transforms.MinMaxNormalize(min_=np.float64(0.),
+                                       max_=np.float64(2.))]
+        for compiled in [transformations,
+                         transforms.compile_transformations(transformations)]:
+            data = transforms.apply_transformations(
+                {enums.Dataset.DATA: sample.copy(),
+                 enums.Dataset.LABELS: labels}, compiled)
+            assert data[enums.Dataset.DATA].dtype == floatx
+            assert data[enums.Dataset.LABELS].dtype == np.uint8
+        normalized, _ = transforms.MinMaxNormalize(0, 100)(
+            (sample * 100).astype(np.uint16), None)
+        assert normalized.dtype == floatx
+
+    @pytest.mark.parametrize("storage_dtype", [None, 'float16', 'uint16'])
+    def test_if_h5_samples_follow_policy(self, tmpdir, floatx, storage_dtype):
+        path = os.path.join(str(tmpdir), 'data.h5')
+        data = np.random.rand(20, 5, 1)
+        labels = np.random.randint(0, 3, 20).astype(np.uint8)
+        io.save_md5(path, data, labels, data, labels, data, labels,
+                    storage_dtype=storage_dtype)
+        test_set = io.extract_set(path, enums.Dataset.TEST)
+        assert test_set[enums.Dataset.DATA].dtype == floatx
+        assert test_set[enums.Dataset.LABELS].dtype == np.uint8
+
+    @pytest.mark.parametrize("dtype", ['float32', 'float64'])
+    def test_if_prepare_data_sets_policy(self, tmpdir, dtype):
+        from scripts import prepare_data
+        data_file_path = os.path.join(str(tmpdir), 'data.npy')
+        ground_truth_path = os.path.join(str(tmpdir), 'gt.npy')
+        np.save(data_file_path, np.random.rand(4, 10, 8))
+        np.save(ground_truth_path, np.random.randint(0, 3, (10, 8)))
+        try:
+            data = prepare_data.main(data_file_path=data_file_path,
+                                     ground_truth_path=ground_truth_path,
+                                     train_size=['0.5'], floatx=dtype)
+            assert dtype_policy.floatx() == np.dtype(dtype)
+        finally:
+            dtype_policy.set_floatx(dtype_policy.DEFAULT_FLOATX)
+        assert data[enums.Dataset.TRAIN][enums.Dataset.DATA].dtype == dtype
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pytest
+
+from ml_intuition import enums
+from ml_intuition.data import input_fn, io
+
+
+@pytest.fixture
+def dataset_path(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.h5')
+    data = np.random.rand(100, 5).astype(np.float32)
+    labels = np.repeat(np.arange(4), 25)
+    io.save_md5(path, data, labels, data[:2], labels[:2], data[:2], labels[:2])
+    return path
+
+
+class TestCalibrationSource:
+    @pytest.mark.parametrize("batch_size, iter", [(8, 0), (8, 3), (16, 2)])
+    def test_if_reads_consecutive_batches(self, dataset_path, batch_size,
+                                          iter):
+        source = input_fn.CalibrationSource(dataset_path, batch_size)
+        train = io.extract_set(dataset_path, enums.Dataset.TRAIN)
+        expected = train[enums.Dataset.DATA][
+                   iter * batch_size:(iter + 1) * batch_size]
+        expected = (expected - train[enums.DataStats.MIN]) / \
+                   (train[enums.DataStats.MAX] - train[enums.DataStats.MIN])
+        np.testing.assert_allclose(source.get_batch(iter)[..., 0], expected)
+
+    def test_if_stratified_subset_preserves_class_proportions(self,
+                                                              dataset_path):
+        source = input_fn.CalibrationSource(dataset_path, batch_size=10,
+                                            n_iters=2, stratified=True)
+        train = io.extract_set(dataset_path, enums.Dataset.TRAIN)
+        sample_to_label = {tuple(sample): label for sample, label in
+                           zip(train[enums.Dataset.DATA],
+                               train[enums.Dataset.LABELS])}
+        labels = [sample_to_label[tuple(sample)] for sample in source.samples]
+        assert len(labels) == 20
+        assert np.all(np.bincount(labels) == 5)
@@ -0,0 +1,224 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from ml_intuition import enums
+from ml_intuition.data import io, preprocessing, transforms
+
+
+@pytest.fixture
+def dataset_path(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.h5')
+    data = np.random.rand(60, 10).astype(np.float32)
+    labels = np.repeat(np.arange(3), 20).astype(np.uint8)
+    io.save_md5(path, data[:30], labels[:30], data[30:40], labels[30:40],
+                data[40:], labels[40:])
+    return path
+
+
+class TestLazyDataset:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 30, 100])
+    def test_if_chunks_match_extracted_set(self, dataset_path, chunk_size):
+        full_set = io.extract_set(dataset_path, enums.Dataset.TRAIN)
+        with io.LazyDataset(dataset_path, chunk_size) as dataset:
+            chunks = list(dataset.chunks(enums.Dataset.TRAIN))
+            assert dataset.n_samples(enums.Dataset.TRAIN) == 30
+        assert all(len(chunk[enums.Dataset.DATA]) <= chunk_size
+                   for chunk in chunks)
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[enums.Dataset.DATA] for chunk in chunks]),
+            full_set[enums.Dataset.DATA])
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[enums.Dataset.LABELS] for chunk in chunks]),
+            full_set[enums.Dataset.LABELS])
+
+    def test_if_transforms_each_chunk(self, dataset_path):
+        with io.LazyDataset(dataset_path, chunk_size=8) as dataset:
+            transformations = [
+                transforms.SpectralTransform(),
+                transforms.OneHotEncode(n_classes=3),
+                transforms.MinMaxNormalize(min_=dataset.min,
+                                           max_=dataset.max)]
+            for chunk in dataset.chunks(enums.Dataset.TEST, transformations):
+                assert chunk[enums.Dataset.DATA].shape[1:] == (10, 1)
+                assert chunk[enums.Dataset.LABELS].shape[1:] == (3,)
+
+    @pytest.mark.parametrize("shuffle, cache", [(False, False), (True, False),
+                                                (True, True)])
+    def test_if_streams_each_sample_once_per_epoch(self, dataset_path,
+                                                   tmpdir, shuffle, cache):
+        expected = io.extract_set(dataset_path, enums.Dataset.TRAIN)
+        cache_path = os.path.join(str(tmpdir), 'cache') if cache else None
+        with io.LazyDataset(dataset_path, chunk_size=7) as dataset, \
+                tf.Graph().as_default(), tf.Session() as session:
+            transformations = [
+                transforms.SpectralTransform(),
+                transforms.OneHotEncode(n_classes=3),
+                transforms.MinMaxNormalize(min_=0, max_=1)]
+            tf_dataset, n_samples = dataset.to_tf_dataset(
+                enums.Dataset.TRAIN, 4, transformations, shuffle,
+                shuffle_buffer_size=5, cache_path=cache_path)
+            next_batch = tf_dataset.make_one_shot_iterator().get_next()
+            batches = [session.run(next_batch) for _ in range(16)]
+        assert n_samples == 30
+        for epoch in [batches[:8], batches[8:]]:
+            data = np.concatenate([batch[0] for batch in epoch])
+            labels = np.concatenate([batch[1] for batch in epoch])
+            order = np.lexsort(data[..., 0].T[::-1])
+            expected_order = np.lexsort(expected[enums.Dataset.DATA].T[::-1])
+            np.testing.assert_array_equal(
+                data[order, :, 0], expected[enums.Dataset.DATA][expected_order])
+            np.testing.assert_array_equal(
+                np.argmax(labels[order], axis=-1),
+                expected[enums.Dataset.LABELS][expected_order])
+        if cache:
+            assert any(file_name.startswith('cache')
+                       for file_name in os.listdir(str(tmpdir)))
+            io.remove_tf_cache(cache_path)
+            assert not any(file_name.startswith('cache')
+                           for file_name in os.listdir(str(tmpdir)))
+
+    @pytest.mark.parametrize("num_parallel_reads", [1, 3])
+    def test_if_parallel_reads_keep_order(self, dataset_path,
+                                          num_parallel_reads):
+        expected = io.extract_set(dataset_path, enums.Dataset.TRAIN)
+        with io.LazyDataset(dataset_path, chunk_size=7) as dataset, \
+                tf.Graph().as_default(), tf.Session() as session:
+            tf_dataset, _ = dataset.to_tf_dataset(
+                enums.Dataset.TRAIN, 10, num_parallel_reads=num_parallel_reads)
+            next_batch = tf_dataset.make_one_shot_iterator().get_next()
+            batches = [session.run(next_batch) for _ in range(3)]
+        np.testing.assert_array_equal(
+            np.concatenate([batch[0] for batch in batches]),
+            expected[enums.Dataset.DATA])
+
+
+class TestSaveMd5:
+    @pytest.mark.parametrize("layout, tolerance", [
+        ({}, 0),
+        ({'chunk_size': 7, 'compression': 'lzf', 'shuffle_filter': True}, 0),
+        ({'chunk_size': 16, 'compression': 'gzip', 'compression_level': 4},
+         0),
+        ({'chunk_size': 16, 'storage_dtype': 'float16'}, 1e-3),
+        ({'compression': 'gzip', 'storage_dtype': 'uint16'}, 1e-4)
+    ])
+    def test_if_readers_decode_stored_layout(self, tmpdir, layout, tolerance):
+        path = os.path.join(str(tmpdir), 'data.h5')
+        data = np.random.rand(60, 10, 1).astype(np.float32)
+        labels = np.repeat(np.arange(3), 20).astype(np.uint8)
+        io.save_md5(path, data[:30], labels[:30], data[30:30], labels[30:30],
+                    data[30:], labels[30:], **layout)
+        loaded = io.load_processed_h5(path)
+        test_set = io.extract_set(path, enums.Dataset.TEST)
+        for subset, x, y in [(loaded[enums.Dataset.TRAIN], data[:30],
+                              labels[:30]),
+                             (loaded[enums.Dataset.TEST], data[30:],
+                              labels[30:]),
+                             (test_set, data[30:], labels[30:])]:
+            assert subset[enums.Dataset.DATA].dtype == np.float32
+            np.testing.assert_allclose(subset[enums.Dataset.DATA], x,
+                                       atol=tolerance)
+            np.testing.assert_array_equal(subset[enums.Dataset.LABELS], y)
+        assert len(loaded[enums.Dataset.VAL][enums.Dataset.DATA]) == 0
+
+    def test_if_throws_for_unsupported_storage_dtype(self, tmpdir):
+        data, labels = np.zeros((4, 2)), np.zeros(4)
+        with pytest.raises(ValueError):
+            io.save_md5(os.path.join(str(tmpdir), 'data.h5'), data, labels,
+                        data, labels, data, labels, storage_dtype='int8')
+
+
+class TestIndexedDataset:
+    @pytest.mark.parametrize("chunk_size", [1, 9, 100])
+    def test_if_chunks_match_materialized_split(self, chunk_size):
+        data = np.random.rand(60, 10).astype(np.float32)
+        labels = np.repeat(np.arange(3), 20).astype(np.uint8)
+        indices = preprocessing.get_split_indices(labels, 0.5, 0.2, seed=1)
+        split = indices.materialize(data, labels)
+        dataset = io.IndexedDataset(data, labels, indices, chunk_size)
+        assert dataset.min == split[0].min()
+        assert dataset.max == split[0].max()
+        for dataset_key, x, y in [(enums.Dataset.TRAIN, *split[:2]),
+                                  (enums.Dataset.VAL, *split[2:4]),
+                                  (enums.Dataset.TEST, *split[4:])]:
+            chunks = list(dataset.chunks(dataset_key))
+            assert dataset.n_samples(dataset_key) == len(y)
+            np.testing.assert_array_equal(dataset.labels(dataset_key), y)
+            np.testing.assert_array_equal(
+                np.concatenate([chunk[enums.Dataset.DATA]
+                                for chunk in chunks]), x)
+            np.testing.assert_array_equal(
+                np.concatenate([chunk[enums.Dataset.LABELS]
+                                for chunk in chunks]), y)
+
+
+class TestArrayDataset:
+    def test_if_chunks_match_data_dict(self):
+        data = np.random.rand(25, 10).astype(np.float32)
+        labels = np.repeat(np.arange(5), 5).astype(np.uint8)
+        data_dict = {enums.Dataset.TEST: {enums.Dataset.DATA: data,
+                                          enums.Dataset.LABELS: labels},
+                     enums.DataStats.MIN: data.min(),
+                     enums.DataStats.MAX: data.max()}
+        dataset = io.ArrayDataset(data_dict, chunk_size=10)
+        chunks = list(dataset.chunks(enums.Dataset.TEST))
+        assert [len(chunk[enums.Dataset.LABELS]) for chunk in chunks] == \
+               [10, 10, 5]
+        assert dataset.min == data.min() and dataset.max == data.max()
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[enums.Dataset.DATA] for chunk in chunks]),
+            data)
+
+
+class TestMergedDataset:
+    @pytest.fixture
+    def scenes(self, tmpdir):
+        scenes = []
+        for scene_id, n_samples in enumerate([12, 20]):
+            path = os.path.join(str(tmpdir), '{}.h5'.format(scene_id))
+            data = np.random.rand(n_samples, 4).astype(np.float32) + scene_id
+            labels = np.full(n_samples, scene_id, dtype=np.uint8)
+            io.save_md5(path, data, labels, data[:3], labels[:3], data[:5],
+                        labels[:5])
+            scenes.append(path)
+        return scenes
+
+    def test_if_reads_concatenated_scenes(self, scenes):
+        expected = [io.extract_set(path, enums.Dataset.TRAIN)
+                    for path in scenes]
+        dataset = io.MergedDataset([io.LazyDataset(path) for path in scenes],
+                                   chunk_size=5)
+        assert dataset.n_samples(enums.Dataset.TRAIN) == 32
+        assert dataset.min == min(subset[enums.DataStats.MIN]
+                                  for subset in expected)
+        assert dataset.max == max(subset[enums.DataStats.MAX]
+                                  for subset in expected)
+        chunks = list(dataset.chunks(enums.Dataset.TRAIN))
+        assert [len(chunk[enums.Dataset.LABELS]) for chunk in chunks] == \
+               [5] * 6 + [2]
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[enums.Dataset.DATA] for chunk in chunks]),
+            np.concatenate([subset[enums.Dataset.DATA]
+                            for subset in expected]))
+        np.testing.assert_array_equal(
+            dataset.labels(enums.Dataset.TRAIN),
+            np.repeat([0, 1], [12, 20]))
+        dataset.close()
+
+    @pytest.mark.parametrize("weights, expected_scenes", [
+        ([1, 0], {0}), ([0, 1], {1}), (None, {0, 1})])
+    def test_if_draws_batches_with_weights(self, scenes, weights,
+                                           expected_scenes):
+        dataset = io.MergedDataset([io.LazyDataset(path) for path in scenes],
+                                   weights)
+        with tf.Graph().as_default(), tf.Session() as session:
+            tf_dataset, n_samples = dataset.to_tf_dataset(
+                enums.Dataset.TRAIN, 4, shuffle=True)
+            next_batch = tf_dataset.make_one_shot_iterator().get_next()
+            labels = np.concatenate([session.run(next_batch)[1]
+                                     for _ in range(40)])
+        dataset.close()
+        assert n_samples == 32
+        assert set(np.unique(labels)) == expected_scenes
@@ -1,3 +1,6 @@
+import os
+
+import cv2
 import numpy as np
 import pytest
 
@@ -44,6 +47,53 @@ class TestReshapeTo2DSamples:
         assert np.all(np.equal(reshaped_data[:, 0, 0], reshaped_labels))
 
 
+    @pytest.mark.parametrize("input_shape, labels_shape, channels_idx", [
+        ((4, 7, 5), (7, 5), 0),
+        ((7, 5, 4), (7, 5), 2),
+        ((7, 4, 5), (7, 5), 1)
+    ])
+    def test_if_memory_mapped_data_matches_in_memory_reshape(
+            self, tmpdir, input_shape, labels_shape, channels_idx):
+        data = np.random.rand(*input_shape).astype(np.float32)
+        labels = np.random.randint(0, 3, labels_shape)
+        path = os.path.join(str(tmpdir), 'data.npy')
+        np.save(path, data)
+        reshaped_data, reshaped_labels = \
+            preprocessing.reshape_cube_to_2d_samples(data, labels,
+                                                     channels_idx)
+        mapped_data, mapped_labels = preprocessing.reshape_cube_to_2d_samples(
+            np.load(path, mmap_mode='r'), labels, channels_idx, block_size=8)
+        assert isinstance(mapped_data, np.memmap)
+        np.testing.assert_array_equal(mapped_data, reshaped_data)
+        np.testing.assert_array_equal(mapped_labels, reshaped_labels)
+
+
+class TestGetLabelledSamples:
+    @pytest.mark.parametrize("channels_idx, block_size, mmap_mode", [
+        (0, 1, None),
+        (0, 8, 'r'),
+        (2, 13, 'r'),
+        (2, 1000, None)
+    ])
+    def test_if_matches_background_removal(self, tmpdir, channels_idx,
+                                           block_size, mmap_mode):
+        shape = (4, 7, 5) if channels_idx == 0 else (7, 5, 4)
+        data = np.random.rand(*shape).astype(np.float32)
+        labels = np.random.randint(0, 3, (7, 5))
+        path = os.path.join(str(tmpdir), 'data.npy')
+        np.save(path, data)
+        reshaped_data, reshaped_labels = \
+            preprocessing.reshape_cube_to_2d_samples(data, labels,
+                                                     channels_idx)
+        samples, samples_labels = preprocessing.get_labelled_samples(
+            np.load(path, mmap_mode=mmap_mode), labels, background_label=0,
+            channels_idx=channels_idx, block_size=block_size)
+        np.testing.assert_array_equal(
+            samples, reshaped_data[reshaped_labels != 0])
+        np.testing.assert_array_equal(
+            samples_labels, reshaped_labels[reshaped_labels != 0])
+
+
 class TestRemoveNanSamples:
 
     @pytest.mark.parametrize("data, result", [([[np.nan, 0],
@@ -79,3 +129,64 @@ class TestRemoveNanSamples:
         labels = np.zeros(len(data))
         data_n, labels_n = preprocessing.remove_nan_samples(data, labels)
         assert np.all(np.equal(data.shape[1:], data_n.shape[1:]))
+
+
+class TestAlignGroundTruth:
+    @pytest.mark.parametrize("transform", [
+        [[0.5, 0, 3], [0, 0.5, 7], [0, 0, 1]],
+        [[2, 0, -100], [0, 2, -50], [0, 0, 1]],
+        [[1, 0.25, 10], [-0.25, 1, 40], [0, 0, 1]]
+    ])
+    def test_if_matches_warp_of_whole_raster(self, transform):
+        ground_truth = np.random.randint(1, 10, (300, 250)).astype(np.uint8)
+        transform = np.array(transform, dtype=np.float64)
+        expected = cv2.warpPerspective(ground_truth, np.linalg.inv(transform),
+                                       (230, 170), flags=cv2.INTER_NEAREST)
+        for tile_size, n_threads in [(1024, 1), (64, 2), (7, 4)]:
+            aligned = preprocessing.align_ground_truth(
+                (230, 170), ground_truth, transform, tile_size, n_threads)
+            np.testing.assert_array_equal(aligned, expected)
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_if_matches_perspective_warp_of_whole_raster(self, seed):
+        random_state = np.random.RandomState(seed)
+        ground_truth = random_state.randint(1, 10, (350, 450)) \
+            .astype(np.uint8)
+        transform = np.eye(3) + random_state.uniform(-0.1, 0.1, (3, 3)) * \
+            [[1, 1, 50], [1, 1, 50], [1e-3, 1e-3, 0]]
+        expected = cv2.warpPerspective(ground_truth, np.linalg.inv(transform),
+                                       (300, 400), flags=cv2.INTER_NEAREST)
+        rows, cols = np.mgrid[0:400, 0:300]
+        x, y, w = transform @ np.stack([cols.ravel(), rows.ravel(),
+                                        np.ones(cols.size)])
+        # Distance of the source coordinates to the rounding boundary
+        distance = np.minimum(np.abs(np.abs(x / w % 1) - 0.5),
+                              np.abs(np.abs(y / w % 1) - 0.5)) \
+            .reshape(expected.shape)
+        for tile_size, n_threads in [(64, 2), (256, 1), (37, 3)]:
+            aligned = preprocessing.align_ground_truth(
+                (300, 400), ground_truth, transform, tile_size, n_threads)
+            is_different = aligned != expected
+            assert np.count_nonzero(is_different) <= 1e-4 * aligned.size
+            assert np.all(distance[is_different] < 1e-3)
+
+
+class TestFilterSamples:
+    @pytest.mark.parametrize("remove_nan, chunk_size", [
+        (True, 1), (True, 7), (False, 7), (True, 1000)])
+    def test_if_matches_consecutive_filters(self, remove_nan, chunk_size):
+        data = np.random.rand(50, 4, 1).astype(np.float32)
+        data[np.random.rand(50) < 0.2, np.random.randint(0, 4)] = np.nan
+        labels = np.random.choice([0, 3, 5, 9], 50).astype(np.uint8)
+        expected_data, expected_labels = data, labels.copy()
+        if remove_nan:
+            expected_data, expected_labels = preprocessing.remove_nan_samples(
+                expected_data, expected_labels)
+        expected_data = expected_data[expected_labels != 0]
+        expected_labels = preprocessing.normalize_labels(
+            expected_labels[expected_labels != 0])
+        filtered_data, filtered_labels = preprocessing.filter_samples(
+            data, labels, 0, remove_nan, chunk_size)
+        np.testing.assert_array_equal(filtered_data, expected_data)
+        np.testing.assert_array_equal(filtered_labels, expected_labels)
+        assert filtered_labels.dtype == labels.dtype
@@ -0,0 +1,90 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from ml_intuition import enums
+from ml_intuition.data import io, stats, transforms, utils
+
+
+class TestStatsAccumulator:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100, 1000])
+    def test_if_matches_full_pass(self, chunk_size):
+        data = np.random.rand(300, 12).astype(np.float32) * 100 - 20
+        labels = np.random.choice([0, 3, 5], 300)
+        accumulator = stats.compute_stats(data, labels, chunk_size)
+        assert accumulator.min == np.amin(data)
+        assert accumulator.max == np.amax(data)
+        np.testing.assert_array_equal(accumulator.band_min, data.min(axis=0))
+        np.testing.assert_array_equal(accumulator.band_max, data.max(axis=0))
+        np.testing.assert_allclose(accumulator.band_mean,
+                                   data.astype(np.float64).mean(axis=0))
+        np.testing.assert_allclose(accumulator.band_std,
+                                   data.astype(np.float64).std(axis=0))
+        np.testing.assert_allclose(accumulator.mean, data.mean(), rtol=1e-6)
+        np.testing.assert_allclose(accumulator.std,
+                                   data.astype(np.float64).std())
+        assert accumulator.class_counts == {
+            label: np.count_nonzero(labels == label) for label in [0, 3, 5]}
+
+    def test_if_merged_scenes_match_concatenation(self):
+        scenes = [np.random.rand(n_samples, 5) + scene_id
+                  for scene_id, n_samples in enumerate([10, 40, 25])]
+        merged = stats.merge_stats(stats.compute_stats(scene)
+                                   for scene in scenes)
+        expected = stats.compute_stats(np.concatenate(scenes))
+        assert merged.count == 75
+        np.testing.assert_allclose(merged.band_mean, expected.band_mean)
+        np.testing.assert_allclose(merged.band_std, expected.band_std)
+        np.testing.assert_array_equal(merged.band_min, expected.band_min)
+
+
+class TestStoredStats:
+    def test_if_stats_are_stored_as_attrs(self, tmpdir):
+        path = os.path.join(str(tmpdir), 'data.h5')
+        data = np.random.rand(50, 6).astype(np.float32)
+        labels = np.repeat(np.arange(5), 10).astype(np.uint8)
+        io.save_md5(path, data, labels, data[:5], labels[:5], data[:5],
+                    labels[:5])
+        with h5py.File(path, 'r') as file:
+            stored = stats.read_stats(file.attrs)
+        np.testing.assert_array_equal(stored.band_max, data.max(axis=0))
+        np.testing.assert_array_equal(
+            stored.to_dict()[enums.DataStats.CLASS_COUNTS], [10] * 5)
+        loaded = io.load_processed_h5(path)
+        assert loaded[enums.DataStats.MIN] == np.amin(data)
+        np.testing.assert_allclose(loaded[enums.DataStats.BAND_STD],
+                                   data.std(axis=0), rtol=1e-5)
+        with io.LazyDataset(path) as dataset:
+            np.testing.assert_array_equal(dataset.stats.band_min,
+                                          data.min(axis=0))
+
+    def test_if_merge_datasets_uses_scene_stats(self):
+        scenes = [utils.build_data_dict(
+            *[np.random.rand(n_samples, 4), np.zeros(n_samples)] * 3)
+            for n_samples in [8, 16]]
+        merged = utils.merge_datasets(scenes)
+        train = merged[enums.Dataset.TRAIN][enums.Dataset.DATA]
+        assert merged[enums.DataStats.MIN] == np.amin(train)
+        assert merged[enums.DataStats.MAX] == np.amax(train)
+        np.testing.assert_allclose(merged[enums.DataStats.BAND_MEAN],
+                                   train.mean(axis=0))
+
+
+class TestBandNormalization:
+    def test_if_normalizes_each_band(self):
+        sample = np.random.rand(40, 6).astype(np.float32) * \
+                 np.arange(1, 7, dtype=np.float32)
+        accumulator = stats.compute_stats(sample)
+        transformations = [
+            transforms.SpectralTransform(),
+            transforms.MinMaxNormalize(accumulator.band_min,
+                                       accumulator.band_max)]
+        for compiled in [transformations,
+                         transforms.compile_transformations(transformations)]:
+            result = transforms.apply_transformations(
+                {'data': sample.copy(), 'labels': None}, compiled)['data']
+            assert result.shape == (40, 6, 1)
+            np.testing.assert_allclose(result.min(axis=0), 0, atol=1e-6)
+            np.testing.assert_allclose(result.max(axis=0), 1, atol=1e-6)
@@ -0,0 +1,95 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from ml_intuition import enums
+from ml_intuition.data import preprocessing, streaming_split
+
+
+@pytest.fixture
+def labels():
+    return np.random.RandomState(0).choice(
+        4, 3001, p=[0.5, 0.25, 0.15, 0.1]).astype(np.uint8)
+
+
+class TestStreamSplitIndices:
+    @pytest.mark.parametrize("train_size, stratified", [
+        (0.5, True),
+        (20, True),
+        ([10, 20, 30, 40], True),
+        ([10, 20], False)
+    ])
+    def test_if_class_counts_match_in_memory_split(self, tmpdir, labels,
+                                                   train_size, stratified):
+        expected = preprocessing.get_split_indices(labels, train_size, 0.1,
+                                                   stratified)
+        split = streaming_split.stream_split_indices(
+            labels, str(tmpdir), train_size, 0.1, stratified, chunk_size=256)
+        for expected_indices, indices in zip(expected, split):
+            np.testing.assert_array_equal(
+                np.bincount(labels[indices], minlength=4),
+                np.bincount(labels[expected_indices], minlength=4))
+
+    @pytest.mark.parametrize("train_size", [0.3, 500])
+    def test_if_not_stratified_split_has_correct_size(self, tmpdir, labels,
+                                                      train_size):
+        expected = preprocessing.get_split_indices(labels, train_size, 0.1,
+                                                   False)
+        split = streaming_split.stream_split_indices(
+            labels, str(tmpdir), train_size, 0.1, False, chunk_size=256)
+        assert len(split.train) + len(split.val) == \
+            len(expected.train) + len(expected.val)
+
+    def test_if_sets_are_disjoint_and_sorted(self, tmpdir, labels):
+        split = streaming_split.stream_split_indices(
+            labels, str(tmpdir), 0.5, 0.2, chunk_size=100)
+        np.testing.assert_array_equal(np.sort(np.concatenate(split)),
+                                      np.arange(len(labels)))
+        assert all(np.all(np.diff(indices) > 0) for indices in split)
+        assert sorted(os.listdir(str(tmpdir))) == \
+            ['test.npy', 'train.npy', 'val.npy']
+
+    def test_if_deterministic_for_h5_labels(self, tmpdir, labels):
+        path = os.path.join(str(tmpdir), 'labels.h5')
+        with h5py.File(path, 'w') as file:
+            file.create_dataset('labels', data=labels)
+        split = streaming_split.stream_split_indices(
+            labels, os.path.join(str(tmpdir), 'array'), 0.5, seed=3)
+        with h5py.File(path, 'r') as file:
+            h5_split = streaming_split.stream_split_indices(
+                file['labels'], os.path.join(str(tmpdir), 'h5'), 0.5, seed=3)
+        for indices, h5_indices in zip(split, h5_split):
+            np.testing.assert_array_equal(indices, h5_indices)
+
+
+class TestPrepareDataSplitDir:
+    @pytest.mark.parametrize("mmap", [False, True])
+    def test_if_prepares_streamed_split(self, tmpdir, mmap):
+        from scripts import prepare_data
+        random_state = np.random.RandomState(0)
+        data_file_path = os.path.join(str(tmpdir), 'data.npy')
+        ground_truth_path = os.path.join(str(tmpdir), 'gt.npy')
+        np.save(data_file_path, random_state.rand(5, 30, 40))
+        np.save(ground_truth_path, random_state.randint(0, 5, (30, 40)))
+        split_dir = os.path.join(str(tmpdir), 'split')
+        kwargs = dict(data_file_path=data_file_path,
+                      ground_truth_path=ground_truth_path,
+                      train_size=[0.5], val_size=0.1, stratified=True,
+                      mmap=mmap)
+        expected = prepare_data.main(**kwargs)
+        data = prepare_data.main(split_dir=split_dir, **kwargs)
+        assert sorted(os.listdir(split_dir)) == \
+            ['test.npy', 'train.npy', 'val.npy']
+        samples, labels = prepare_data.load_samples(
+            data_file_path, ground_truth_path, mmap=mmap)
+        for subset, indices in zip(
+                [enums.Dataset.TRAIN, enums.Dataset.VAL, enums.Dataset.TEST],
+                streaming_split.load_split_indices(split_dir)):
+            np.testing.assert_array_equal(
+                data[subset][enums.Dataset.DATA], samples[indices])
+            np.testing.assert_array_equal(
+                np.bincount(data[subset][enums.Dataset.LABELS], minlength=4),
+                np.bincount(expected[subset][enums.Dataset.LABELS],
+                            minlength=4))
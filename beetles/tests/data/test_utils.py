@@ -108,3 +108,48 @@ class TestTrainValTestSplit:
         assert not np.any(np.equal(train_x, test_x))
 
 
+
+class TestGetSplitIndices:
+    labels = np.concatenate([np.zeros(10), np.ones(10), np.repeat(2, 10)])
+
+    @pytest.mark.parametrize("train_size, stratified, seed", [
+        (0.5, True, 0), (0.8, False, 3), (4, True, 11), ([2, 3, 4], True, 5)
+    ])
+    def test_if_matches_shuffled_split(self, train_size, stratified, seed):
+        data = np.arange(30)
+        shuffled_data, shuffled_labels = data.copy(), self.labels.copy()
+        utils.shuffle_arrays_together([shuffled_data, shuffled_labels], seed)
+        train_indices = preprocessing._get_set_indices(
+            train_size, shuffled_labels, stratified)
+        expected_train = np.setdiff1d(
+            train_indices, train_indices[preprocessing._get_set_indices(
+                0.1, shuffled_labels[train_indices])])
+        train, val, test = preprocessing.get_split_indices(
+            self.labels, train_size, 0.1, stratified, seed)
+        np.testing.assert_array_equal(data[train],
+                                      shuffled_data[expected_train])
+        assert len(np.intersect1d(train, test)) == 0
+        assert len(train) + len(val) + len(test) == len(data)
+
+    def test_if_does_not_modify_samples(self):
+        data = np.arange(30).reshape((30, 1))
+        data.setflags(write=False)
+        preprocessing.train_val_test_split(data, self.labels.copy(), 0.5)
+        np.testing.assert_array_equal(data[:, 0], np.arange(30))
+
+
+class TestDrawStratifiedIndices:
+    @pytest.mark.parametrize("counts, n_samples, expected", [
+        ([33, 33, 34], 20, [7, 6, 7]),
+        ([25, 25, 25, 25], 20, [5, 5, 5, 5]),
+        ([90, 7, 3], 10, [9, 1, 0]),
+        ([5, 5], 30, [5, 5])
+    ])
+    def test_if_draws_full_subset(self, counts, n_samples, expected):
+        labels = np.repeat(np.arange(len(counts)), counts)
+        np.random.RandomState(0).shuffle(labels)
+        indices = utils.draw_stratified_indices(
+            labels, n_samples, np.random.RandomState(0))
+        assert len(np.unique(indices)) == len(indices)
+        np.testing.assert_array_equal(
+            np.bincount(labels[indices], minlength=len(counts)), expected)
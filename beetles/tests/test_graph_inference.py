@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from ml_intuition import enums
+from ml_intuition.data import utils
+from ml_intuition.evaluation.graph_inference import GraphInference
+
+N_BANDS, N_CLASSES = 12, 5
+
+
+def build_graph(weights: np.ndarray, batch_size: int = None) -> tf.Graph:
+    graph = tf.Graph()
+    with graph.as_default():
+        inputs = tf.placeholder(tf.float32, (batch_size, N_BANDS, 1),
+                                name='input')
+        tf.nn.softmax(tf.matmul(tf.reshape(inputs, (-1, N_BANDS)),
+                                tf.constant(weights)), name='output')
+    return graph
+
+
+def get_scores(data: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    return data.reshape(len(data), N_BANDS).astype(np.float32) @ weights
+
+
+class TestGraphInference:
+    weights = np.random.rand(N_BANDS, N_CLASSES).astype(np.float32)
+
+    @pytest.mark.parametrize("n_samples, batch_size, fixed_batch_size", [
+        (100, 16, None), (100, 100, None), (10, 64, None), (99, 7, 7),
+        (5, 8, 8), (0, 8, None)])
+    def test_if_predicts_argmax_of_scores(self, n_samples, batch_size,
+                                          fixed_batch_size):
+        data = np.random.rand(n_samples, N_BANDS, 1).astype(np.float32)
+        with GraphInference(build_graph(self.weights, fixed_batch_size),
+                            'input', 'output', batch_size) as inference:
+            predictions = inference.predict(data).get(
+                enums.InferenceOutputs.PREDICTIONS, np.empty(0))
+        np.testing.assert_array_equal(
+            predictions, np.argmax(get_scores(data, self.weights), axis=-1))
+
+    def test_if_stages_other_dtypes_in_buffers(self):
+        data = np.random.rand(50, N_BANDS, 1)
+        with GraphInference(build_graph(self.weights), 'input', 'output',
+                            16) as inference:
+            predictions = inference.predict(data[::-1])[
+                enums.InferenceOutputs.PREDICTIONS]
+            assert all(buffer.dtype == np.float32
+                       for buffer in inference.buffers)
+        np.testing.assert_array_equal(
+            predictions,
+            np.argmax(get_scores(data[::-1], self.weights), axis=-1))
+
+    def test_if_graph_does_not_grow(self):
+        graph = build_graph(self.weights)
+        data = np.random.rand(64, N_BANDS, 1).astype(np.float32)
+        with GraphInference(graph, 'input', 'output', 8, probabilities=True,
+                            top_k=3) as inference:
+            n_ops = len(graph.get_operations())
+            for _ in range(3):
+                outputs = inference.predict(data)
+            assert len(graph.get_operations()) == n_ops
+            assert len(inference.latencies) == 8
+        assert outputs[enums.InferenceOutputs.PROBABILITIES].shape == \
+            (64, N_CLASSES)
+        assert outputs[enums.InferenceOutputs.TOP_K_CLASSES].shape == (64, 3)
+        np.testing.assert_array_equal(
+            outputs[enums.InferenceOutputs.TOP_K_CLASSES][:, 0],
+            outputs[enums.InferenceOutputs.PREDICTIONS])
+        stats = inference.get_latency_stats()
+        assert stats['batch_size'] == 8
+        assert stats['samples_per_second'] > 0
+        assert stats['latency_p50_ms'] <= stats['latency_p99_ms']
+
+    @pytest.mark.parametrize("n_samples, batch_size", [(100, 16), (10, 64)])
+    def test_if_batched_prediction_matches(self, n_samples, batch_size):
+        graph = build_graph(self.weights)
+        data = np.random.rand(n_samples, N_BANDS, 1).astype(np.float32)
+        with tf.Session(graph=graph) as session:
+            predictions = utils.predict_with_graph_in_batches(
+                session, graph.get_tensor_by_name('input:0'),
+                graph.get_tensor_by_name('output:0'), data, batch_size)
+        np.testing.assert_array_equal(
+            predictions, np.argmax(get_scores(data, self.weights), axis=-1))
@@ -0,0 +1,108 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from ml_intuition.evaluation.inference_server import InferenceClient, \
+    InferenceServer, MicroBatcher, generate_load, parse_address, to_samples
+
+
+def predict_brightest_band(samples: np.ndarray):
+    return np.argmax(samples, axis=-1), np.amax(samples, axis=-1)
+
+
+def predict_model_2d_samples(samples: np.ndarray):
+    assert samples.ndim == 3 and samples.shape[-1] == 1
+    return predict_brightest_band(samples[..., 0])
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestInferenceServer:
+    @pytest.mark.parametrize("address, expected", [
+        ('localhost:8500', ('localhost', 8500, None)),
+        (':8500', ('localhost', 8500, None)),
+        ('/tmp/beetles.sock', (None, None, '/tmp/beetles.sock'))])
+    def test_if_parses_address(self, address, expected):
+        assert parse_address(address) == expected
+
+    @pytest.mark.parametrize("shape", [(4, 7), (4, 7, 1)])
+    def test_if_reshapes_spectra_to_samples(self, shape):
+        array = np.random.rand(*shape)
+        samples = to_samples(array)
+        assert samples.shape == (4, 7, 1)
+        np.testing.assert_array_equal(samples.ravel(), array.ravel())
+
+    @pytest.mark.parametrize("shape", [(4,), (4, 7, 2), (4, 7, 1, 1)])
+    def test_if_rejects_other_shapes(self, shape):
+        with pytest.raises(ValueError):
+            to_samples(np.random.rand(*shape))
+
+    @pytest.mark.parametrize("max_batch_size", [1, 16, 1000])
+    def test_if_coalesces_requests(self, max_batch_size):
+        requests = [np.random.rand(size, 5) for size in
+                    [3, 1, 7, 2, 30, 4, 4, 1]]
+        batch_sizes = []
+
+        def predict(samples: np.ndarray):
+            batch_sizes.append(len(samples))
+            return predict_brightest_band(samples)
+
+        async def submit_all():
+            batcher = MicroBatcher(predict, max_batch_size, max_wait=0.05)
+            task = asyncio.ensure_future(batcher.run())
+            outputs = await asyncio.gather(*[batcher.submit(samples)
+                                             for samples in requests])
+            task.cancel()
+            batcher.close()
+            return outputs
+
+        outputs = run(submit_all())
+        for samples, (classes, probabilities) in zip(requests, outputs):
+            np.testing.assert_array_equal(classes, np.argmax(samples, -1))
+            np.testing.assert_array_equal(probabilities,
+                                          np.amax(samples, -1))
+        assert sum(batch_sizes) == sum(map(len, requests))
+        assert all(size <= max_batch_size or size in map(len, requests)
+                   for size in batch_sizes)
+        if max_batch_size == 1000:
+            assert len(batch_sizes) == 1
+
+    def test_if_serves_models_over_socket(self, tmpdir):
+        address = os.path.join(str(tmpdir), 'server.sock')
+        samples = np.random.rand(100, 8).astype(np.float32)
+
+        async def serve_and_request():
+            server = InferenceServer({
+                'brightest': MicroBatcher(predict_model_2d_samples, 64),
+                'darkest': MicroBatcher(
+                    lambda data: predict_model_2d_samples(-data), 64)})
+            await server.start(address)
+            client = await InferenceClient.connect(address)
+            try:
+                brightest = await client.predict(samples[:10], 'brightest')
+                darkest = await client.predict(
+                    np.expand_dims(samples[:10], -1), 'darkest')
+                with pytest.raises(RuntimeError):
+                    await client.predict(samples[:10], 'missing')
+                stats = await generate_load(address, samples, 50, 4, 5,
+                                            'brightest')
+            finally:
+                client.close()
+                await server.stop()
+            return brightest, darkest, stats
+
+        brightest, darkest, stats = run(serve_and_request())
+        np.testing.assert_array_equal(brightest[0],
+                                      np.argmax(samples[:10], -1))
+        np.testing.assert_array_equal(darkest[0],
+                                      np.argmin(samples[:10], -1))
+        assert stats['requests_per_second'] > 0
+        assert stats['latency_p50_ms'] <= stats['latency_p99_ms']
@@ -3,6 +3,7 @@ from typing import Dict
 
 import numpy as np
 import pytest
+import tensorflow as tf
 
 from ml_intuition.data import noise
 
@@ -10,11 +11,11 @@ from ml_intuition.data import noise
 class TestGaussianNoise:
     @pytest.mark.parametrize("data, params",
                              [
-                                 (np.random.rand(100, 20, 1), {
+                                 (np.random.rand(100, 20, 1).astype(np.float32), {
                                   "mean": 0, "std": 1, "pa": 0.1, "pb": 0.5, "bc": True}),
-                                 (np.random.rand(250, 104, 1), {
+                                 (np.random.rand(250, 104, 1).astype(np.float32), {
                                   "mean": 5, "std": 10, "pa": 0.4, "pb": 0.9, "bc": False}),
-                                 (np.random.rand(99, 1000), {
+                                 (np.random.rand(99, 1000).astype(np.float32), {
                                      "mean": 5, "std": 10, "pa": 0.96, "pb": 0.5, "bc": True})
                              ])
     def test_gaussian_noise_injection(self, data: np.ndarray, params: Dict):
@@ -35,11 +36,11 @@ class TestGaussianNoise:
 
     @pytest.mark.parametrize("data, params",
                              [
-                                 (np.random.rand(100, 20, 1), {
+                                 (np.random.rand(100, 20, 1).astype(np.float32), {
                                   "mean": 0, "std": 1, "pa": 1, "pb": 1, "bc": True}),
-                                 (np.random.rand(160, 1, 4, 2, 1), {
+                                 (np.random.rand(160, 1, 4, 2, 1).astype(np.float32), {
                                   "mean": 5, "std": 10, "pa": 1, "pb": 1, "bc": False}),
-                                 (np.random.rand(50, 1000), {
+                                 (np.random.rand(50, 1000).astype(np.float32), {
                                      "mean": 5, "std": 10, "pa": 1, "pb": 1, "bc": True})
                              ])
     def test_if_all_noise_injected(self, data: np.ndarray, params: Dict):
@@ -50,11 +51,11 @@ class TestGaussianNoise:
 
     @pytest.mark.parametrize("data, params",
                              [
-                                 (np.random.rand(20, 20, 1), {
+                                 (np.random.rand(20, 20, 1).astype(np.float32), {
                                   "mean": 0, "std": 1, "pa": 0, "pb": 0, "bc": True}),
-                                 (np.random.rand(76, 104), {
+                                 (np.random.rand(76, 104).astype(np.float32), {
                                   "mean": 5, "std": 10, "pa": 0, "pb": 0.1, "bc": False}),
-                                 (np.random.rand(34, 1000), {
+                                 (np.random.rand(34, 1000).astype(np.float32), {
                                      "mean": 5, "std": 10, "pa": 0, "pb": 0.5, "bc": True})
                              ])
     def test_if_no_noise_injected(self, data: np.ndarray, params: Dict):
@@ -64,6 +65,19 @@ class TestGaussianNoise:
             'Assert no element is augmented with noise (\"pa\" == 0)'
 
 
+    def test_if_bands_are_drawn_for_each_sample(self):
+        data = np.zeros((2000, 10))
+        gaussian_noise = noise.Gaussian({"mean": 5, "std": 1, "pa": 0.5,
+                                         "pb": 0.3, "bc": False})
+        data_prime, _ = gaussian_noise(data, None)
+        is_affected = data_prime != 0
+        affected_rows = is_affected[is_affected.any(axis=1)]
+        assert len(affected_rows) == 1000
+        assert (affected_rows.sum(axis=1) == 3).all()
+        assert len(np.unique(affected_rows, axis=0)) > 1
+        np.testing.assert_allclose(affected_rows.mean(axis=0), 0.3, atol=0.06)
+
+
 class TestImpulsiveNoise:
     @pytest.mark.parametrize("data, params",
                              [
@@ -114,11 +128,11 @@ class TestImpulsiveNoise:
 class TestShotNoise:
     @pytest.mark.parametrize("data, params",
                              [
-                                 (np.random.rand(19, 100, 1),
+                                 (np.random.rand(19, 100, 1).astype(np.float32),
                                   {"pa": 0.2, "pb": 0.1, "bc": True}),
-                                 (np.random.rand(50, 20),
+                                 (np.random.rand(50, 20).astype(np.float32),
                                   {"pa": 0.5, "pb": 0.5, "bc": False}),
-                                 (np.random.rand(30, 20, 1),
+                                 (np.random.rand(30, 20, 1).astype(np.float32),
                                   {"pa": 0.8, "pb": 0.5, "bc": True})
                              ])
     def test_shot_nosie_injection(self, data: np.ndarray, params: Dict):
@@ -132,11 +146,11 @@ class TestShotNoise:
 
     @pytest.mark.parametrize("data, params",
                              [
-                                 (np.random.rand(20, 20, 1),
+                                 (np.random.rand(20, 20, 1).astype(np.float32),
                                   {"pa": 0, "pb": 0.5, "bc": True}),
-                                 (np.random.rand(76, 20, 1),
+                                 (np.random.rand(76, 20, 1).astype(np.float32),
                                   {"pa": 0, "pb": 0, "bc": False}),
-                                 (np.random.rand(34, 1000, 1),
+                                 (np.random.rand(34, 1000, 1).astype(np.float32),
                                   {"pa": 0, "pb": 0.5, "bc": True})
                              ])
     def test_if_no_noise_injected(self, data: np.ndarray, params: Dict):
@@ -144,3 +158,90 @@ class TestShotNoise:
         data_prime, _ = shot_noise(data, None)
         assert (data == data_prime).all(), \
             'Assert no element is augmented with noise (\"pa\" == 0)'
+
+    @pytest.mark.parametrize("inplace", [False, True])
+    def test_if_only_affected_cells_change(self, inplace):
+        data = np.random.rand(200, 50, 1).astype(np.float32) * 10 - 1
+        original = data.copy()
+        shot_noise = noise.Shot({"pa": 0.1, "pb": 0.2, "bc": False,
+                                 "inplace": inplace})
+        data_prime, _ = shot_noise(data, None)
+        assert data_prime.dtype == np.float32
+        assert (data_prime is data) == inplace
+        is_affected = (data_prime != original).any(axis=-1)
+        assert is_affected.sum() <= 20 * 10
+        assert (data_prime[~is_affected] == original[~is_affected]).all()
+        assert (data_prime[is_affected] >= 0).all()
+
+
+class TestNoiseStage:
+    PARAMS = '{"mean": 0, "std": 1, "pa": 0.5, "pb": 0.5}'
+
+    def get_batches(self, seed: int, n_batches: int) -> np.ndarray:
+        data = np.random.RandomState(0).rand(8, 20, 1).astype(np.float32)
+        labels = np.arange(8)
+        stage = noise.get_noise_stage(
+            noise.get_noise_functions(['gaussian'], self.PARAMS), seed)
+        with tf.Graph().as_default(), tf.Session() as session:
+            dataset = tf.data.Dataset.from_tensor_slices((data, labels)) \
+                .batch(4).repeat().apply(stage)
+            next_batch = dataset.make_one_shot_iterator().get_next()
+            return np.stack([session.run(next_batch)[0]
+                             for _ in range(n_batches)])
+
+    def test_if_noise_is_reproducible_and_fresh_each_epoch(self):
+        batches = self.get_batches(seed=3, n_batches=4)
+        np.testing.assert_array_equal(batches,
+                                      self.get_batches(seed=3, n_batches=4))
+        assert batches.dtype == np.float32
+        assert not np.array_equal(batches[:2], batches[2:]), \
+            'Each epoch should see different noise.'
+        assert not np.array_equal(batches,
+                                  self.get_batches(seed=4, n_batches=4))
+
+    def test_if_stage_matches_batch_injection(self):
+        batches = self.get_batches(seed=1, n_batches=2)
+        data = np.random.RandomState(0).rand(8, 20, 1).astype(np.float32)
+        noise_functions = noise.get_noise_functions(['gaussian'],
+                                                    self.PARAMS)
+        for batch_index, batch in enumerate(batches):
+            np.testing.assert_array_equal(
+                batch, noise.inject_batch_noise(
+                    noise_functions,
+                    data[batch_index * 4:(batch_index + 1) * 4],
+                    [1, batch_index]))
+
+    def test_if_batches_keep_set_level_impulsive_noise(self):
+        data = np.random.RandomState(0).rand(4000, 20, 1) / 2 + 0.25
+        noise_functions = noise.get_noise_functions(
+            ['impulsive'], '{"pa": 0.15, "pb": 0.5, "pw": 0.5, "bc": true}')
+        noisy_data = np.concatenate([
+            noise.inject_batch_noise(noise_functions,
+                                     data[start:start + 4].copy(),
+                                     [0, start], (0., 1.))
+            for start in range(0, len(data), 4)])
+        corrupted = noise.get_corrupted_samples(data, noisy_data)
+        assert abs(len(corrupted) / len(data) - 0.15) < 0.01
+        changed = noisy_data != data
+        assert set(np.unique(noisy_data[changed])) == {0., 1.}
+
+
+class TestNoiseSweep:
+    def test_if_grid_spans_list_params(self):
+        grid = noise.get_noise_params_grid(
+            '{"mean": 0, "std": [1, 2], "pa": [0.1, 0.2, 0.3], "pb": 0.5}')
+        assert len(grid) == 6
+        assert all(params['mean'] == 0 and params['pb'] == 0.5
+                   for params in grid)
+        assert {(params['std'], params['pa']) for params in grid} == \
+               {(std, pa) for std in [1, 2] for pa in [0.1, 0.2, 0.3]}
+
+    def test_if_finds_only_corrupted_samples(self):
+        data = np.random.rand(100, 20, 1).astype(np.float32)
+        noisy_data, _ = noise.Gaussian(
+            {"mean": 0, "std": 1, "pa": 0.1, "pb": 0.5, "bc": False})(
+            data.copy(), None)
+        corrupted = noise.get_corrupted_samples(data, noisy_data)
+        assert len(corrupted) == 10
+        clean = np.setdiff1d(np.arange(100), corrupted)
+        np.testing.assert_array_equal(data[clean], noisy_data[clean])
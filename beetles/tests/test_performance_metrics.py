@@ -3,7 +3,8 @@ import pytest
 from sklearn import metrics
 
 from ml_intuition.evaluation.performance_metrics import (
-    compute_metrics, mean_per_class_accuracy)
+    ConfusionMatrix, compute_metrics, get_fair_model_metrics,
+    get_matrix_metrics, get_model_metrics, mean_per_class_accuracy)
 
 
 class TestPerformanceMetrics:
@@ -55,3 +56,47 @@ class TestPerformanceMetrics:
         assert np.mean(per_class_acc) == \
             result[metrics.balanced_accuracy_score.__name__][0], \
             'The average accuracy should be correct.'
+
+    @pytest.mark.parametrize(
+        'n_samples, n_classes, batch_size',
+        [
+            (100, 5, 7),
+            (1000, 16, 1000),
+            (50, 10, 3)
+        ])
+    def test_if_matrix_metrics_match_sklearn(self, n_samples, n_classes,
+                                             batch_size):
+        y_true = np.random.randint(0, n_classes, n_samples)
+        y_pred = np.where(np.random.rand(n_samples) < 0.7, y_true,
+                          np.random.randint(0, n_classes - 2, n_samples))
+        conf_matrix = ConfusionMatrix(n_classes)
+        for start in range(0, n_samples, batch_size):
+            conf_matrix.update(y_true[start:start + batch_size],
+                               y_pred[start:start + batch_size])
+        np.testing.assert_array_equal(
+            conf_matrix.matrix, metrics.confusion_matrix(
+                y_true, y_pred, labels=np.arange(n_classes)))
+        expected = get_model_metrics(y_true, y_pred)
+        result = get_matrix_metrics(conf_matrix.matrix)
+        assert list(result.keys()) == list(expected.keys())
+        for key, value in expected.items():
+            np.testing.assert_allclose(result[key], value)
+
+    def test_if_fair_metrics_discard_classes_not_in_train(self):
+        n_classes = 8
+        labels_in_train = np.array([0, 2, 3, 5, 6])
+        y_true = np.random.randint(0, n_classes, 500)
+        y_pred = np.where(np.random.rand(500) < 0.6, y_true,
+                          np.random.randint(0, n_classes, 500))
+        conf_matrix = ConfusionMatrix(n_classes)
+        conf_matrix.update(y_true, y_pred)
+        in_train = np.isin(y_true, labels_in_train) & \
+            np.isin(y_pred, labels_in_train)
+        expected = get_model_metrics(
+            y_true[in_train], y_pred[in_train],
+            [metrics.accuracy_score, metrics.balanced_accuracy_score,
+             metrics.cohen_kappa_score])
+        result = get_fair_model_metrics(conf_matrix.matrix, labels_in_train)
+        assert list(result.keys()) == list(expected.keys())
+        for key, value in expected.items():
+            np.testing.assert_allclose(result[key], value)
@@ -0,0 +1,65 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+import tifffile
+
+from ml_intuition.data import transforms
+from ml_intuition.evaluation import scene_inference
+
+
+def predict_brightest_band(samples: np.ndarray):
+    samples = samples.reshape(len(samples), -1)
+    return np.argmax(samples, axis=-1), np.amax(samples, axis=-1)
+
+
+class TestSceneInference:
+    @pytest.mark.parametrize("channels_idx, tile_size", [
+        (0, 1), (0, 25), (-1, 40), (2, 10000)])
+    def test_if_tiles_cover_scene(self, channels_idx, tile_size):
+        cube = np.random.rand(6, 9, 7)
+        tiles = list(scene_inference.iterate_row_tiles(cube, channels_idx,
+                                                       tile_size))
+        samples = np.concatenate([tile for _, tile in tiles])
+        height, width = scene_inference.get_scene_shape(cube.shape,
+                                                        channels_idx)
+        expected = np.moveaxis(cube, channels_idx, -1).reshape(
+            height * width, -1, 1)
+        np.testing.assert_array_equal(samples, expected)
+        assert all(len(tile) <= max(tile_size, width) for _, tile in tiles)
+
+    @pytest.mark.parametrize("extension", ['npy', 'tiff'])
+    def test_if_writes_maps_tile_by_tile(self, tmpdir, extension):
+        path = os.path.join(str(tmpdir), 'cube.h5')
+        cube = np.random.rand(5, 23, 11).astype(np.float32)
+        cube[:, 3, 4] = np.nan
+        with h5py.File(path, 'w') as file:
+            file.create_dataset('cube', data=cube)
+        shape = (23, 11)
+        class_map = scene_inference.create_map(
+            os.path.join(str(tmpdir), 'class_map.' + extension), shape,
+            np.uint8)
+        probability_map = scene_inference.create_map(
+            os.path.join(str(tmpdir), 'probability_map.' + extension), shape,
+            np.float32)
+        normalization = [transforms.SpectralTransform(),
+                         transforms.MinMaxNormalize(0., 2.)]
+        with h5py.File(path, 'r') as file:
+            scene_inference.classify_scene(
+                file['cube'], predict_brightest_band, normalization,
+                class_map, probability_map, tile_size=30, nodata_label=255)
+        class_map.flush()
+        probability_map.flush()
+        del class_map, probability_map
+        load = np.load if extension == 'npy' else tifffile.imread
+        class_map = load(os.path.join(str(tmpdir), 'class_map.' + extension))
+        probability_map = load(
+            os.path.join(str(tmpdir), 'probability_map.' + extension))
+        expected_classes = np.argmax(np.nan_to_num(cube, nan=-1), axis=0)
+        expected_classes[3, 4] = 255
+        np.testing.assert_array_equal(class_map, expected_classes)
+        expected_probabilities = np.amax(np.nan_to_num(cube), axis=0) / 2
+        expected_probabilities[3, 4] = 0
+        np.testing.assert_allclose(probability_map, expected_probabilities,
+                                   rtol=1e-6)
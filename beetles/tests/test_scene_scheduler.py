@@ -0,0 +1,89 @@
+import json
+import os
+
+import h5py
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from ml_intuition import enums
+from ml_intuition.data import transforms
+from ml_intuition.evaluation import scene_inference
+from ml_intuition.evaluation.scene_scheduler import SceneScheduler
+
+N_BANDS, N_CLASSES = 6, 4
+
+
+def save_graph(dest_path: str, weights: np.ndarray):
+    graph = tf.Graph()
+    with graph.as_default():
+        inputs = tf.placeholder(tf.float32, (None, N_BANDS, 1, 1),
+                                name='input')
+        tf.nn.softmax(tf.matmul(tf.reshape(inputs, (-1, N_BANDS)),
+                                tf.constant(weights)), name='output')
+    tf.train.write_graph(graph.as_graph_def(), dest_path, 'graph.pb',
+                         as_text=False)
+    with open(os.path.join(dest_path, 'node_names.json'), 'w') as file:
+        json.dump({enums.NodeNames.INPUT: 'input',
+                   enums.NodeNames.OUTPUT: 'output'}, file)
+
+
+class TestSceneScheduler:
+    weights = np.random.rand(N_BANDS, N_CLASSES).astype(np.float32)
+
+    @pytest.mark.parametrize("n_workers, map_format", [(1, 'npy'),
+                                                       (2, 'tiff')])
+    def test_if_classifies_all_scenes(self, tmpdir, n_workers, map_format):
+        tmpdir = str(tmpdir)
+        save_graph(tmpdir, self.weights)
+        cubes = [np.random.rand(N_BANDS, 13, 7).astype(np.float32),
+                 np.random.rand(N_BANDS, 3, 20).astype(np.float32),
+                 np.random.rand(N_BANDS, 9, 9).astype(np.float32)]
+        cubes[0][:, 2, 5] = np.nan
+        data_file_paths = []
+        for index, cube in enumerate(cubes[:2]):
+            data_file_paths.append(os.path.join(tmpdir,
+                                                '{}.npy'.format(index)))
+            np.save(data_file_paths[-1], cube)
+        data_file_paths.append(os.path.join(tmpdir, '2.h5'))
+        with h5py.File(data_file_paths[-1], 'w') as file:
+            file.create_dataset(enums.SatelliteH5Keys.CUBE, data=cubes[2])
+        dest_paths = [os.path.join(tmpdir, 'maps', str(index))
+                      for index in range(len(cubes))]
+        normalization = [transforms.SpectralTransform(),
+                         transforms.MinMaxNormalize(0., 2.)]
+        with SceneScheduler(
+                graph_path=os.path.join(tmpdir, 'graph.pb'),
+                node_names_path=os.path.join(tmpdir, 'node_names.json'),
+                transformations=normalization, n_workers=n_workers,
+                probability_map=True, tile_size=20, nodata_label=255,
+                verbose=False) as scheduler:
+            stats = scheduler.classify(data_file_paths, dest_paths,
+                                       map_format)
+        assert stats['n_pixels'] == 13 * 7 + 3 * 20 + 9 * 9
+        assert stats['n_workers'] == n_workers
+        for cube, dest_path in zip(cubes, dest_paths):
+            class_map = scene_inference.open_map(os.path.join(
+                dest_path, '{}.{}'.format(enums.Experiment.CLASS_MAP,
+                                          map_format)))
+            probability_map = scene_inference.open_map(os.path.join(
+                dest_path, '{}.{}'.format(enums.Experiment.PROBABILITY_MAP,
+                                          map_format)))
+            scores = np.moveaxis(np.nan_to_num(cube), 0, -1) / 2 \
+                @ self.weights
+            scores = np.exp(scores) / np.exp(scores).sum(-1, keepdims=True)
+            expected_classes = np.argmax(scores, axis=-1)
+            expected_probabilities = np.amax(scores, axis=-1)
+            is_nodata = np.isnan(cube).any(axis=0)
+            expected_classes[is_nodata] = 255
+            expected_probabilities[is_nodata] = 0
+            np.testing.assert_array_equal(class_map, expected_classes)
+            np.testing.assert_allclose(probability_map,
+                                       expected_probabilities, rtol=1e-5)
+
+    def test_if_raises_when_worker_fails(self, tmpdir):
+        with pytest.raises(RuntimeError):
+            SceneScheduler(graph_path=os.path.join(str(tmpdir), 'graph.pb'),
+                           node_names_path=os.path.join(str(tmpdir),
+                                                        'node_names.json'),
+                           n_workers=1, verbose=False)
@@ -52,3 +52,46 @@ class TestMinMaxNormalize:
             np.amin(sample), np.amax(sample))(sample, label)
         assert np.amax(tr_sample) == 1
         assert np.amin(tr_sample) == 0
+
+
+class TestFusedTransform:
+    @pytest.mark.parametrize("inplace, chunk_size", [(False, 7),
+                                                     (True, 7),
+                                                     (False, 1000)])
+    def test_if_matches_sequential_transformations(self, inplace, chunk_size):
+        sample = np.random.rand(100, 20).astype(np.float32) * 50 - 10
+        label = np.random.randint(0, 4, 100)
+        transformations = [
+            transforms.SpectralTransform(),
+            transforms.OneHotEncode(n_classes=4),
+            transforms.MinMaxNormalize(np.float32(sample.min()),
+                                       np.float32(sample.max()))]
+        expected = transforms.apply_transformations(
+            {'data': sample.copy(), 'labels': label}, transformations)
+        compiled = transforms.compile_transformations(
+            transformations, inplace=inplace, chunk_size=chunk_size)
+        assert len(compiled) == 1
+        result = transforms.apply_transformations(
+            {'data': sample, 'labels': label}, compiled)
+        assert result['data'].dtype == np.float32
+        np.testing.assert_array_equal(result['data'], expected['data'])
+        np.testing.assert_array_equal(result['labels'], expected['labels'])
+        assert np.shares_memory(result['data'], sample) == inplace
+
+    def test_if_writes_to_preallocated_output(self):
+        sample = np.arange(30, dtype=np.uint16).reshape((10, 3))
+        out = np.empty((10, 3, 1), dtype=np.float32)
+        fused = transforms.FusedTransform(
+            [transforms.SpectralTransform(),
+             transforms.MinMaxNormalize(0, 29)], chunk_size=4)
+        tr_sample, _ = fused(sample, None, out=out)
+        assert np.shares_memory(tr_sample, out)
+        np.testing.assert_allclose(out[..., 0], sample / 29, rtol=1e-6)
+
+    def test_if_keeps_unfusable_transformations(self):
+        noise = object()
+        compiled = transforms.compile_transformations(
+            [transforms.SpectralTransform(), transforms.MinMaxNormalize(0, 1),
+             noise])
+        assert isinstance(compiled[0], transforms.FusedTransform)
+        assert compiled[1] is noise